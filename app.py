@@ -1,20 +1,59 @@
 import os
+import time
 import uuid
-import joblib
-import pandas as pd
-import numpy as np
 import math
-from datetime import datetime
-from flask import Flask, render_template, request, session, redirect, url_for, flash
-from pymongo import MongoClient
+from datetime import datetime, timedelta
+from flask import (
+    Flask,
+    Response,
+    abort,
+    before_render_template,
+    flash,
+    g,
+    jsonify,
+    make_response,
+    redirect,
+    render_template,
+    request,
+    session,
+    stream_with_context,
+    template_rendered,
+    url_for,
+)
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
 from dotenv import load_dotenv
 
+from core import drift, export, metrics
+from core.customer_context import (
+    TTL_SECONDS as CONTEXT_TTL_SECONDS,
+    invalidate,
+    load_context,
+)
+from core.db import (
+    customers_col,
+    events_col,
+    lrfms_col,
+    products_col,
+    tiers_col,
+    transition_col as transitions_col,
+)
+from core.event_buckets import purchase_summary
+from core.event_ingest import insert_event
+from core.explain_service import explain
+from core.feature_store import get_feature_store
+from core.fragments import bump, etag, fragments, version
+from core.lookalike import get_lookalike_search
+from core.product_search import get_product_search
+from core.tier_flows import flow_matrix, move_customer, tier_population, weekly
+from core.tier_model import load_tier_model
+
 # Import recompute logic
 try:
     from core.recompute_mongo import recompute_customer
 except ImportError:
 
-    def recompute_customer(user_id):
+    def recompute_customer(user_id, context=None):
         pass
 
 
@@ -23,29 +62,111 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = "change_this_to_a_random_secret_key"
 
+
 # =========================================================
 # 1. DATABASE & MODEL
 # =========================================================
-try:
-    client = MongoClient(os.environ["MONGO_URI"])
-    db = client["segment_compass"]
-    customers_col = db["customers"]
-    products_col = db["products"]
-    events_col = db["events"]
-    tiers_col = db["tiers"]
-    lrfms_col = db["lrfms"]
-    transitions_col = db["transitions"]
-except Exception as e:
-    print(f"❌ Database connection failed: {e}")
+# Collections come from core.db and connect lazily in each (forked) process;
+# the model is loaded on first use (or pre-fork, see gunicorn.conf.py).
+def tier_model():
+    """The serving model, or None when it cannot be loaded."""
+    try:
+        return load_tier_model()
+    except Exception as e:
+        print(f"❌ ML Model unavailable: {e}")
+        return None
 
-try:
-    rf_model = joblib.load("models/rf_model.pkl")
-    print("✅ ML Model loaded successfully")
-except:
-    rf_model = None
 
 FEATURES = ["L", "R", "F", "M", "S"]
 
+# Customers created outside the app (loaders, bench.synth) don't bump the
+# "customers" version; the cached admin picker is re-rendered after this long.
+CUSTOMER_OPTIONS_MAX_AGE = 60
+
+
+# =========================================================
+# FRAGMENTS & REQUEST TIMING
+# =========================================================
+def fragment(key, render, max_age=None):
+    """Cached rendered HTML for `key`; counts hits for Server-Timing."""
+    html, hit = fragments.get_or_render(key, render, max_age)
+    g.fragment_hits = g.get("fragment_hits", 0) + hit
+    g.fragment_misses = g.get("fragment_misses", 0) + (not hit)
+    return Markup(html)
+
+
+def customer_context(customer_id, fresh=False):
+    """
+    The customer's context, loaded once per request (one aggregation).
+    `fresh` bypasses the cross-request cache; recompute_customer bases its
+    tier guards on the context, so it must never get a cached one.
+    """
+    contexts = g.setdefault("customer_contexts", {})
+    # With the cache off, every context in the request is already fresh
+    if customer_id not in contexts or (fresh and CONTEXT_TTL_SECONDS > 0):
+        contexts[customer_id] = load_context(customer_id, ttl=0 if fresh else None)
+    return contexts[customer_id]
+
+
+def _render_customer_options():
+    customers = list(
+        customers_col.find({}, {"_id": 0, "customer_id": 1, "name": 1}).sort(
+            "customer_id", 1
+        )
+    )
+    for c in customers:
+        if not c.get("name"):
+            c["name"] = "Guest"
+    return render_template("fragments/admin_customer_options.html", customers=customers)
+
+
+def _validated(response, tag, last_modified):
+    """Attaches validators; browsers revalidate before reusing the page."""
+    response.set_etag(tag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@before_render_template.connect_via(app)
+def _render_started(sender, template, context, **extra):
+    g.setdefault("render_starts", []).append(time.perf_counter())
+
+
+@template_rendered.connect_via(app)
+def _render_finished(sender, template, context, **extra):
+    starts = g.get("render_starts")
+    if starts:
+        elapsed = time.perf_counter() - starts.pop()
+        if not starts:  # nested renders are already in the outer one
+            g.render_seconds = g.get("render_seconds", 0.0) + elapsed
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_timing(response):
+    if "request_started" not in g:
+        return response
+    total = time.perf_counter() - g.request_started
+    render = g.get("render_seconds", 0.0)
+    endpoint = request.endpoint or "unknown"
+    metrics.observe(f"request.{endpoint}", total)
+    if render:
+        metrics.observe(f"render.{endpoint}", render)
+    timing = [f"total;dur={total * 1000:.1f}", f"render;dur={render * 1000:.1f}"]
+    if "fragment_hits" in g:
+        timing.append(
+            f'fragments;desc="{g.fragment_hits} hit {g.fragment_misses} miss"'
+        )
+    response.headers["Server-Timing"] = ", ".join(timing)
+    return response
+
 
 # =========================================================
 # 2. ROUTES
@@ -95,7 +216,7 @@ def customer_dashboard():
     user_id = session.get("user_id")
 
     # 1. Fetch User
-    user = customers_col.find_one({"customer_id": user_id})
+    user = dict(customer_context(user_id).customer or {})
     if not user:
         user = {"customer_id": user_id, "name": "Guest", "tier": "New"}
 
@@ -109,58 +230,134 @@ def customer_dashboard():
     if "tier" not in user:
         user["tier"] = "New"
 
-    cart_count = events_col.count_documents(
-        {"customer_id": user_id, "event_type": "purchase"}
-    )
+    cart = purchase_summary(user_id) or {}
+    cart_count = cart.get("count", 0)
 
-    # 2. Filtering Logic
+    # 2. Filtering & Pagination
     cat_filter = request.args.get("category", "All")
-
-    if cat_filter == "All":
-        all_products = list(products_col.find({}))
-    else:
-        all_products = list(products_col.find({"category": cat_filter}))
-
-    # 3. PAGINATION LOGIC (NEW)
+    query = {} if cat_filter == "All" else {"category": cat_filter}
     page = int(request.args.get("page", 1))
     per_page = 10
-    total_products = len(all_products)
-    total_pages = math.ceil(total_products / per_page)
+    prime = user["tier"] in ("Gold", "Platinum")
+    search_text = request.args.get("q", "").strip()
+
+    # 3. Browser revalidation: same catalog, page and shopper state -> 304
+    catalog_version, catalog_updated = version("catalog")
+    # Search pages are tagged with the version of the index that answers
+    # them, which lags the catalog while a rebuild runs
+    served_version = (
+        get_product_search().served_version() if search_text else catalog_version
+    )
+    if served_version != catalog_version:
+        catalog_updated = None
+    tag = etag(
+        served_version,
+        cat_filter,
+        search_text,
+        page,
+        user_id,
+        user["name"],
+        user["tier"],
+        cart_count,
+    )
+    last_modified = max(
+        filter(None, [catalog_updated, user.get("updated_at"), cart.get("last_time")]),
+        default=None,
+    )
+    revalidate = not session.get("_flashes")  # a flash message is one-off
+    if revalidate and not is_resource_modified(
+        request.environ, etag=tag, last_modified=last_modified
+    ):
+        return _validated(Response(status=304), tag, last_modified)
+
+    # 4. Fragments shared by every shopper on the same catalog/category/page
+    def render_grid():
+        total_products = products_col.count_documents(query)
+        start = (page - 1) * per_page
+        products = (
+            list(products_col.find(query).skip(start).limit(per_page))
+            if start >= 0
+            else []
+        )
+        return render_template(
+            "fragments/shop_products.html",
+            products=products,
+            prime=prime,
+            current_category=cat_filter,
+            current_page=page,
+            total_pages=math.ceil(total_products / per_page),
+            total_products=total_products,
+            per_page=per_page,
+        )
 
-    # Slice the list for the current page
-    start = (page - 1) * per_page
-    end = start + per_page
-    display_products = all_products[start:end]
+    def render_search():
+        products, total_products = get_product_search().search(
+            search_text, cat_filter, page, per_page
+        )
+        return render_template(
+            "fragments/shop_products.html",
+            products=products,
+            prime=prime,
+            current_category=cat_filter,
+            search_text=search_text,
+            current_page=page,
+            total_pages=math.ceil(total_products / per_page),
+            total_products=total_products,
+            per_page=per_page,
+        )
 
-    # 4. Recommendations
-    recs = [p for p in all_products if p.get("segment_target") == user["tier"]][:4]
+    def render_recommendations():
+        recs = list(
+            products_col.find({**query, "segment_target": user["tier"]}).limit(4)
+        )
+        return render_template(
+            "fragments/shop_recommendations.html",
+            recommendations=recs,
+            tier=user["tier"],
+            current_category=cat_filter,
+        )
 
-    # 5. Categories List
-    raw_cats = products_col.distinct("category")
-    categories = ["All"] + sorted([c for c in raw_cats if c])
+    def render_categories():
+        raw_cats = products_col.distinct("category")
+        return render_template(
+            "fragments/shop_categories.html",
+            categories=["All"] + sorted([c for c in raw_cats if c]),
+            current_category=cat_filter,
+        )
 
-    return render_template(
-        "customer_dashboard.html",
-        user=user,
-        display_name=display_name,
-        products=display_products,
-        recommendations=recs,
-        cart_count=cart_count,
-        current_category=cat_filter,
-        categories=categories,
-        # Pagination Data
-        current_page=page,
-        total_pages=total_pages,
-        total_products=total_products,
-        per_page=per_page,
+    response = make_response(
+        render_template(
+            "customer_dashboard.html",
+            user=user,
+            display_name=display_name,
+            cart_count=cart_count,
+            category_nav=fragment(
+                ("shop_categories", catalog_version, cat_filter), render_categories
+            ),
+            recommendations_html=fragment(
+                ("shop_recommendations", catalog_version, cat_filter, user["tier"]),
+                render_recommendations,
+            ),
+            search_text=search_text,
+            # Search pages come from the in-process index and are not cached
+            product_grid=(
+                Markup(render_search())
+                if search_text
+                else fragment(
+                    ("shop_products", catalog_version, cat_filter, page, prime),
+                    render_grid,
+                )
+            ),
+        )
     )
+    return _validated(response, tag, last_modified) if revalidate else response
 
 
 @app.route("/switch_user", methods=["POST"])
 def switch_user():
     try:
         new_id = int(request.form.get("customer_id"))
-        cust = customers_col.find_one({"customer_id": new_id})
+        cust = customer_context(new_id).customer
 
         if cust:
             session["user_id"] = new_id
@@ -181,24 +378,31 @@ def add_to_cart(product_id):
     if session.get("role") != "customer":
         return redirect(url_for("index"))
     user_id = session.get("user_id")
-    user = customers_col.find_one({"customer_id": user_id})
+    ctx = customer_context(user_id)
+    user = ctx.customer
     product = products_col.find_one({"product_id": product_id})
 
     if product:
         current_tier = user.get("tier", "New") if user else "New"
-        events_col.insert_one(
-            {
-                "event_id": str(uuid.uuid4()),
-                "customer_id": user_id,
-                "event_type": "purchase",
-                "product_id": product_id,
-                "event_time": datetime.utcnow(),
-                "price": float(product["price"]),
-                "quantity": 1,
-                "tier_at_event": current_tier,
-            }
-        )
-        recompute_customer(user_id)
+        # main.js adds a fresh eid to each click; a retried request keeps it
+        # and maps to the same event_id, which the unique index rejects
+        eid = request.args.get("eid")
+        event = {
+            "event_id": (
+                str(uuid.uuid5(uuid.NAMESPACE_URL, f"add_to_cart:{user_id}:{eid}"))
+                if eid
+                else str(uuid.uuid4())
+            ),
+            "customer_id": user_id,
+            "event_type": "purchase",
+            "product_id": product_id,
+            "event_time": datetime.utcnow(),
+            "price": float(product["price"]),
+            "quantity": 1,
+            "tier_at_event": current_tier,
+        }
+        if insert_event(event):
+            recompute_customer(user_id, context=customer_context(user_id, fresh=True))
         flash(f"Added {product['product_name']} to cart!")
 
     return redirect(
@@ -211,7 +415,7 @@ def view_cart():
     if session.get("role") != "customer":
         return redirect(url_for("index"))
     user_id = session.get("user_id")
-    user = customers_col.find_one({"customer_id": user_id}) or {"name": "Guest"}
+    user = customer_context(user_id).customer or {"name": "Guest"}
     display_name = str(user.get("name", "Guest")).split()[0]
 
     purchases = list(
@@ -248,34 +452,37 @@ def view_cart():
 
 @app.route("/admin")
 def admin_dashboard():
-    # 1. Fetch & Sanitize List
-    all_cust = list(
-        customers_col.find({}, {"customer_id": 1, "name": 1, "email": 1}).sort(
-            "customer_id", 1
-        )
-    )
-    for c in all_cust:
-        if not c.get("name"):
-            c["name"] = "Guest"
-
+    # 1. Customer picker (cached; add_customer bumps the "customers" version).
+    #    The cached options carry no selection; the template selects sel_id.
     sel_id = request.args.get("customer_id")
-    if not sel_id and all_cust:
-        sel_id = all_cust[0]["customer_id"]
+    if not sel_id:
+        first = customers_col.find_one(
+            {}, {"customer_id": 1}, sort=[("customer_id", 1)]
+        )
+        sel_id = first["customer_id"] if first else None
     if not sel_id:
         return render_template(
-            "admin_dashboard.html", customers=[], cust={"name": "No Data"}, data={}
+            "admin_dashboard.html",
+            customer_options="",
+            cust={"name": "No Data"},
+            data={},
         )
 
     sel_id = int(sel_id)
-    cust = customers_col.find_one({"customer_id": sel_id})
+    customer_options = fragment(
+        ("admin_customer_options", version("customers")[0]),
+        _render_customer_options,
+        max_age=CUSTOMER_OPTIONS_MAX_AGE,
+    )
+    ctx = customer_context(sel_id)
+    cust = dict(ctx.customer or {})
     if not cust:
         cust = {"customer_id": sel_id, "name": "Guest", "email": "N/A"}
     if not cust.get("name"):
         cust["name"] = "Guest"
 
     # 2. Metrics
-    tier_doc = tiers_col.find_one({"customer_id": sel_id})
-    lrfms_doc = lrfms_col.find_one({"customer_id": sel_id}) or {
+    lrfms_doc = dict(ctx.lrfms or {}) or {
         "L": 0,
         "R": 0,
         "F": 0,
@@ -287,10 +494,11 @@ def admin_dashboard():
             lrfms_doc[k] = 0
 
     data = {
-        "tier": tier_doc["tier"] if tier_doc else "New",
+        "tier": ctx.tier,
         "lrfms": lrfms_doc,
         "risk": cust.get("risk_flag", "Unknown"),
         "stability": cust.get("stability_score", 0.0),
+        "cluster": lrfms_doc.get("cluster", cust.get("cluster")),
     }
 
     # 3. PAGINATION LOGIC FOR EVENTS
@@ -316,8 +524,58 @@ def admin_dashboard():
     section = request.args.get("section", "Snapshot")
     sim_res = None
 
+    # Where the customer sits in the population (in-memory feature store)
+    position = None
+    if section == "Snapshot":
+        try:
+            position = get_feature_store().position(sel_id)
+        except Exception as e:
+            print(f"⚠️ Population position unavailable: {e}")
+
+    # Nearest customers on standardized LRFMS, optionally within a tier/cluster
+    lookalikes, la_filters = None, {}
+    if section == "Lookalikes":
+        la_filters = {
+            "tier": request.args.get("la_tier") or None,
+            "cluster": request.args.get("la_cluster", type=int),
+        }
+        try:
+            lookalikes = get_lookalike_search().query(sel_id, k=50, **la_filters)
+        except Exception as e:
+            print(f"⚠️ Lookalike search unavailable: {e}")
+
+    # Population-wide tier flows from the maintained rollups
+    flows, flow_days = None, request.args.get("flow_days", 30, type=int)
+    if section == "Flows":
+        since = datetime.utcnow() - timedelta(days=flow_days) if flow_days else None
+        try:
+            flows = flow_matrix(start=since)
+            flows["weeks"] = weekly(start=since)
+            flows["population"] = tier_population()
+        except Exception as e:
+            print(f"⚠️ Tier flows unavailable: {e}")
+
+    # Feature / confidence drift against the training snapshot
+    drift_report, drift_source = None, request.args.get("drift_source", "live")
+    if section == "Drift":
+        try:
+            drift_report = drift.report(drift_source)
+        except Exception as e:
+            print(f"⚠️ Drift report unavailable: {e}")
+
+    # On-demand SHAP explanation of the current LRFMS vector
+    explanation = None
+    if section == "LRFMS":
+        try:
+            explanation = explain(lrfms_doc)
+        except Exception as e:
+            print(f"⚠️ Explanation unavailable: {e}")
+
     # Simulation Logic
-    if section == "Simulation" and rf_model:
+    rf_model = tier_model() if section == "Simulation" else None
+    if rf_model:
+        import pandas as pd
+
         dF, dM, dR = (
             int(request.args.get("dF", 0)),
             float(request.args.get("dM", 0)),
@@ -333,13 +591,13 @@ def admin_dashboard():
         X = pd.DataFrame([[sim_vals[f] for f in FEATURES]], columns=FEATURES)
         sim_res = {
             "tier": rf_model.predict(X)[0],
-            "conf": round(np.max(rf_model.predict_proba(X)) * 100, 1),
+            "conf": round(float(rf_model.predict_proba(X).max()) * 100, 1),
             "inputs": {"dF": dF, "dM": dM, "dR": dR},
         }
 
     return render_template(
         "admin_dashboard.html",
-        customers=all_cust,
+        customer_options=customer_options,
         current_id=sel_id,
         cust=cust,
         data=data,
@@ -347,6 +605,14 @@ def admin_dashboard():
         transitions=transitions,
         section=section,
         sim_result=sim_res,
+        explanation=explanation,
+        position=position,
+        lookalikes=lookalikes,
+        la_filters=la_filters,
+        flows=flows,
+        flow_days=flow_days,
+        drift=drift_report,
+        drift_source=drift_source,
         # Pagination Data
         current_page=page,
         total_pages=total_pages,
@@ -357,7 +623,7 @@ def admin_dashboard():
 
 @app.route("/admin/recompute/<int:user_id>")
 def force_recompute(user_id):
-    recompute_customer(user_id)
+    recompute_customer(user_id, context=customer_context(user_id, fresh=True))
     flash(f"Metrics recalculated for User {user_id}")
     return redirect(url_for("admin_dashboard", customer_id=user_id, section="LRFMS"))
 
@@ -379,13 +645,55 @@ def add_customer():
             "created_at": datetime.utcnow(),
         }
     )
+    now = datetime.utcnow()
     lrfms_col.insert_one(
-        {"customer_id": new_id, "L": 0, "R": 999, "F": 0, "M": 0, "S": 0.2}
+        {
+            "customer_id": new_id,
+            "L": 0,
+            "R": 999,
+            "F": 0,
+            "M": 0,
+            "S": 0.2,
+            "updated_at": now,
+        }
     )
-    tiers_col.insert_one({"customer_id": new_id, "tier": "New"})
+    tiers_col.insert_one({"customer_id": new_id, "tier": "New", "updated_at": now})
+    move_customer(None, "New", now)
+    bump("customers")
+    invalidate(new_id)
 
     return redirect(url_for("admin_dashboard", customer_id=new_id))
 
 
+@app.route("/admin/export/<fmt>")
+def export_customers(fmt):
+    """Streams the live customers/lrfms/tiers join (csv, ndjson or parquet)."""
+    if session.get("role") != "admin":
+        return redirect(url_for("admin_login"))
+    if fmt not in export.FORMATS:
+        abort(404)
+    tier = request.args.get("tier") or None
+    mimetype = export.FORMATS[fmt][0]
+    return Response(
+        stream_with_context(export.stream(fmt, tier=tier)),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename={export.filename(fmt, tier)}"
+        },
+    )
+
+
+@app.route("/metrics")
+def process_metrics():
+    """Cold-start timings and memory of this worker, plus feature drift (PSI)."""
+    snap = metrics.snapshot()
+    snap["fragments"] = fragments.stats()
+    try:
+        snap["drift_psi"] = drift.summary()
+    except Exception as e:
+        snap["drift_psi"] = f"unavailable: {e}"
+    return jsonify(snap)
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,96 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# =========================================================
+# IMPORT-TIME BUDGET
+# =========================================================
+# Imports each serving module in a fresh interpreter under
+# `python -X importtime` and fails when it is slower than its budget or
+# pulls in a heavy dependency that should only load on the path using it:
+#
+#   python -m bench.import_budget
+#   python -m bench.import_budget --scale 2   # slower machines / CI
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must stay out of plain imports: they come with model
+# loading, training, DataFrame work or SHAP, not with serving a page.
+HEAVY = ("pandas", "sklearn", "joblib", "shap", "scipy", "matplotlib")
+
+# module -> budget in ms (cumulative import time, best of --repeats)
+BUDGETS_MS = {
+    "app": 800,
+    "core.db": 300,
+    "core.recompute_mongo": 400,
+    "core.tier_model": 250,
+    "core.clustering": 250,
+    "core.explain_service": 250,
+    "core.risk_engine": 400,
+}
+
+
+def import_profile(module):
+    """(cumulative ms, imported module names) for importing `module`."""
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT,
+        # Never connect: importing must not need a reachable server
+        "MONGO_URI": "mongodb://127.0.0.1:1",
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    total_us, names = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        names.add(name.strip())
+        if name.strip() == module:
+            total_us = int(cumulative)
+    return total_us / 1000, names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget check")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="multiply every budget"
+    )
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS_MS))
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        runs = [import_profile(module) for _ in range(args.repeats)]
+        ms = min(r[0] for r in runs)
+        heavy = sorted(
+            h for h in HEAVY if any(n == h or n.startswith(h + ".") for n in runs[0][1])
+        )
+        budget = BUDGETS_MS.get(module, 500) * args.scale
+
+        problems = []
+        if ms > budget:
+            problems.append(f"over budget ({budget:.0f} ms)")
+        if heavy:
+            problems.append(f"imports {', '.join(heavy)}")
+        status = "❌" if problems else "✅"
+        print(f"{status} {module}: {ms:.0f} ms {'; '.join(problems)}")
+        if problems:
+            failures.append(module)
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+# =========================================================
+# BENCHMARK HARNESS
+# =========================================================
+# Runs the batch stages against a bench.synth workdir and, when a mongod is
+# reachable, times recompute_customer and the /shop, /cart and /admin routes
+# through Flask's test client. Results land in bench/results/*.json:
+#
+#   python -m bench.run --workdir bench/data/100k --label 100k
+#   python -m bench.run --workdir bench/data/100k --compare bench/results/<old>.json
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "bench", "results")
+
+BATCH_STAGES = [
+    ("lrfms_engine", []),
+    ("decision_engine", []),
+    ("behavior_analyzer", []),
+    ("explainability", []),
+    ("auto_reassign", []),
+]
+
+# Metrics where a larger value is a regression
+COMPARED_METRICS = ("wall_s", "cpu_s", "peak_rss_mb", "p50_ms", "p95_ms")
+
+
+# =========================================================
+# BATCH STAGES
+# =========================================================
+def run_stage(module, args, workdir, log_dir):
+    """Runs one stage in a child process; rusage comes from wait4."""
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+    log_path = os.path.join(log_dir, f"{module}.log")
+    start = time.perf_counter()
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", f"core.{module}", *args],
+            cwd=workdir,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "ok": proc.returncode == 0,
+        "wall_s": time.perf_counter() - start,
+        "cpu_s": usage.ru_utime + usage.ru_stime,
+        "peak_rss_mb": usage.ru_maxrss / 1024,
+        "log": os.path.relpath(log_path, REPO_ROOT),
+    }
+
+
+def bench_batch(workdir, log_dir, stages):
+    results = {}
+    for module, args in BATCH_STAGES:
+        if stages and module not in stages:
+            continue
+        results[module] = run_stage(module, args, workdir, log_dir)
+        r = results[module]
+        status = "✅" if r["ok"] else "❌"
+        print(
+            f"{status} {module}: {r['wall_s']:.1f}s wall, {r['cpu_s']:.1f}s cpu, "
+            f"{r['peak_rss_mb']:.0f} MB peak"
+        )
+        if not r["ok"]:
+            print(f"   see {r['log']}; later stages skipped")
+            break
+    return results
+
+
+# =========================================================
+# MONGO-BACKED PATHS
+# =========================================================
+def latency_stats(samples):
+    ms = np.array(samples) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return latency_stats(samples)
+
+
+def mongo_available(uri):
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    try:
+        MongoClient(uri, serverSelectionTimeoutMS=2000).admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+def bench_mongo(uri, db_name, customers, repeats, seed):
+    os.environ["MONGO_URI"] = uri
+    os.environ["MONGO_DB"] = db_name
+    # The app and core modules resolve models/ and templates/ from the repo
+    os.chdir(REPO_ROOT)
+    sys.path.insert(0, REPO_ROOT)
+
+    start = time.perf_counter()
+    import app as webapp
+    from core.recompute_mongo import recompute_customer
+
+    results = {"import_app_s": time.perf_counter() - start}
+
+    ids = [
+        d["customer_id"]
+        for d in webapp.customers_col.aggregate(
+            [{"$sample": {"size": customers}}, {"$project": {"customer_id": 1}}]
+        )
+    ]
+    if not ids:
+        print(f"⚠️ No customers in {db_name}; run bench.synth with --mongo first")
+        return results
+    rng = np.random.default_rng(seed)
+    pick = lambda: int(rng.choice(ids))  # noqa: E731
+
+    results["recompute_customer"] = timed(lambda: recompute_customer(pick()), repeats)
+
+    client = webapp.app.test_client()
+    categories = webapp.products_col.distinct("category") or ["All"]
+
+    def as_customer():
+        with client.session_transaction() as s:
+            s["role"] = "customer"
+            s["user_id"] = pick()
+
+    def get(path):
+        response = client.get(path)
+        assert response.status_code == 200, f"{path} -> {response.status_code}"
+
+    def shop():
+        as_customer()
+        get(f"/shop?category={rng.choice(categories)}&page=2")
+
+    def cart():
+        as_customer()
+        get("/cart")
+
+    def admin(section):
+        return lambda: get(f"/admin?customer_id={pick()}&section={section}")
+
+    results["route_shop"] = timed(shop, repeats)
+    results["route_cart"] = timed(cart, repeats)
+    for section in ("Snapshot", "Events", "LRFMS", "Journey"):
+        results[f"route_admin_{section.lower()}"] = timed(admin(section), repeats)
+
+    for name, r in results.items():
+        if isinstance(r, dict):
+            print(f"✅ {name}: p50 {r['p50_ms']:.1f} ms, p95 {r['p95_ms']:.1f} ms")
+    return results
+
+
+# =========================================================
+# REPORTING
+# =========================================================
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif key in COMPARED_METRICS:
+            yield f"{prefix}{key}", value
+
+
+def compare(current, baseline_path, threshold):
+    """Prints metric ratios against a previous run; returns regressions."""
+    with open(baseline_path) as fh:
+        baseline = dict(flatten(json.load(fh)["results"]))
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for name, value in flatten(current):
+        old = baseline.get(name)
+        if not old:
+            continue
+        ratio = value / old
+        flag = "  ⚠️ regression" if ratio > threshold else ""
+        print(f"  {name}: {old:.3f} -> {value:.3f} ({ratio:.2f}x){flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Segment Compass benchmarks")
+    parser.add_argument("--workdir", help="bench.synth output for the batch stages")
+    parser.add_argument(
+        "--stages", nargs="*", help="subset of batch stages (default: all)"
+    )
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="segment_compass_bench")
+    parser.add_argument("--skip-mongo", action="store_true")
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=100)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--compare", help="previous results JSON")
+    parser.add_argument("--threshold", type=float, default=1.2)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    log_dir = os.path.join(RESULTS_DIR, "logs", f"{stamp}-{args.label}")
+    os.makedirs(log_dir, exist_ok=True)
+
+    dataset, results = None, {}
+    if args.workdir:
+        workdir = os.path.abspath(args.workdir)
+        manifest = os.path.join(workdir, "synth.json")
+        if os.path.exists(manifest):
+            with open(manifest) as fh:
+                dataset = json.load(fh)
+        results["batch"] = bench_batch(workdir, log_dir, args.stages)
+
+    if args.skip_mongo:
+        pass
+    elif mongo_available(args.uri):
+        results["mongo"] = bench_mongo(
+            args.uri, args.db, args.customers, args.repeats, args.seed
+        )
+    else:
+        print(f"⚠️ No mongod at {args.uri}; Mongo benchmarks skipped")
+
+    report = {
+        "label": args.label,
+        "timestamp": stamp,
+        "git_rev": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "dataset": dataset,
+        "results": results,
+    }
+    out_path = os.path.join(RESULTS_DIR, f"{stamp}-{args.label}.json")
+    with open(out_path, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\n✅ Results written to {os.path.relpath(out_path, REPO_ROOT)}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
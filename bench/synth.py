@@ -0,0 +1,356 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# SYNTHETIC DATA GENERATOR
+# =========================================================
+# Writes a workdir laid out like the repo (data/processed, models) so the
+# batch stages can run against it, and optionally loads the same population
+# into Mongo for the app / recompute benchmarks:
+#
+#   python -m bench.synth --customers 100000 --out bench/data/100k
+#   python -m bench.synth --customers 100000 --out bench/data/100k \
+#       --mongo --db segment_compass_bench --drop
+
+FIRST_CUSTOMER_ID = 100000
+HISTORY_DAYS = 730
+EVENT_WINDOW_DAYS = 60
+
+TIERS = ["Bronze", "Silver", "Gold", "Platinum"]
+CATEGORIES = [
+    "Electronics",
+    "Fashion",
+    "Home",
+    "Kitchen",
+    "Books",
+    "Sports",
+    "Beauty",
+    "Toys",
+    "Grocery",
+    "Garden",
+    "Automotive",
+    "Music",
+]
+ADJECTIVES = [
+    "Classic",
+    "Smart",
+    "Eco",
+    "Ultra",
+    "Compact",
+    "Premium",
+    "Vintage",
+    "Pro",
+]
+NOUNS = ["Lamp", "Watch", "Bottle", "Speaker", "Jacket", "Kettle", "Novel", "Racket"]
+
+
+def make_products(rng, n):
+    ids = [f"P{i:06d}" for i in range(1, n + 1)]
+    return pd.DataFrame(
+        {
+            "product_id": ids,
+            "product_name": [
+                f"{ADJECTIVES[a]} {NOUNS[b]} {i}"
+                for i, a, b in zip(
+                    range(1, n + 1),
+                    rng.integers(0, len(ADJECTIVES), n),
+                    rng.integers(0, len(NOUNS), n),
+                )
+            ],
+            "category": rng.choice(CATEGORIES, n),
+            "price": np.round(rng.lognormal(6.5, 1.0, n), 0),
+            "image_url": [f"https://picsum.photos/seed/{pid}/200" for pid in ids],
+            "segment_target": rng.choice(TIERS, n),
+            "popularity": np.round(rng.random(n) * 5, 2),
+        }
+    )
+
+
+def make_transactions(rng, customer_ids, first_invoice, end):
+    """
+    Online-retail style invoice lines for a block of customers.
+
+    Invoices per customer are heavy tailed, each customer is active over
+    a random span of the history window and invoices carry a few lines.
+    """
+    n = len(customer_ids)
+    invoices_per = 1 + rng.negative_binomial(1, 0.25, n)
+    first = rng.integers(0, HISTORY_DAYS, n)
+    span = (rng.random(n) * (HISTORY_DAYS - first)).astype(int)
+
+    inv_customer = np.repeat(customer_ids, invoices_per)
+    inv_first = np.repeat(first, invoices_per)
+    inv_span = np.repeat(span, invoices_per)
+    n_inv = len(inv_customer)
+    inv_day = inv_first + (rng.random(n_inv) * (inv_span + 1)).astype(int)
+    inv_time = np.datetime64(end - timedelta(days=HISTORY_DAYS), "s") + (
+        inv_day * 86400 + rng.integers(8 * 3600, 20 * 3600, n_inv)
+    ).astype("m8[s]")
+    inv_number = np.arange(first_invoice, first_invoice + n_inv)
+
+    lines = 1 + rng.poisson(2.5, n_inv)
+    n_lines = int(lines.sum())
+    quantity = np.minimum(1 + rng.geometric(0.3, n_lines), 100).astype("int32")
+    price = np.round(rng.lognormal(1.0, 0.8, n_lines), 2)
+
+    df = pd.DataFrame(
+        {
+            "Customer ID": np.repeat(inv_customer, lines).astype("int32"),
+            "Invoice": np.repeat(inv_number, lines).astype(str),
+            "InvoiceDate": np.repeat(inv_time, lines).astype("datetime64[ns]"),
+            "Quantity": quantity,
+            "Price": price,
+        }
+    )
+    df["TotalAmount"] = df["Quantity"] * df["Price"]
+    return df, first_invoice + n_inv
+
+
+def make_events(rng, customer_ids, products, per_customer, end, first_event):
+    counts = rng.poisson(per_customer, len(customer_ids))
+    n = int(counts.sum())
+    picked = rng.integers(0, len(products), n)
+    event_time = np.datetime64(end, "s") - (
+        rng.random(n) * EVENT_WINDOW_DAYS * 86400
+    ).astype("m8[s]")
+    return pd.DataFrame(
+        {
+            "event_id": [f"syn-{i}" for i in range(first_event, first_event + n)],
+            "customer_id": np.repeat(customer_ids, counts).astype("int32"),
+            "event_type": "purchase",
+            "product_id": products["product_id"].to_numpy()[picked],
+            "event_time": event_time.astype("datetime64[ns]"),
+            "price": products["price"].to_numpy()[picked],
+            "quantity": 1,
+            "tier_at_event": rng.choice(TIERS, n),
+        }
+    )
+
+
+def customer_lrfms(transactions, end):
+    """Per-customer LRFMS; S uses fixed normalisers so blocks agree."""
+    g = transactions.groupby("Customer ID").agg(
+        first=("InvoiceDate", "min"),
+        last=("InvoiceDate", "max"),
+        F=("Invoice", "nunique"),
+        M=("TotalAmount", "sum"),
+    )
+    L = (g["last"] - g["first"]).dt.days
+    R = (pd.Timestamp(end) - g["last"]).dt.days
+    S = 0.6 * np.minimum(g["F"] / 50, 1) + 0.4 * (1 - R / HISTORY_DAYS)
+    return pd.DataFrame(
+        {
+            "customer_id": g.index.astype(int),
+            "L": L.to_numpy(),
+            "R": R.to_numpy(),
+            "F": g["F"].to_numpy(),
+            "M": g["M"].round(2).to_numpy(),
+            "S": S.to_numpy(),
+        }
+    )
+
+
+# =========================================================
+# WRITERS
+# =========================================================
+class FrameWriter:
+    """Appends blocks to a CSV or Parquet file without holding them all."""
+
+    def __init__(self, path, fmt):
+        self.path, self.fmt = f"{path}.{fmt}", fmt
+        self._parquet = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def write(self, df):
+        if self.fmt == "csv":
+            df.to_csv(
+                self.path, mode="a", index=False, header=not os.path.exists(self.path)
+            )
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._parquet is None:
+            self._parquet = pq.ParquetWriter(self.path, table.schema)
+        self._parquet.write_table(table)
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+class MongoLoader:
+    def __init__(self, uri, db_name, drop, batch_size=10000):
+        from pymongo import ASCENDING, MongoClient
+
+        self.db = MongoClient(uri)[db_name]
+        self.batch_size = batch_size
+        if drop:
+            for name in (
+                "customers",
+                "products",
+                "events",
+                "lrfms",
+                "tiers",
+                "transitions",
+            ):
+                self.db[name].drop()
+
+        self.db["customers"].create_index("customer_id", unique=True)
+        self.db["lrfms"].create_index("customer_id", unique=True)
+        self.db["tiers"].create_index("customer_id", unique=True)
+        self.db["products"].create_index("product_id", unique=True)
+        self.db["products"].create_index("category")
+        self.db["events"].create_index(
+            [
+                ("customer_id", ASCENDING),
+                ("event_type", ASCENDING),
+                ("event_time", ASCENDING),
+            ]
+        )
+        self.db["transitions"].create_index(
+            [("customer_id", ASCENDING), ("transition_time", ASCENDING)]
+        )
+
+    def insert(self, name, df):
+        records = df.to_dict(orient="records")
+        for start in range(0, len(records), self.batch_size):
+            self.db[name].insert_many(
+                records[start : start + self.batch_size], ordered=False
+            )
+
+
+# =========================================================
+# MAIN
+# =========================================================
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic Segment Compass population"
+    )
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--events-per-customer", type=float, default=0.5)
+    parser.add_argument(
+        "--block-size",
+        type=int,
+        default=100000,
+        help="customers generated per block (bounds memory)",
+    )
+    parser.add_argument("--format", choices=("csv", "parquet"), default="parquet")
+    parser.add_argument("--out", default="bench/data/synthetic")
+    parser.add_argument("--mongo", action="store_true", help="also load into Mongo")
+    parser.add_argument(
+        "--uri", default=os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+    )
+    parser.add_argument("--db", default="segment_compass_bench")
+    parser.add_argument(
+        "--drop", action="store_true", help="drop the target collections first"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    end = datetime.utcnow().replace(microsecond=0)
+    start_time = time.perf_counter()
+
+    processed = os.path.join(args.out, "data", "processed")
+    os.makedirs(processed, exist_ok=True)
+    os.makedirs(os.path.join(args.out, "models"), exist_ok=True)
+
+    products = make_products(rng, args.products)
+    products.to_csv(os.path.join(args.out, "products.csv"), index=False)
+
+    transactions_out = FrameWriter(
+        os.path.join(processed, "transactions_clean"), args.format
+    )
+    # Batch stages read the event log as CSV
+    events_out = FrameWriter(os.path.join(processed, "event_log"), "csv")
+    mongo = MongoLoader(args.uri, args.db, args.drop) if args.mongo else None
+    if mongo:
+        mongo.insert("products", products)
+
+    next_invoice, next_event = 500000, 0
+    totals = {"transactions": 0, "events": 0}
+    for block_start in range(0, args.customers, args.block_size):
+        ids = np.arange(
+            FIRST_CUSTOMER_ID + block_start,
+            FIRST_CUSTOMER_ID + min(block_start + args.block_size, args.customers),
+        )
+        tx, next_invoice = make_transactions(rng, ids, next_invoice, end)
+        events = make_events(
+            rng, ids, products, args.events_per_customer, end, next_event
+        )
+        next_event += len(events)
+
+        transactions_out.write(tx)
+        events_out.write(events)
+        totals["transactions"] += len(tx)
+        totals["events"] += len(events)
+
+        if mongo:
+            lrfms = customer_lrfms(tx, end)
+            score = lrfms["F"] * lrfms["M"]
+            tier = pd.cut(
+                score.rank(pct=True), [0, 0.2, 0.5, 0.8, 1.0], labels=TIERS
+            ).astype(str)
+            mongo.insert(
+                "customers",
+                pd.DataFrame(
+                    {
+                        "customer_id": lrfms["customer_id"],
+                        "name": [f"Customer {i}" for i in lrfms["customer_id"]],
+                        "email": [f"user{i}@example.com" for i in lrfms["customer_id"]],
+                        "tier": tier,
+                        "created_at": end,
+                    }
+                ),
+            )
+            mongo.insert("lrfms", lrfms.assign(updated_at=end))
+            mongo.insert(
+                "tiers",
+                pd.DataFrame({"customer_id": lrfms["customer_id"], "tier": tier}),
+            )
+            mongo.insert(
+                "events",
+                events.assign(
+                    customer_id=events["customer_id"].astype(int),
+                    event_time=events["event_time"].dt.to_pydatetime(),
+                ),
+            )
+
+        print(
+            f"  block {block_start // args.block_size + 1}: {ids[-1] - FIRST_CUSTOMER_ID + 1:,} customers"
+        )
+
+    transactions_out.close()
+    events_out.close()
+
+    manifest = {
+        "customers": args.customers,
+        "products": args.products,
+        "transactions": totals["transactions"],
+        "events": totals["events"],
+        "format": args.format,
+        "seed": args.seed,
+        "mongo_db": args.db if args.mongo else None,
+        "generated_at": end.isoformat(),
+    }
+    with open(os.path.join(args.out, "synth.json"), "w") as fh:
+        json.dump(manifest, fh, indent=2)
+
+    print(
+        f"✅ Synthetic data written to {args.out} in {time.perf_counter() - start_time:.1f}s"
+    )
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
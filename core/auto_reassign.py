@@ -1,7 +1,21 @@
 import pandas as pd
-import joblib
 from datetime import datetime, timedelta
 
+from core.clustering import FEATURES, assign_clusters
+from core.risk_engine import score
+from core.schema import (
+    EVENTS,
+    INTELLIGENCE,
+    LRFMS,
+    TIERS,
+    TRANSITIONS,
+    apply_schema,
+    read_frame,
+    report_memory,
+)
+from core.tier_model import load_tier_model
+from core.tier_policy import BATCH
+
 # =============================
 # PATHS
 # =============================
@@ -12,40 +26,47 @@ INTEL_PATH = "data/processed/customer_intelligence.csv"
 TRANSITION_LOG_PATH = "data/processed/tier_transition_log.csv"
 
 # =============================
-# TIER DEFINITIONS
+# TIER POLICY
 # =============================
-TIER_ORDER = ["New", "Bronze", "Silver", "Gold", "Platinum"]
-TIER_RANK = {tier: idx for idx, tier in enumerate(TIER_ORDER)}
+# Trigger, confidence and guard rules (core/tier_policy.py)
+POLICY = BATCH
 
 # =============================
 # LOAD MODEL
 # =============================
-rf = joblib.load("models/rf_model.pkl")
+rf = load_tier_model()
 
 # =============================
 # LOAD DATA
 # =============================
-events = pd.read_csv(EVENT_LOG_PATH)
-lrfms = pd.read_csv(LRFMS_PATH)
-tiers = pd.read_csv(TIERS_PATH)
-intel = pd.read_csv(INTEL_PATH)
+events = read_frame(EVENT_LOG_PATH, EVENTS)
+# A re-exported or appended log may repeat events; count each event_id once
+events = events[~(events["event_id"].notna() & events.duplicated("event_id"))]
+lrfms = read_frame(LRFMS_PATH, LRFMS)
+tiers = read_frame(TIERS_PATH, TIERS)
+intel = read_frame(INTEL_PATH, INTELLIGENCE)
+report_memory("auto_reassign", events=events, lrfms=lrfms, tiers=tiers, intel=intel)
 
 # =============================
 # LOAD / INIT TRANSITION LOG
 # =============================
 try:
-    transition_log = pd.read_csv(TRANSITION_LOG_PATH)
-    transition_log["transition_time"] = pd.to_datetime(
-        transition_log["transition_time"]
-    )
+    transition_log = read_frame(TRANSITION_LOG_PATH, TRANSITIONS)
 except FileNotFoundError:
-    transition_log = pd.DataFrame(columns=[
-        "customer_id",
-        "old_tier",
-        "new_tier",
-        "trigger_reason",
-        "transition_time"
-    ])
+    transition_log = apply_schema(
+        pd.DataFrame(columns=list(TRANSITIONS)), TRANSITIONS
+    )
+new_transitions = []
+updated_ids = []
+
+
+def last_lock(customer_id):
+    """Time of the customer's last transition that locks downgrades."""
+    rows = transition_log[transition_log["customer_id"] == customer_id]
+    if POLICY.lock_tiers is not None:
+        rows = rows[rows["new_tier"].isin(POLICY.lock_tiers)]
+    return rows["transition_time"].max() if len(rows) else None
+
 
 # =============================
 # FILTER PURCHASE EVENTS
@@ -55,6 +76,9 @@ if purchase_events.empty:
     print("No purchase events found.")
     exit()
 
+# Population max recency for stability scoring
+max_r = float(lrfms["R"].max())
+
 # =============================
 # PROCESS PER CUSTOMER (SINGLE LOOP)
 # =============================
@@ -66,11 +90,7 @@ for customer_id, group in purchase_events.groupby("customer_id"):
     # -------------------------
     # AUTO TRIGGER
     # -------------------------
-    if not (
-        event_count == 1 or
-        event_count % 5 == 0 or
-        monetary_sum >= 10000
-    ):
+    if not POLICY.triggers(event_count, monetary_sum):
         continue
 
     # -------------------------
@@ -86,17 +106,15 @@ for customer_id, group in purchase_events.groupby("customer_id"):
     lrfms.loc[idx, "F"] += event_count
     lrfms.loc[idx, "M"] += monetary_sum
     lrfms.loc[idx, "R"] = 0
+    updated_ids.append(customer_id)
 
     # -------------------------
     # PREDICT TIER + CONFIDENCE
     # -------------------------
     X = lrfms.loc[idx, ["L", "R", "F", "M", "S"]]
-    new_tier = rf.predict(X)[0]
+    predicted = rf.predict(X)[0]
     confidence = rf.predict_proba(X).max()
 
-    if confidence < 0.7:
-        continue
-
     # -------------------------
     # GET OLD TIER
     # -------------------------
@@ -104,54 +122,24 @@ for customer_id, group in purchase_events.groupby("customer_id"):
         tiers["Customer ID"] == customer_id, "tier"
     ].values[0]
 
-    old_rank = TIER_RANK[old_tier]
-    new_rank = TIER_RANK.get(new_tier, old_rank)
-
     # =============================
     # GUARDRAILS
     # =============================
-
-    # Cold start rule
-    if old_tier == "New":
-        new_tier = "Bronze"
-        new_rank = TIER_RANK["Bronze"]
-
-    # Max one-tier jump
-    if new_rank - old_rank > 1:
-        new_tier = TIER_ORDER[old_rank + 1]
-        new_rank = old_rank + 1
-
-    # =============================
-    # CONTROLLED DOWNGRADING LOGIC
-    # =============================
-    if new_rank < old_rank:
-        inactivity = lrfms.loc[idx, "R"].values[0]
-
-        last_upgrade = transition_log[
-            (transition_log["customer_id"] == customer_id) &
-            (transition_log["new_tier"].isin(["Silver", "Gold", "Platinum"]))
-        ]
-
-        downgrade_allowed = (
-            inactivity > 60 and
-            confidence >= 0.7 and
-            (
-                last_upgrade.empty or
-                (datetime.now() - last_upgrade["transition_time"].max()).days > 30
-            )
-        )
-
-        if not downgrade_allowed:
-            continue
-
-        # Allow only one-tier downgrade
-        new_tier = TIER_ORDER[old_rank - 1]
-        new_rank = old_rank - 1
+    # Confidence cutoff, cold start rule, max one-tier jump and controlled
+    # downgrading (inactivity + time since the last upgrade)
+    new_tier = POLICY.decide(
+        old_tier,
+        predicted,
+        confidence,
+        recency=lrfms.loc[idx, "R"].values[0],
+        last_lock=lambda: last_lock(customer_id),
+        now=datetime.now(),
+    )
 
     # -------------------------
     # APPLY TIER UPDATE
     # -------------------------
-    if new_tier == old_tier:
+    if new_tier is None:
         continue
 
     tiers.loc[tiers["Customer ID"] == customer_id, "tier"] = new_tier
@@ -163,30 +151,40 @@ for customer_id, group in purchase_events.groupby("customer_id"):
     if len(intel_idx) > 0:
         intel.loc[intel_idx, "tier"] = new_tier
 
-        if new_tier in ["Gold", "Platinum"]:
-            intel.loc[intel_idx, "risk_flag"] = "Low Risk"
-            intel.loc[intel_idx, "stability_score"] = 0.8
-        elif new_tier == "Silver":
-            intel.loc[intel_idx, "risk_flag"] = "Medium Risk"
-            intel.loc[intel_idx, "stability_score"] = 0.5
-        else:
-            intel.loc[intel_idx, "risk_flag"] = "High Risk"
-            intel.loc[intel_idx, "stability_score"] = 0.3
+        risk = score(lrfms.loc[idx[0]], max_r)
+        intel.loc[intel_idx, "risk_flag"] = risk["risk_flag"]
+        intel.loc[intel_idx, "stability_score"] = risk["stability_score"]
 
     # -------------------------
     # TRANSITION LOG
     # -------------------------
+    new_transitions.append({
+        "customer_id": customer_id,
+        "old_tier": old_tier,
+        "new_tier": new_tier,
+        "trigger_reason": (
+            f"events={event_count}, monetary={monetary_sum}, "
+            f"confidence={confidence:.2f}"
+        ),
+        "transition_time": datetime.now()
+    })
+
+# =============================
+# REFRESH CLUSTERS (UPDATED CUSTOMERS)
+# =============================
+updated = lrfms[lrfms["Customer ID"].isin(updated_ids)]
+labels = assign_clusters(updated[FEATURES].to_numpy()) if len(updated) else None
+if labels is not None:
+    new_cluster = pd.Series(labels, index=updated["Customer ID"].to_numpy())
+    for frame in (tiers, intel):
+        hit = frame["Customer ID"].isin(new_cluster.index)
+        frame.loc[hit, "cluster"] = (
+            frame.loc[hit, "Customer ID"].map(new_cluster).to_numpy()
+        ).astype(frame["cluster"].dtype)
+
+if new_transitions:
     transition_log = pd.concat(
-        [transition_log, pd.DataFrame([{
-            "customer_id": customer_id,
-            "old_tier": old_tier,
-            "new_tier": new_tier,
-            "trigger_reason": (
-                f"events={event_count}, monetary={monetary_sum}, "
-                f"confidence={confidence:.2f}"
-            ),
-            "transition_time": datetime.now()
-        }])],
+        [transition_log, apply_schema(pd.DataFrame(new_transitions), TRANSITIONS)],
         ignore_index=True
     )
 
@@ -199,3 +197,4 @@ intel.to_csv(INTEL_PATH, index=False)
 transition_log.to_csv(TRANSITION_LOG_PATH, index=False)
 
 print("✅ Automatic tier reassignment with controlled downgrading completed.")
+report_memory("auto_reassign")
@@ -1,11 +1,20 @@
 import pandas as pd
 import joblib
-import numpy as np
+
+from core.risk_engine import risk_flags, stability_scores
+from core.schema import (
+    INTELLIGENCE,
+    RISK_DTYPE,
+    TIERS,
+    apply_schema,
+    read_frame,
+    report_memory,
+)
 
 # -----------------------------
 # Load data and trained model
 # -----------------------------
-df = pd.read_csv("data/processed/customer_tiers.csv")
+df = read_frame("data/processed/customer_tiers.csv", TIERS)
 
 # Load trained Random Forest model
 rf = joblib.load("models/rf_model.pkl") if False else None
@@ -14,18 +23,14 @@ rf = joblib.load("models/rf_model.pkl") if False else None
 # -----------------------------
 # Risk & Stability Rules
 # -----------------------------
-df["risk_flag"] = np.where(
-    (df["R"] > 90) | (df["S"] < 0.3),
-    "High Risk",
-    "Low Risk"
-)
+df["risk_flag"] = pd.Categorical(risk_flags(df["R"], df["S"]), dtype=RISK_DTYPE)
 
 # -----------------------------
 # Stability Score
 # -----------------------------
-df["stability_score"] = (
-    1 - (df["R"] / df["R"].max())
-) * df["S"]
+df["stability_score"] = stability_scores(df["R"], df["S"], df["R"].max())
+
+apply_schema(df, INTELLIGENCE)
 
 # -----------------------------
 # Save intelligence-enhanced data
@@ -37,3 +42,4 @@ df.to_csv(
 
 print("✅ Phase 5 completed: Risk & stability analysis added")
 print(df[["Customer ID", "tier", "risk_flag", "stability_score"]].head())
+report_memory("behavior_analyzer", intelligence=df)
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import numpy as np
+from pymongo import UpdateOne
+
+from core.clustering import (
+    FEATURES,
+    GMM_PIPELINE_PATH,
+    assign_clusters,
+    load_cluster_pipeline,
+)
+from core.db import customers_col, lrfms_col
+
+BATCH_SIZE = 5000
+
+
+# =========================================================
+# POPULATION CLUSTER SWEEP
+# =========================================================
+def _flush(docs):
+    """Assigns clusters for one batch and writes back only the changes."""
+    X = np.array([[d.get(f) or 0 for f in FEATURES] for d in docs], dtype=float)
+    labels = assign_clusters(X)
+
+    # updated_at lets the feature store (and lookalikes) pick up the change
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"customer_id": d["customer_id"]},
+            {"$set": {"cluster": int(label), "updated_at": now}},
+        )
+        for d, label in zip(docs, labels)
+        if d.get("cluster") != int(label)
+    ]
+    if ops:
+        lrfms_col.bulk_write(ops, ordered=False)
+        customers_col.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def sweep_clusters(batch_size=BATCH_SIZE):
+    """
+    Streams the `lrfms` collection and refreshes every customer's cluster.
+
+    Returns (scanned, changed).
+    """
+    if load_cluster_pipeline() is None:
+        raise FileNotFoundError(
+            f"{GMM_PIPELINE_PATH} not found; run core.decision_engine first"
+        )
+
+    projection = {"_id": 0, "customer_id": 1, "cluster": 1, **{f: 1 for f in FEATURES}}
+    cursor = lrfms_col.find({}, projection).batch_size(batch_size)
+
+    scanned = changed = 0
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            changed += _flush(batch)
+            scanned += len(batch)
+            batch = []
+    if batch:
+        changed += _flush(batch)
+        scanned += len(batch)
+
+    return scanned, changed
+
+
+if __name__ == "__main__":
+    scanned, changed = sweep_clusters()
+    print(f"✅ Cluster sweep completed: {changed} of {scanned} customers reassigned")
@@ -0,0 +1,124 @@
+import os
+import threading
+
+import numpy as np
+
+# =========================================================
+# CONSTANTS
+# =========================================================
+FEATURES = ["L", "R", "F", "M", "S"]
+GMM_PIPELINE_PATH = "models/gmm_pipeline.pkl"
+
+CRITERIA = ("silhouette", "bic")
+
+
+# =========================================================
+# MODEL SELECTION
+# =========================================================
+def stratified_sample(labels, size, rng):
+    """
+    Row indices sampled proportionally from every cluster.
+
+    Each cluster keeps at least two rows so silhouette stays defined.
+    """
+    n = len(labels)
+    if n <= size:
+        return np.arange(n)
+
+    picked = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        take = max(2, int(round(size * len(members) / n)))
+        picked.append(rng.choice(members, min(take, len(members)), replace=False))
+    return np.concatenate(picked)
+
+
+def sampled_silhouette(X, labels, sample_size=20000, rounds=5, seed=42):
+    """
+    Silhouette estimated on stratified samples.
+
+    Returns (mean, ci_low, ci_high) with a 95% normal interval over the
+    rounds; exact (zero-width) when the data fits in one sample.
+    """
+    from sklearn.metrics import silhouette_score
+
+    if len(np.unique(labels)) < 2:
+        return -1.0, -1.0, -1.0
+    if len(labels) <= sample_size:
+        score = float(silhouette_score(X, labels))
+        return score, score, score
+
+    rng = np.random.default_rng(seed)
+    scores = []
+    for _ in range(rounds):
+        idx = stratified_sample(labels, sample_size, rng)
+        scores.append(silhouette_score(X[idx], labels[idx]))
+
+    mean = float(np.mean(scores))
+    half = 0.0
+    if rounds > 1:
+        half = 1.96 * float(np.std(scores, ddof=1)) / np.sqrt(rounds)
+    return mean, mean - half, mean + half
+
+
+def evaluate_candidate(
+    X, k, criterion="silhouette", sample_size=20000, rounds=5, seed=42
+):
+    """
+    Fits one GMM candidate and scores it (higher is better).
+
+    BIC is negated so both criteria share the same ordering.
+    """
+    from sklearn.mixture import GaussianMixture
+
+    gmm = GaussianMixture(n_components=k, random_state=seed)
+    labels = gmm.fit_predict(X)
+
+    if criterion == "bic":
+        score = -float(gmm.bic(X))
+        ci = (score, score)
+    else:
+        score, low, high = sampled_silhouette(X, labels, sample_size, rounds, seed)
+        ci = (low, high)
+
+    return {"k": k, "model": gmm, "labels": labels, "score": score, "ci": ci}
+
+
+# =========================================================
+# ONLINE ASSIGNMENT
+# =========================================================
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def load_cluster_pipeline():
+    """Persisted scaler+GMM pipeline, loaded once; None if not trained yet."""
+    global _pipeline
+    if _pipeline is None and os.path.exists(GMM_PIPELINE_PATH):
+        with _pipeline_lock:
+            if _pipeline is None:
+                import joblib
+
+                _pipeline = joblib.load(GMM_PIPELINE_PATH)
+    return _pipeline
+
+
+def assign_clusters(X):
+    """
+    Vectorized cluster assignment for an (n, 5) L,R,F,M,S matrix.
+
+    Scaling is applied directly from the fitted scaler's statistics so
+    plain arrays skip DataFrame feature-name checks.
+    """
+    pipeline = load_cluster_pipeline()
+    if pipeline is None:
+        return None
+    scaler, gmm = pipeline.named_steps["scaler"], pipeline.named_steps["gmm"]
+    X = np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURES))
+    return gmm.predict((X - scaler.mean_) / scaler.scale_)
+
+
+def assign_cluster(lrfms):
+    """Cluster of a single LRFMS mapping, or None without a pipeline."""
+    labels = assign_clusters([[lrfms.get(f, 0) for f in FEATURES]])
+    return None if labels is None else int(labels[0])
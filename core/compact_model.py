@@ -0,0 +1,146 @@
+import argparse
+import copy
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+from core.schema import TIERS, read_frame
+from core.tier_model import (
+    FEATURES,
+    RF_MODEL_PATH,
+    SERVING_MODEL_ENV,
+    VARIANTS_DIR,
+    QuantizedLookupClassifier,
+    variant_path,
+)
+
+REPORT_PATH = "data/processed/model_compaction_report.csv"
+
+
+# =========================================================
+# VARIANTS
+# =========================================================
+def retrained(n_estimators, max_depth):
+    def build(reference, X_train, y_train):
+        model = RandomForestClassifier(
+            n_estimators=n_estimators, max_depth=max_depth, random_state=42
+        )
+        return model.fit(X_train, y_train)
+
+    return build
+
+
+def pruned(n_estimators):
+    """Keeps the first trees of the current forest without retraining."""
+
+    def build(reference, X_train, y_train):
+        model = copy.deepcopy(reference)
+        model.estimators_ = model.estimators_[:n_estimators]
+        model.n_estimators = len(model.estimators_)
+        return model
+
+    return build
+
+
+def lookup(n_bins):
+    def build(reference, X_train, y_train):
+        return QuantizedLookupClassifier(n_bins=n_bins).fit(X_train, reference)
+
+    return build
+
+
+VARIANTS = {
+    "rf_pruned_50": pruned(50),
+    "rf_100_d16": retrained(100, 16),
+    "rf_50_d12": retrained(50, 12),
+    "rf_25_d10": retrained(25, 10),
+    "rf_10_d8": retrained(10, 8),
+    "lookup_q10": lookup(10),
+}
+
+
+# =========================================================
+# MEASUREMENTS
+# =========================================================
+def median_seconds(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def measure(name, path, X_test, y_test, reference_pred, repeats):
+    load_s = median_seconds(lambda: joblib.load(path), 3)
+    model = joblib.load(path)
+
+    pred = model.predict(X_test)
+    row = X_test.iloc[[0]]
+    single_s = median_seconds(lambda: model.predict_proba(row), repeats)
+    batch_s = median_seconds(lambda: model.predict_proba(X_test), 5)
+
+    return {
+        "variant": name,
+        "accuracy": float(np.mean(pred == y_test)),
+        "agreement": float(np.mean(pred == reference_pred)),
+        "predict_ms_single": single_s * 1000,
+        "predict_us_per_row_batch": batch_s / len(X_test) * 1e6,
+        "size_mb": os.path.getsize(path) / 1024**2,
+        "load_ms": load_s * 1000,
+        "path": path,
+    }
+
+
+# =========================================================
+# MAIN
+# =========================================================
+def main():
+    parser = argparse.ArgumentParser(
+        description="Train/prune smaller tier models and compare them"
+    )
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS),
+                        default=list(VARIANTS))
+    parser.add_argument("--repeats", type=int, default=200,
+                        help="single-row predictions timed per variant")
+    args = parser.parse_args()
+
+    reference = joblib.load(RF_MODEL_PATH)
+
+    # Same labelled data and split as decision_engine; rows added by hand
+    # with tiers the model never learned (e.g. "New") are left out.
+    df = read_frame("data/processed/customer_tiers.csv", TIERS)
+    df = df[df["tier"].isin(reference.classes_)]
+    X = df[FEATURES]
+    y = df["tier"].astype(str)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+
+    reference_pred = reference.predict(X_test)
+
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    rows = [
+        measure("rf_model", RF_MODEL_PATH, X_test, y_test, reference_pred, args.repeats)
+    ]
+    for name in args.variants:
+        model = VARIANTS[name](reference, X_train, y_train)
+        path = variant_path(name)
+        joblib.dump(model, path)
+        rows.append(measure(name, path, X_test, y_test, reference_pred, args.repeats))
+
+    report = pd.DataFrame(rows)
+    report.to_csv(REPORT_PATH, index=False)
+
+    print("✅ Model compaction report")
+    print(report.drop(columns="path").round(4).to_string(index=False))
+    print(f"\nSelect a variant with {SERVING_MODEL_ENV}=<variant> in .env")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import copy
+import os
+import threading
+import time
+
+from core.db import customers_col, lrfms_col, tiers_col
+
+# =========================================================
+# CUSTOMER CONTEXT
+# =========================================================
+# A customer's `customers`, `tiers` and `lrfms` documents fetched with one
+# aggregation ($lookup on customer_id) instead of three find_one calls.
+# app.py keeps one context per customer per request (flask.g) and hands it
+# to recompute_customer, which reads its inputs from the context and writes
+# its results back into it, so the rest of the request sees fresh state.
+#
+# CUSTOMER_CONTEXT_TTL_SECONDS > 0 also keeps loaded contexts for that long
+# across requests in this worker. Writes through the app and the recompute
+# path invalidate the entry; writes from other workers or batch jobs are
+# only seen once it expires, so keep the TTL short. 0 (default) disables it.
+# Only read-only rendering uses the cache; a context handed to
+# recompute_customer is always loaded fresh (ttl=0), since its tier guards
+# must not act on another worker's stale tier.
+TTL_SECONDS = float(os.environ.get("CUSTOMER_CONTEXT_TTL_SECONDS", 0))
+
+
+class CustomerContext:
+    def __init__(self, customer_id, customer=None, tier_doc=None, lrfms=None):
+        self.customer_id = customer_id
+        self.customer = customer  # customers document or None
+        self.tier_doc = tier_doc  # tiers document or None
+        self.lrfms = lrfms  # lrfms document or None
+
+    @property
+    def tier(self):
+        """Authoritative tier (tiers collection), "New" when unassigned."""
+        return self.tier_doc["tier"] if self.tier_doc else "New"
+
+    def copy(self):
+        return CustomerContext(
+            self.customer_id,
+            copy.deepcopy(self.customer),
+            copy.deepcopy(self.tier_doc),
+            copy.deepcopy(self.lrfms),
+        )
+
+
+def _fetch(customer_id):
+    pipeline = [
+        {"$match": {"customer_id": customer_id}},
+        {"$limit": 1},
+        {
+            "$lookup": {
+                "from": tiers_col.name,
+                "localField": "customer_id",
+                "foreignField": "customer_id",
+                "as": "_tier",
+            }
+        },
+        {
+            "$lookup": {
+                "from": lrfms_col.name,
+                "localField": "customer_id",
+                "foreignField": "customer_id",
+                "as": "_lrfms",
+            }
+        },
+    ]
+    customer = next(iter(customers_col.aggregate(pipeline)), None)
+    if customer is None:
+        # No customers document (e.g. metrics written before sign-up)
+        return CustomerContext(
+            customer_id,
+            None,
+            tiers_col.find_one({"customer_id": customer_id}),
+            lrfms_col.find_one({"customer_id": customer_id}),
+        )
+    tier_docs, lrfms_docs = customer.pop("_tier"), customer.pop("_lrfms")
+    return CustomerContext(
+        customer_id,
+        customer,
+        tier_docs[0] if tier_docs else None,
+        lrfms_docs[0] if lrfms_docs else None,
+    )
+
+
+_cache = {}  # customer_id -> (context, loaded_at)
+_cache_lock = threading.Lock()
+
+
+def load_context(customer_id, ttl=None):
+    """A fresh CustomerContext, from the cross-request cache when enabled."""
+    ttl = TTL_SECONDS if ttl is None else ttl
+    if ttl > 0:
+        with _cache_lock:
+            entry = _cache.get(customer_id)
+        if entry and time.monotonic() - entry[1] < ttl:
+            return entry[0].copy()
+
+    context = _fetch(customer_id)
+    if ttl > 0:
+        with _cache_lock:
+            _cache[customer_id] = (context.copy(), time.monotonic())
+    return context
+
+
+def invalidate(customer_id):
+    """Drops the cached context after a write to this customer."""
+    with _cache_lock:
+        _cache.pop(customer_id, None)
@@ -0,0 +1,81 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+load_dotenv()
+
+# =========================================================
+# MONGO CONNECTION (SHARED BY CORE MODULES)
+# =========================================================
+# The client is created on first use in each process. Importing this module
+# never connects, and a worker forked from a preloaded master (gunicorn
+# --preload) builds its own client instead of inheriting the parent's
+# sockets and monitor threads, which pymongo does not support across fork.
+POOL_OPTIONS = {
+    # env var -> MongoClient keyword
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def client_options():
+    """MongoClient pool keywords set through the environment."""
+    return {
+        keyword: int(os.environ[var])
+        for var, keyword in POOL_OPTIONS.items()
+        if os.environ.get(var)
+    }
+
+
+def get_client():
+    """This process's MongoClient, created lazily (again after a fork)."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = MongoClient(os.environ["MONGO_URI"], **client_options())
+                _client_pid = os.getpid()
+    return _client
+
+
+def get_db():
+    return get_client()[os.environ.get("MONGO_DB", "segment_compass")]
+
+
+class LazyCollection:
+    """Stands in for db[name]; resolves against this process's client."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+events_col = LazyCollection("events")
+lrfms_col = LazyCollection("lrfms")
+tiers_col = LazyCollection("tiers")
+customers_col = LazyCollection("customers")
+products_col = LazyCollection("products")
+transition_col = LazyCollection("transitions")
+# Rollups maintained by core.tier_flows
+transition_daily_col = LazyCollection("transition_daily")
+tier_counts_col = LazyCollection("tier_counts")
+# Per-customer day/month purchase buckets (core.event_buckets)
+event_buckets_col = LazyCollection("event_buckets")
+# Daily feature/confidence drift sketches (core.drift)
+drift_col = LazyCollection("drift_sketches")
+# Dataset versions keying cached fragments (core.fragments)
+versions_col = LazyCollection("versions")
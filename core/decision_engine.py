@@ -1,15 +1,37 @@
+import argparse
+
 import pandas as pd
 import joblib
+from joblib import Parallel, delayed
+from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
-from sklearn.mixture import GaussianMixture
-from sklearn.metrics import silhouette_score
+
+from core.clustering import (
+    CRITERIA,
+    FEATURES,
+    GMM_PIPELINE_PATH,
+    evaluate_candidate,
+)
+from core.schema import LRFMS, TIERS, apply_schema, read_frame, report_memory
+
+# -----------------------------
+# Options
+# -----------------------------
+parser = argparse.ArgumentParser(description="GMM clustering + tier model")
+parser.add_argument("--criterion", choices=CRITERIA, default="silhouette")
+parser.add_argument("--sample-size", type=int, default=20000,
+                    help="rows per silhouette sample (stratified by cluster)")
+parser.add_argument("--rounds", type=int, default=5,
+                    help="silhouette samples used for the confidence interval")
+parser.add_argument("--n-jobs", type=int, default=-1)
+args = parser.parse_args()
 
 # -----------------------------
 # Load LRFMS dataset
 # -----------------------------
-df = pd.read_csv("data/processed/customer_lrfms.csv")
+df = read_frame("data/processed/customer_lrfms.csv", LRFMS)
 
-features = ["L", "R", "F", "M", "S"]
+features = FEATURES
 X = df[features]
 
 # -----------------------------
@@ -21,29 +43,42 @@ X_scaled = scaler.fit_transform(X)
 # -----------------------------
 # Find optimal number of clusters
 # -----------------------------
-best_k = 2
-best_score = -1
-
-for k in range(2, 7):
-    gmm = GaussianMixture(n_components=k, random_state=42)
-    labels = gmm.fit_predict(X_scaled)
+# Candidates are fitted in parallel; the winning fit is kept, not refitted.
+candidates = Parallel(n_jobs=args.n_jobs)(
+    delayed(evaluate_candidate)(
+        X_scaled, k, args.criterion, args.sample_size, args.rounds
+    )
+    for k in range(2, 7)
+)
 
-    score = silhouette_score(X_scaled, labels)
-    print(f"k={k}, Silhouette Score={score:.4f}")
+for c in candidates:
+    low, high = c["ci"]
+    if args.criterion == "bic":
+        print(f"k={c['k']}, BIC={-c['score']:.1f}")
+    else:
+        print(
+            f"k={c['k']}, Silhouette Score={c['score']:.4f} "
+            f"(95% CI {low:.4f}-{high:.4f})"
+        )
 
-    if score > best_score:
-        best_k = k
-        best_score = score
+best = max(candidates, key=lambda c: c["score"])
+best_k = best["k"]
 
 print(f"\n✅ Optimal number of clusters: {best_k}")
 
 # -----------------------------
-# Train final GMM
+# Final GMM (reused from selection)
 # -----------------------------
-final_gmm = GaussianMixture(
-    n_components=best_k, random_state=42
-)
-df["cluster"] = final_gmm.fit_predict(X_scaled)
+final_gmm = best["model"]
+df["cluster"] = best["labels"].astype("int8")
+del candidates
+
+# -----------------------------
+# Persist scaler + GMM
+# -----------------------------
+cluster_pipeline = Pipeline([("scaler", scaler), ("gmm", final_gmm)])
+joblib.dump(cluster_pipeline, GMM_PIPELINE_PATH)
+print(f"✅ Cluster pipeline saved to {GMM_PIPELINE_PATH}")
 
 # -----------------------------
 # Save clustered output
@@ -95,9 +130,15 @@ rf.fit(X_train, y_train)
 accuracy = rf.score(X_test, y_test)
 print(f"✅ Random Forest Accuracy: {accuracy:.4f}")
 
+# Held-out customers: core.drift builds its confidence reference from
+# these, since the forest is over-confident on its own training rows
+df.loc[X_test.index, ["Customer ID"]].to_csv("models/rf_holdout.csv", index=False)
+
 # -----------------------------
 # Save final labeled dataset
 # -----------------------------
+apply_schema(df, TIERS)
+report_memory("decision_engine", tiers=df)
 df.to_csv(
     "data/processed/customer_tiers.csv",
     index=False
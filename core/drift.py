@@ -0,0 +1,355 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from core.db import drift_col, lrfms_col
+
+# =========================================================
+# FEATURE DRIFT SKETCHES
+# =========================================================
+# Each feature (and the model's prediction confidence) is summarised as
+# counts over fixed bins: the deciles of the training data, stored once in
+# models/drift_reference.json. A live sketch is one small document per day
+# in `drift_sketches`, bumped with a single $inc by recompute_customer, so
+# memory and storage stay constant however many recomputes happen. A batch
+# sweep over `lrfms` writes a population sketch the same way.
+#
+# Drift is PSI and the KS statistic between the reference bin shares and
+# the last DRIFT_WINDOW_DAYS of live sketches (or the last sweep); neither
+# rescans a collection.
+#
+#   python -m core.drift reference   # after decision_engine (pipeline stage)
+#   python -m core.drift sweep       # population sketch from lrfms
+#   python -m core.drift report [--source live|sweep]
+REFERENCE_PATH = "models/drift_reference.json"
+TRAINING_CSV = "data/processed/customer_lrfms.csv"
+MODEL_PATH = "models/rf_model.pkl"
+# Customers decision_engine held out of the forest's training split
+HOLDOUT_PATH = "models/rf_holdout.csv"
+
+FEATURES = ["L", "R", "F", "M", "S"]
+CONFIDENCE = "confidence"
+BINS = 10
+WINDOW_DAYS = int(os.environ.get("DRIFT_WINDOW_DAYS", 7))
+BATCH_SIZE = 5000
+
+# PSI rule of thumb: < 0.1 stable, 0.1-0.25 moderate shift, > 0.25 major
+PSI_WARN, PSI_ALERT = 0.1, 0.25
+_EPS = 1e-4
+
+
+# =========================================================
+# REFERENCE (TRAINING SNAPSHOT)
+# =========================================================
+def bin_edges(values, bins=BINS):
+    """Interior quantile edges; repeated quantiles collapse into one bin."""
+    qs = np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])
+    return np.unique(qs).tolist()
+
+
+def bin_counts(values, edges):
+    """Counts per bin: (-inf, e0), [e0, e1), ..., [e_last, inf)."""
+    idx = np.searchsorted(edges, np.asarray(values, dtype=np.float64), "right")
+    return np.bincount(idx, minlength=len(edges) + 1)
+
+
+def _confidences(model, X):
+    import pandas as pd
+
+    frame = pd.DataFrame(X, columns=FEATURES)
+    return np.concatenate(
+        [
+            model.predict_proba(frame.iloc[i : i + BATCH_SIZE]).max(axis=1)
+            for i in range(0, len(frame), BATCH_SIZE)
+        ]
+    )
+
+
+def build_reference(
+    csv_path=TRAINING_CSV, model_path=MODEL_PATH, holdout_path=HOLDOUT_PATH
+):
+    """
+    Feature sketches over the whole training population. The confidence
+    sketch only uses the held-out customers: on its own training rows the
+    forest is far more confident than on anyone it scores live.
+    """
+    import joblib
+    import pandas as pd
+
+    from core.schema import LRFMS, read_frame
+
+    df = read_frame(csv_path, LRFMS, columns=["Customer ID"] + FEATURES)
+    X = df[FEATURES].to_numpy(np.float64)
+    columns = {f: X[:, j] for j, f in enumerate(FEATURES)}
+    if not os.path.exists(holdout_path):
+        raise FileNotFoundError(
+            f"{holdout_path} not found; run core.decision_engine first"
+        )
+    held_out = df["Customer ID"].isin(pd.read_csv(holdout_path)["Customer ID"])
+    columns[CONFIDENCE] = _confidences(joblib.load(model_path), X[held_out.to_numpy()])
+
+    sketches = {}
+    for name, values in columns.items():
+        edges = bin_edges(values)
+        sketches[name] = {
+            "edges": edges,
+            "counts": bin_counts(values, edges).tolist(),
+        }
+    return {
+        "built_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "source": csv_path,
+        "rows": len(X),
+        "confidence_rows": int(held_out.sum()),
+        "sketches": sketches,
+    }
+
+
+_reference = {"mtime": None, "value": None}
+_reference_lock = threading.Lock()
+
+
+def load_reference(path=REFERENCE_PATH):
+    """The reference, re-read when the file changes; None if not built."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _reference_lock:
+        if _reference["mtime"] != mtime:
+            with open(path) as fh:
+                ref = json.load(fh)
+            for sketch in ref["sketches"].values():
+                sketch["edges"] = np.asarray(sketch["edges"], dtype=np.float64)
+                sketch["counts"] = np.asarray(sketch["counts"], dtype=np.int64)
+            _reference.update(mtime=mtime, value=ref)
+        return _reference["value"]
+
+
+# =========================================================
+# LIVE SKETCHES (RECOMPUTE PATH)
+# =========================================================
+def _live_id(day):
+    return f"live|{day:%Y-%m-%d}"
+
+
+def observe(features=None, confidence=None, when=None):
+    """
+    Counts one scored LRFMS vector and/or one prediction confidence into
+    today's live sketch. No-op until a reference exists.
+    """
+    ref = load_reference()
+    if ref is None:
+        return
+    values = dict(features or {})
+    if confidence is not None:
+        values[CONFIDENCE] = confidence
+
+    inc = {}
+    for name, value in values.items():
+        sketch = ref["sketches"].get(name)
+        if sketch is None or value is None:
+            continue
+        b = int(np.searchsorted(sketch["edges"], float(value), "right"))
+        inc[f"counts.{name}.{b}"] = 1
+    if not inc:
+        return
+
+    when = when or datetime.utcnow()
+    day = datetime(when.year, when.month, when.day)
+    drift_col.update_one(
+        {"_id": _live_id(day)},
+        {"$inc": inc, "$setOnInsert": {"kind": "live", "day": day}},
+        upsert=True,
+    )
+
+
+def _counts(doc, name, n_bins):
+    counts = np.zeros(n_bins, dtype=np.int64)
+    for b, n in (doc.get("counts", {}).get(name) or {}).items():
+        if int(b) < n_bins:
+            counts[int(b)] += n
+    return counts
+
+
+# =========================================================
+# BATCH SWEEP (POPULATION)
+# =========================================================
+def sweep(batch_size=BATCH_SIZE, with_confidence=True):
+    """
+    Streams `lrfms` once and stores its sketch as the "sweep" document.
+    Returns the number of customers counted.
+    """
+    ref = load_reference()
+    if ref is None:
+        raise FileNotFoundError(f"{REFERENCE_PATH} not found; run `reference` first")
+    model = None
+    if with_confidence:
+        from core.tier_model import load_tier_model
+
+        model = load_tier_model()
+
+    sketches = ref["sketches"]
+    totals = {
+        name: np.zeros(len(s["edges"]) + 1, dtype=np.int64)
+        for name, s in sketches.items()
+    }
+    projection = {"_id": 0, **{f: 1 for f in FEATURES}}
+    cursor = lrfms_col.find({}, projection).batch_size(batch_size)
+
+    scanned, batch = 0, []
+
+    def flush(docs):
+        X = np.array([[d.get(f) or 0 for f in FEATURES] for d in docs], dtype=float)
+        for j, f in enumerate(FEATURES):
+            totals[f] += bin_counts(X[:, j], sketches[f]["edges"])
+        if model is not None:
+            conf = _confidences(model, X)
+            totals[CONFIDENCE] += bin_counts(conf, sketches[CONFIDENCE]["edges"])
+
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            flush(batch)
+            scanned += len(batch)
+            batch = []
+    if batch:
+        flush(batch)
+        scanned += len(batch)
+
+    drift_col.replace_one(
+        {"_id": "sweep"},
+        {
+            "kind": "sweep",
+            "swept_at": datetime.utcnow(),
+            "rows": scanned,
+            "counts": {
+                name: {str(b): int(n) for b, n in enumerate(c) if n}
+                for name, c in totals.items()
+            },
+        },
+        upsert=True,
+    )
+    return scanned
+
+
+# =========================================================
+# REPORT
+# =========================================================
+def psi(expected, actual):
+    """Population stability index between two count vectors."""
+    e = np.maximum(expected / max(expected.sum(), 1), _EPS)
+    a = np.maximum(actual / max(actual.sum(), 1), _EPS)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def ks(expected, actual):
+    """KS statistic, evaluated at the bin edges."""
+    e = np.cumsum(expected) / max(expected.sum(), 1)
+    a = np.cumsum(actual) / max(actual.sum(), 1)
+    return float(np.max(np.abs(a - e)))
+
+
+def status(psi_value):
+    if psi_value >= PSI_ALERT:
+        return "drift"
+    if psi_value >= PSI_WARN:
+        return "shift"
+    return "stable"
+
+
+def report(source="live", days=WINDOW_DAYS):
+    """
+    {name: {n, psi, ks, status, reference, live}} for every sketched
+    column, plus the window it covers; None when there is no reference.
+    """
+    ref = load_reference()
+    if ref is None:
+        return None
+    if source == "sweep":
+        docs = list(drift_col.find({"_id": "sweep"}))
+        window = docs[0]["swept_at"] if docs else None
+    else:
+        since = datetime.utcnow() - timedelta(days=days)
+        since = datetime(since.year, since.month, since.day)
+        docs = list(drift_col.find({"kind": "live", "day": {"$gt": since}}))
+        window = since
+
+    columns = {}
+    for name, sketch in ref["sketches"].items():
+        n_bins = len(sketch["edges"]) + 1
+        live = sum((_counts(d, name, n_bins) for d in docs), np.zeros(n_bins, int))
+        n = int(live.sum())
+        p = psi(sketch["counts"], live) if n else None
+        columns[name] = {
+            "n": n,
+            "psi": p,
+            "ks": ks(sketch["counts"], live) if n else None,
+            "status": status(p) if n else "no data",
+            "reference": (sketch["counts"] / sketch["counts"].sum()).tolist(),
+            "live": (live / max(n, 1)).tolist(),
+        }
+    return {
+        "source": source,
+        "since": window,
+        "reference_built_at": ref["built_at"],
+        "columns": columns,
+    }
+
+
+def summary(source="live"):
+    """Compact {name: psi} (None without data) for /metrics."""
+    rep = report(source)
+    if rep is None:
+        return None
+    return {
+        name: None if c["psi"] is None else round(c["psi"], 4)
+        for name, c in rep["columns"].items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Feature drift sketches")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("reference", help=f"build {REFERENCE_PATH} from training data")
+    sweep_cmd = sub.add_parser("sweep", help="population sketch from lrfms")
+    sweep_cmd.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    sweep_cmd.add_argument("--no-confidence", action="store_true")
+    report_cmd = sub.add_parser("report", help="print PSI/KS per feature")
+    report_cmd.add_argument("--source", choices=("live", "sweep"), default="live")
+    report_cmd.add_argument("--days", type=int, default=WINDOW_DAYS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "reference":
+        ref = build_reference()
+        tmp_path = REFERENCE_PATH + ".tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(ref, fh, indent=1)
+        os.replace(tmp_path, REFERENCE_PATH)
+        print(f"✅ Drift reference over {ref['rows']:,} rows saved to {REFERENCE_PATH}")
+        return
+
+    if args.command == "sweep":
+        n = sweep(args.batch_size, not args.no_confidence)
+        print(f"✅ Swept {n:,} customers in {time.perf_counter() - start:.1f}s")
+        return
+
+    rep = report(args.source, args.days)
+    if rep is None:
+        print(f"❌ {REFERENCE_PATH} not found; run `python -m core.drift reference`")
+        return
+    for name, c in rep["columns"].items():
+        if c["n"] == 0:
+            print(f"{name:<11} no data")
+            continue
+        icon = {"stable": "✅", "shift": "⚠️", "drift": "❌"}[c["status"]]
+        print(f"{icon} {name:<11} n={c['n']:<8,} PSI={c['psi']:.3f}  KS={c['ks']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
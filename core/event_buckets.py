@@ -0,0 +1,634 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from core.db import event_buckets_col, events_col, versions_col
+
+# =========================================================
+# TIME-BUCKETED PURCHASES + EVENT ARCHIVAL
+# =========================================================
+# Every purchase is also counted into two per-customer buckets, one for its
+# day and one for its month: count, quantity, monetary (sum of price) and
+# the first/last purchase time. LRFMS only needs count, sum and last time,
+# so recompute can answer from a customer's month buckets (a few dozen
+# small documents) instead of every raw event they ever produced.
+#
+# EVENT_STORAGE selects where purchase summaries are read from:
+#   raw      (default) one $group over the customer's raw purchase events
+#   buckets  the month buckets; raw events past EVENT_RETENTION_DAYS can
+#            then be moved to gzip NDJSON files under EVENT_ARCHIVE_DIR
+#
+#   python -m core.event_buckets rebuild   # buckets from raw events + archive
+#   python -m core.event_buckets archive   # move expired raw events to disk
+#   python -m core.event_buckets verify 12346 [--no-repair]
+#
+# Archive files hold one day each (YYYY/MM/YYYY-MM-DD.ndjson.gz). A day is
+# written to a temp file, fsynced and renamed before its events are
+# deleted, and rerunning merges by _id, so an interrupted archive neither
+# loses nor duplicates events.
+#
+# Each event carries id_hash, a 32-bit hash of its event_id (set by
+# core.event_ingest). Buckets sum it next to count and spend, so `verify`
+# can prove a customer's counters hold every raw event exactly once. It
+# compares them per day with the raw events and rebuilds the days that
+# disagree, without rescanning anyone else. recompute_customer runs it on
+# EVENT_VERIFY_RATE of its calls when EVENT_STORAGE=buckets.
+#
+# verify only looks at days after the archive watermark (the newest day
+# `archive` has moved out, kept in `versions`) and inside the retention
+# window, since older days are no longer complete in raw events. A raw
+# event is stored before its bucket $inc, so a month with events inserted
+# in the last EVENT_VERIFY_GRACE_SECONDS is left alone until it settles.
+STORAGE = os.environ.get("EVENT_STORAGE", "raw")
+RETENTION_DAYS = int(os.environ.get("EVENT_RETENTION_DAYS", 365))
+ARCHIVE_DIR = os.environ.get("EVENT_ARCHIVE_DIR", "data/archive/events")
+VERIFY_RATE = float(os.environ.get("EVENT_VERIFY_RATE", 0.1))
+VERIFY_GRACE_SECONDS = int(os.environ.get("EVENT_VERIFY_GRACE_SECONDS", 300))
+ARCHIVE_MARK = "event_archive"  # versions doc: {"through": newest archived day}
+
+UNITS = {"day": "%Y-%m-%d", "month": "%Y-%m"}
+DELETE_BATCH = 5000
+
+
+def bucket_start(when, unit):
+    if unit == "month":
+        return datetime(when.year, when.month, 1)
+    return datetime(when.year, when.month, when.day)
+
+
+def _bucket_id(customer_id, unit, start):
+    return f"{customer_id}|{unit}|{start:{UNITS[unit]}}"
+
+
+def event_hash(event_id):
+    """32-bit hash of an event_id; bucket sums of it identify the event set."""
+    digest = hashlib.blake2b(str(event_id).encode(), digest_size=4).digest()
+    return int.from_bytes(digest, "big")
+
+
+def _bucket_update(
+    customer_id, unit, start, count, quantity, monetary, first, last, id_hash
+):
+    return {
+        "$inc": {
+            "count": count,
+            "quantity": quantity,
+            "monetary": monetary,
+            "id_hash": id_hash,
+        },
+        "$min": {"first_time": first},
+        "$max": {"last_time": last},
+        "$setOnInsert": {"customer_id": customer_id, "unit": unit, "start": start},
+    }
+
+
+# =========================================================
+# WRITE PATH
+# =========================================================
+def record_purchases(events):
+    """Counts purchase events into their day and month buckets (one bulk)."""
+    from pymongo import UpdateOne
+
+    # (customer_id, unit, start) -> [count, qty, monetary, first, last, id_hash]
+    buckets = {}
+    for event in events:
+        when = event["event_time"]
+        for unit in UNITS:
+            _add(
+                buckets,
+                (event["customer_id"], unit, bucket_start(when, unit)),
+                1,
+                int(event.get("quantity") or 1),
+                float(event["price"]),
+                when,
+                when,
+                event.get("id_hash", 0),
+            )
+    ops = [
+        UpdateOne(
+            {"_id": _bucket_id(customer_id, unit, start)},
+            _bucket_update(customer_id, unit, start, *values),
+            upsert=True,
+        )
+        for (customer_id, unit, start), values in buckets.items()
+    ]
+    if ops:
+        event_buckets_col.bulk_write(ops, ordered=False)
+
+
+def record_purchase(event):
+    """Counts one purchase event into its day and month buckets."""
+    record_purchases([event])
+
+
+# =========================================================
+# READS
+# =========================================================
+_SUMMARY_GROUP = {
+    "_id": None,
+    "count": {"$sum": "$count"},
+    "monetary": {"$sum": "$monetary"},
+    "id_hash": {"$sum": "$id_hash"},
+    "first_time": {"$min": "$first_time"},
+    "last_time": {"$max": "$last_time"},
+}
+
+
+def purchase_summary(customer_id, storage=None):
+    """
+    {count, monetary, id_hash, first_time, last_time} over all of a
+    customer's purchases, or None when there are none.
+    """
+    if (storage or STORAGE) == "buckets":
+        rows = event_buckets_col.aggregate(
+            [
+                {"$match": {"customer_id": customer_id, "unit": "month"}},
+                {"$group": _SUMMARY_GROUP},
+            ]
+        )
+    else:
+        rows = events_col.aggregate(
+            [
+                {"$match": {"customer_id": customer_id, "event_type": "purchase"}},
+                {
+                    "$group": {
+                        "_id": None,
+                        "count": {"$sum": 1},
+                        "monetary": {"$sum": "$price"},
+                        "id_hash": {"$sum": {"$ifNull": ["$id_hash", 0]}},
+                        "first_time": {"$min": "$event_time"},
+                        "last_time": {"$max": "$event_time"},
+                    }
+                },
+            ]
+        )
+    row = next(iter(rows), None)
+    if not row or not row["count"]:
+        return None
+    row.pop("_id", None)
+    row["monetary"] = float(row["monetary"])
+    return row
+
+
+def purchase_history(customer_id, unit="day", start=None):
+    """A customer's buckets of one unit in time order (from `start`)."""
+    query = {"customer_id": customer_id, "unit": unit}
+    if start:
+        query["start"] = {"$gte": bucket_start(start, unit)}
+    return list(event_buckets_col.find(query, {"_id": 0}).sort("start", 1))
+
+
+def ensure_indexes():
+    event_buckets_col.create_index([("customer_id", 1), ("unit", 1), ("start", 1)])
+    event_buckets_col.create_index([("unit", 1), ("start", 1)])
+    events_col.create_index("event_time")
+
+
+# =========================================================
+# REBUILD (RAW EVENTS + ARCHIVE)
+# =========================================================
+def _raw_buckets(unit, match=None):
+    pipeline = [
+        {"$match": {"event_type": "purchase", **(match or {})}},
+        {
+            "$group": {
+                "_id": {
+                    "customer_id": "$customer_id",
+                    "start": {
+                        "$dateToString": {
+                            "format": UNITS[unit],
+                            "date": "$event_time",
+                        }
+                    },
+                },
+                "count": {"$sum": 1},
+                "quantity": {"$sum": {"$ifNull": ["$quantity", 1]}},
+                "monetary": {"$sum": "$price"},
+                "id_hash": {"$sum": {"$ifNull": ["$id_hash", 0]}},
+                "first_time": {"$min": "$event_time"},
+                "last_time": {"$max": "$event_time"},
+                "last_insert": {"$max": "$_id"},
+            }
+        },
+    ]
+    for row in events_col.aggregate(pipeline, allowDiskUse=True):
+        start = datetime.strptime(row["_id"]["start"], UNITS[unit])
+        yield row["_id"]["customer_id"], start, row
+
+
+def _add(buckets, key, count, quantity, monetary, first, last, id_hash):
+    if key not in buckets:
+        buckets[key] = [0, 0, 0.0, first, last, 0]
+    b = buckets[key]
+    b[0] += count
+    b[1] += quantity
+    b[2] += monetary
+    b[3], b[4] = min(b[3], first), max(b[4], last)
+    b[5] += id_hash
+
+
+_FIELDS = ["count", "quantity", "monetary", "first_time", "last_time", "id_hash"]
+
+
+def _bucket_doc(key, values):
+    customer_id, unit, start = key
+    count, qty, monetary, first, last, id_hash = values
+    return {
+        "customer_id": customer_id,
+        "unit": unit,
+        "start": start,
+        "count": count,
+        "quantity": qty,
+        "monetary": monetary,
+        "first_time": first,
+        "last_time": last,
+        "id_hash": id_hash,
+    }
+
+
+REBUILD_COLLECTION = "event_buckets_rebuild"
+ARCHIVE_FLUSH = 50000  # archived events summed in memory per bulk write
+
+
+def _merge_raw(unit, into):
+    """Groups raw purchases into `unit` buckets server-side, $merge'd into `into`."""
+    pipeline = [
+        {"$match": {"event_type": "purchase"}},
+        {
+            "$group": {
+                "_id": {
+                    "customer_id": "$customer_id",
+                    "start": {
+                        "$dateToString": {"format": UNITS[unit], "date": "$event_time"}
+                    },
+                },
+                "count": {"$sum": 1},
+                "quantity": {"$sum": {"$ifNull": ["$quantity", 1]}},
+                "monetary": {"$sum": "$price"},
+                "id_hash": {"$sum": {"$ifNull": ["$id_hash", 0]}},
+                "first_time": {"$min": "$event_time"},
+                "last_time": {"$max": "$event_time"},
+            }
+        },
+        {
+            "$project": {
+                # Same ids as _bucket_id
+                "_id": {
+                    "$concat": [
+                        {"$toString": "$_id.customer_id"},
+                        f"|{unit}|",
+                        "$_id.start",
+                    ]
+                },
+                "customer_id": "$_id.customer_id",
+                "unit": unit,
+                "start": {
+                    "$dateFromString": {
+                        "dateString": "$_id.start",
+                        "format": UNITS[unit],
+                    }
+                },
+                **{f: 1 for f in _FIELDS},
+            }
+        },
+        {"$merge": {"into": into, "whenMatched": "replace"}},
+    ]
+    events_col.aggregate(pipeline, allowDiskUse=True)
+
+
+def _add_archive(col, archive_dir):
+    """$inc's archived purchases into `col`, ARCHIVE_FLUSH events at a time."""
+    from pymongo import UpdateOne
+
+    def flush(buckets):
+        ops = [
+            UpdateOne(
+                {"_id": _bucket_id(*key)},
+                _bucket_update(*key, *values),
+                upsert=True,
+            )
+            for key, values in buckets.items()
+        ]
+        for start in range(0, len(ops), 1000):
+            col.bulk_write(ops[start : start + 1000], ordered=False)
+
+    buckets, pending = {}, 0
+    for event in iter_archive(archive_dir):
+        if event.get("event_type") != "purchase":
+            continue
+        when = event["event_time"]
+        for unit in UNITS:
+            _add(
+                buckets,
+                (event["customer_id"], unit, bucket_start(when, unit)),
+                1,
+                int(event.get("quantity") or 1),
+                float(event["price"]),
+                when,
+                when,
+                event.get("id_hash", 0),
+            )
+        pending += 1
+        if pending >= ARCHIVE_FLUSH:
+            flush(buckets)
+            buckets, pending = {}, 0
+    flush(buckets)
+
+
+def rebuild(archive_dir=ARCHIVE_DIR):
+    """
+    Replaces every bucket; returns the number of bucket documents.
+
+    The buckets are built in a separate collection (raw events grouped by
+    the server, archived events added in batches) that is then renamed over
+    event_buckets, so memory stays flat and readers never see a partial
+    set. Purchases recorded while it runs are lost from the buckets, so run
+    it while nothing is ingesting (or `verify` the affected customers).
+    """
+    db = event_buckets_col.database
+    staging = db[REBUILD_COLLECTION]
+    staging.drop()
+    for unit in UNITS:
+        _merge_raw(unit, REBUILD_COLLECTION)
+    _add_archive(staging, archive_dir)
+    total = staging.count_documents({})
+    if total:
+        staging.rename(event_buckets_col.name, dropTarget=True)
+    else:
+        event_buckets_col.delete_many({})
+    ensure_indexes()
+    return total
+
+
+# =========================================================
+# VERIFY (CHECKSUM AGAINST RAW EVENTS)
+# =========================================================
+def _checksum(bucket):
+    return (bucket["count"], bucket.get("id_hash", 0)) if bucket else (0, 0)
+
+
+def _next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def archived_through():
+    """The newest archived day, or None before the first archive."""
+    return (versions_col.find_one({"_id": ARCHIVE_MARK}) or {}).get("through")
+
+
+def verify(customer_id, repair=True, retention_days=RETENTION_DAYS):
+    """
+    Compares a customer's day buckets with their raw purchases (count and
+    id_hash sum per day), for days inside the retention window and after
+    the archive watermark. Days that differ are rebuilt from the raw events
+    when `repair`, along with the month buckets that contain them. Months
+    with events inserted in the last VERIFY_GRACE_SECONDS are skipped, as
+    their bucket updates may still be in flight. Returns the mismatched
+    days.
+    """
+    from pymongo import DeleteOne, ReplaceOne
+
+    now = datetime.utcnow()
+    start = bucket_start(now, "day") - timedelta(days=retention_days)
+    through = archived_through()
+    if through is not None:
+        start = max(start, through + timedelta(days=1))
+    raw = {}
+    for _, day, row in _raw_buckets(
+        "day", {"customer_id": customer_id, "event_time": {"$gte": start}}
+    ):
+        raw[day] = row
+    counted = {
+        b["start"]: b
+        for b in event_buckets_col.find(
+            {"customer_id": customer_id, "unit": "day", "start": {"$gte": start}}
+        )
+    }
+    settled = ObjectId.from_datetime(now - timedelta(seconds=VERIFY_GRACE_SECONDS))
+    unsettled = {
+        bucket_start(day, "month")
+        for day, row in raw.items()
+        if row["last_insert"] > settled
+    }
+    bad = [
+        day
+        for day in sorted(raw.keys() | counted.keys())
+        if bucket_start(day, "month") not in unsettled
+        and _checksum(raw.get(day)) != _checksum(counted.get(day))
+    ]
+    if not bad or not repair:
+        return bad
+
+    ops = []
+    for day in bad:
+        key = (customer_id, "day", day)
+        if day in raw:
+            row = raw[day]
+            values = [row[f] for f in _FIELDS]
+            ops.append(
+                ReplaceOne(
+                    {"_id": _bucket_id(*key)}, _bucket_doc(key, values), upsert=True
+                )
+            )
+        else:
+            ops.append(DeleteOne({"_id": _bucket_id(*key)}))
+    event_buckets_col.bulk_write(ops, ordered=False)
+
+    # Months are the sum of their days (archived days keep their buckets)
+    ops = []
+    for month in {bucket_start(day, "month") for day in bad}:
+        days = list(
+            event_buckets_col.find(
+                {
+                    "customer_id": customer_id,
+                    "unit": "day",
+                    "start": {"$gte": month, "$lt": _next_month(month)},
+                }
+            )
+        )
+        key = (customer_id, "month", month)
+        if days:
+            values = [
+                sum(d["count"] for d in days),
+                sum(d.get("quantity", 0) for d in days),
+                sum(d["monetary"] for d in days),
+                min(d["first_time"] for d in days),
+                max(d["last_time"] for d in days),
+                sum(d.get("id_hash", 0) for d in days),
+            ]
+            ops.append(
+                ReplaceOne(
+                    {"_id": _bucket_id(*key)}, _bucket_doc(key, values), upsert=True
+                )
+            )
+        else:
+            ops.append(DeleteOne({"_id": _bucket_id(*key)}))
+    event_buckets_col.bulk_write(ops, ordered=False)
+    return bad
+
+
+# =========================================================
+# ARCHIVE
+# =========================================================
+def _archive_path(archive_dir, day):
+    return os.path.join(
+        archive_dir, f"{day:%Y}", f"{day:%m}", f"{day:%Y-%m-%d}.ndjson.gz"
+    )
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"cannot archive {type(value).__name__}")
+
+
+def _decode(doc):
+    for key, value in doc.items():
+        if isinstance(value, dict) and "$date" in value:
+            doc[key] = datetime.fromisoformat(value["$date"])
+    return doc
+
+
+def read_archive(path):
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            yield _decode(json.loads(line))
+
+
+def iter_archive(archive_dir=ARCHIVE_DIR):
+    """Every archived event, day by day."""
+    for root, dirs, files in os.walk(archive_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(".ndjson.gz"):
+                yield from read_archive(os.path.join(root, name))
+
+
+def _check_covered(day, events):
+    """Refuses to drop purchases that the day buckets do not account for."""
+    raw = {}
+    for e in events:
+        if e.get("event_type") == "purchase":
+            raw[e["customer_id"]] = raw.get(e["customer_id"], 0) + 1
+    if not raw:
+        return
+    counted = {
+        b["customer_id"]: b["count"]
+        for b in event_buckets_col.find(
+            {"unit": "day", "start": day}, {"customer_id": 1, "count": 1}
+        )
+    }
+    missing = [c for c, n in raw.items() if counted.get(c, 0) < n]
+    if missing:
+        raise RuntimeError(
+            f"{len(missing)} customers have purchases on {day:%Y-%m-%d} that are "
+            "not in the buckets; run `python -m core.event_buckets rebuild` first"
+        )
+
+
+def archive_day(day, archive_dir=ARCHIVE_DIR):
+    """Moves one day of raw events to its archive file; returns events moved."""
+    query = {"event_time": {"$gte": day, "$lt": day + timedelta(days=1)}}
+    events = list(events_col.find(query).sort("event_time", 1))
+    if not events:
+        return 0
+    _check_covered(day, events)
+
+    path = _archive_path(archive_dir, day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    archived = []
+    if os.path.exists(path):
+        # A previous run wrote this day but may not have finished deleting
+        archived = list(read_archive(path))
+    seen = {str(e["_id"]) for e in archived}
+    fresh = [e for e in events if str(e["_id"]) not in seen]
+
+    if fresh:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as raw_fh:
+            with gzip.open(raw_fh, "wt", encoding="utf-8") as fh:
+                for e in archived + fresh:
+                    fh.write(json.dumps(e, default=_encode) + "\n")
+            raw_fh.flush()
+            os.fsync(raw_fh.fileno())
+        os.replace(tmp_path, path)
+
+    # Before the deletes: verify must stop treating this day as raw
+    versions_col.update_one(
+        {"_id": ARCHIVE_MARK},
+        {"$max": {"through": day}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
+    ids = [e["_id"] for e in events]
+    for start in range(0, len(ids), DELETE_BATCH):
+        events_col.delete_many({"_id": {"$in": ids[start : start + DELETE_BATCH]}})
+    return len(events)
+
+
+def archive(retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR):
+    """Archives every whole day older than the retention window."""
+    ensure_indexes()
+    cutoff = bucket_start(datetime.utcnow(), "day") - timedelta(days=retention_days)
+    moved, days = 0, 0
+    while True:
+        oldest = events_col.find_one(
+            {"event_time": {"$lt": cutoff}}, {"event_time": 1}, sort=[("event_time", 1)]
+        )
+        if not oldest:
+            break
+        moved += archive_day(bucket_start(oldest["event_time"], "day"), archive_dir)
+        days += 1
+    return moved, days
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Purchase buckets and event archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = sub.add_parser("rebuild", help="rebuild buckets from events")
+    rebuild_cmd.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    archive_cmd = sub.add_parser("archive", help="archive expired raw events")
+    archive_cmd.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    archive_cmd.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    verify_cmd = sub.add_parser("verify", help="check buckets against raw events")
+    verify_cmd.add_argument("customer_ids", type=int, nargs="+")
+    verify_cmd.add_argument("--no-repair", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "rebuild":
+        n = rebuild(args.archive_dir)
+        print(f"✅ {n:,} purchase buckets in {time.perf_counter() - start:.1f}s")
+        return
+
+    if args.command == "verify":
+        for customer_id in args.customer_ids:
+            bad = verify(customer_id, repair=not args.no_repair)
+            if not bad:
+                print(f"✅ {customer_id}: buckets match raw events")
+                continue
+            action = "left as is" if args.no_repair else "rebuilt"
+            days = ", ".join(f"{d:%Y-%m-%d}" for d in bad)
+            print(f"⚠️ {customer_id}: {len(bad)} days differ ({action}): {days}")
+        return
+
+    if STORAGE != "buckets":
+        # Recompute would silently lose the archived history
+        print("❌ Set EVENT_STORAGE=buckets before archiving raw events")
+        raise SystemExit(1)
+    moved, days = archive(args.retention_days, args.archive_dir)
+    print(
+        f"✅ Archived {moved:,} events from {days:,} days to {args.archive_dir} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import argparse
+import itertools
+import threading
+import time
+
+from core.db import events_col
+from core.event_buckets import event_hash, record_purchases
+
+# =========================================================
+# IDEMPOTENT EVENT INGESTION
+# =========================================================
+# `event_id` is unique in `events` (partial index over documents that have
+# one), so a retried add-to-cart or a reloaded event log can't count a
+# purchase twice. Bulk loads insert unordered and treat duplicate-key
+# errors (11000) as "already there". Only the events actually inserted
+# reach the purchase buckets, including those stored by a batch that is
+# then re-raised for some other write error. Every event is stored with
+# id_hash (core.event_buckets.event_hash), which the buckets sum so their
+# counters can be verified against the raw events.
+#
+# Every process creates the index before its first write (insert_event,
+# ingest). On a store that already holds duplicates that fails until
+# `migrate` has removed them; writes go ahead meanwhile and the index is
+# retried every INDEX_RETRY_SECONDS.
+#
+#   python -m core.event_ingest migrate   # once: drop duplicates, add id_hash
+#   python -m core.event_ingest load data/processed/event_log.csv
+#
+# Run `python -m core.event_buckets rebuild` after migrate, since buckets
+# built before it include the duplicates and carry no id_hash.
+DUPLICATE_KEY = 11000
+BATCH_SIZE = 5000
+EVENT_LOG_PATH = "data/processed/event_log.csv"
+INDEX_RETRY_SECONDS = 60
+
+
+def ensure_indexes():
+    events_col.create_index(
+        "event_id",
+        unique=True,
+        partialFilterExpression={"event_id": {"$exists": True}},
+        name="event_id_unique",
+    )
+
+
+_indexed = False
+_index_retry_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _ensure_indexes_once():
+    """ensure_indexes() once per process (retried while duplicates block it)."""
+    global _indexed, _index_retry_at
+    if _indexed or time.monotonic() < _index_retry_at:
+        return
+    from pymongo.errors import OperationFailure
+
+    with _index_lock:
+        if _indexed or time.monotonic() < _index_retry_at:
+            return
+        try:
+            ensure_indexes()
+            _indexed = True
+        except OperationFailure as e:
+            _index_retry_at = time.monotonic() + INDEX_RETRY_SECONDS
+            print(
+                f"⚠️ Unique event_id index not created ({e}); "
+                "run `python -m core.event_ingest migrate`"
+            )
+
+
+def prepare(event):
+    """A copy of `event` carrying its id_hash."""
+    return {**event, "id_hash": event_hash(event["event_id"])}
+
+
+def insert_event(event):
+    """
+    Stores one event and counts it into the buckets if it is a purchase.
+    False (and nothing written) when its event_id is already stored.
+    """
+    from pymongo.errors import DuplicateKeyError
+
+    _ensure_indexes_once()
+    event = prepare(event)
+    try:
+        events_col.insert_one(event)
+    except DuplicateKeyError:
+        return False
+    if event.get("event_type") == "purchase":
+        record_purchases([event])
+    return True
+
+
+def ingest(events, batch_size=BATCH_SIZE):
+    """Bulk insert that skips stored event_ids; returns (inserted, duplicates)."""
+    from pymongo.errors import BulkWriteError
+
+    _ensure_indexes_once()
+    events = iter(events)
+    inserted = duplicates = 0
+    while True:
+        docs = [prepare(e) for e in itertools.islice(events, batch_size)]
+        if not docs:
+            return inserted, duplicates
+        error = None
+        errors = []
+        try:
+            events_col.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            error = e
+            errors = e.details.get("writeErrors", [])
+        failed = {err["index"] for err in errors}
+        fresh = [d for i, d in enumerate(docs) if i not in failed]
+        # An unordered batch stores every document that didn't error, so
+        # the buckets must count those even when the batch is re-raised
+        record_purchases([d for d in fresh if d.get("event_type") == "purchase"])
+        if any(err["code"] != DUPLICATE_KEY for err in errors):
+            raise error
+        inserted += len(fresh)
+        duplicates += len(failed)
+
+
+# =========================================================
+# MIGRATION (EXISTING STORE)
+# =========================================================
+def drop_duplicates():
+    """Keeps the first stored copy of every event_id; returns copies removed."""
+    pipeline = [
+        {"$match": {"event_id": {"$exists": True}}},
+        {"$group": {"_id": "$event_id", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ]
+    extra = []
+    for row in events_col.aggregate(pipeline, allowDiskUse=True):
+        extra.extend(sorted(row["ids"])[1:])
+    for start in range(0, len(extra), BATCH_SIZE):
+        events_col.delete_many({"_id": {"$in": extra[start : start + BATCH_SIZE]}})
+    return len(extra)
+
+
+def backfill_hashes():
+    """Sets id_hash on stored events that lack it; returns events updated."""
+    from pymongo import UpdateOne
+
+    cursor = events_col.find(
+        {"event_id": {"$exists": True}, "id_hash": {"$exists": False}},
+        {"event_id": 1},
+    ).batch_size(BATCH_SIZE)
+    updated = 0
+    while True:
+        batch = list(itertools.islice(cursor, BATCH_SIZE))
+        if not batch:
+            return updated
+        events_col.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": d["_id"]}, {"$set": {"id_hash": event_hash(d["event_id"])}}
+                )
+                for d in batch
+            ],
+            ordered=False,
+        )
+        updated += len(batch)
+
+
+def csv_events(path=EVENT_LOG_PATH):
+    from core.schema import EVENTS, read_frame
+
+    df = read_frame(path, EVENTS)
+    df = df.astype({"product_id": str, "tier_at_event": str, "event_type": str})
+    for record in df.to_dict("records"):
+        yield {
+            **record,
+            "customer_id": int(record["customer_id"]),
+            "quantity": int(record["quantity"]),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Idempotent event ingestion")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="drop duplicate events and add id_hash")
+    load_cmd = sub.add_parser("load", help="bulk load an event log CSV")
+    load_cmd.add_argument("path", nargs="?", default=EVENT_LOG_PATH)
+    load_cmd.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "migrate":
+        removed = drop_duplicates()
+        hashed = backfill_hashes()
+        print(
+            f"✅ Removed {removed:,} duplicate events, hashed {hashed:,} "
+            f"({time.perf_counter() - start:.1f}s)"
+        )
+        print("   Run `python -m core.event_buckets rebuild` to refresh the buckets")
+        return
+
+    inserted, duplicates = ingest(csv_events(args.path), args.batch_size)
+    print(
+        f"✅ Loaded {inserted:,} events, skipped {duplicates:,} already stored, "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import functools
+import threading
+
+import numpy as np
+
+from core.tier_model import FEATURES, RF_MODEL_PATH, file_version, served_model
+
+# =========================================================
+# PER-CUSTOMER SHAP EXPLANATIONS
+# =========================================================
+CACHE_SIZE = 4096
+
+_explainer = None
+_explainer_lock = threading.Lock()
+
+
+class _Explainer:
+    """
+    A model and its TreeExplainer. Equal to (and hashed as) its model
+    version, so it can key the result cache while carrying the model the
+    results are computed with.
+    """
+
+    def __init__(self, model, version):
+        import shap
+
+        self.model = model
+        self.explainer = shap.TreeExplainer(model)
+        self.version = version
+
+    def __eq__(self, other):
+        return isinstance(other, _Explainer) and other.version == self.version
+
+    def __hash__(self):
+        return hash(self.version)
+
+
+def get_explainer():
+    """
+    Explainer for the serving model when it is a tree ensemble, otherwise
+    for the full forest in rf_model.pkl. Rebuilt when that model changes
+    (core.tier_model reloads the serving model when its file does).
+    """
+    global _explainer
+    model, version = served_model()
+    fallback = not hasattr(model, "estimators_")
+    if fallback:
+        version = file_version(RF_MODEL_PATH)
+    state = _explainer
+    if state is None or state.version != version:
+        with _explainer_lock:
+            if _explainer is None or _explainer.version != version:
+                if fallback:
+                    import joblib
+
+                    model = joblib.load(RF_MODEL_PATH)
+                _explainer = _Explainer(model, version)
+                _explain_vector.cache_clear()  # results of the old model
+    return _explainer
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _explain_vector(state, vector):
+    import pandas as pd
+
+    X = pd.DataFrame([vector], columns=FEATURES)
+    model = state.model
+
+    proba = model.predict_proba(X)[0]
+    class_index = int(np.argmax(proba))
+    output = state.explainer(X)
+
+    values = output.values[0, :, class_index]
+    base_value = np.atleast_1d(output.base_values[0])[class_index]
+
+    contributions = sorted(
+        (
+            {"feature": f, "value": v, "shap": float(s)}
+            for f, v, s in zip(FEATURES, vector, values)
+        ),
+        key=lambda c: abs(c["shap"]),
+        reverse=True,
+    )
+    return {
+        "tier": str(model.classes_[class_index]),
+        "confidence": float(proba[class_index]),
+        "base_value": float(base_value),
+        "contributions": contributions,
+        "model_version": state.version,
+    }
+
+
+def explain(lrfms):
+    """
+    SHAP explanation of one customer's current LRFMS vector.
+
+    Results are cached per (model version, feature vector); the returned
+    dict is shared, so callers must not mutate it.
+    """
+    vector = tuple(float(lrfms.get(f) or 0) for f in FEATURES)
+    return _explain_vector(get_explainer(), vector)
+
+
+def cache_info():
+    return _explain_vector.cache_info()
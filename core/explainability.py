@@ -1,62 +1,216 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
 import shap
 import joblib
 import numpy as np
 
+from core.schema import TIERS, read_frame
+
 # -----------------------------
-# Load data and model
+# Paths & options
 # -----------------------------
-df = pd.read_csv("data/processed/customer_tiers.csv")
-X = df[["L", "R", "F", "M", "S"]]
+DATA_PATH = "data/processed/customer_tiers.csv"
+MODEL_PATH = "models/rf_model.pkl"
+OUTPUT_PATH = "data/processed/global_feature_importance.csv"
+BY_TIER_PATH = "data/processed/global_feature_importance_by_tier.csv"
+SAMPLED_PATH = "data/processed/global_feature_importance_sampled.csv"
+CHECKPOINT_PATH = "data/processed/.shap_checkpoint.json"
 
-rf = joblib.load("models/rf_model.pkl")
+FEATURES = ["L", "R", "F", "M", "S"]
 
-# -----------------------------
-# Create SHAP explainer
-# -----------------------------
-explainer = shap.TreeExplainer(rf)
-shap_output = explainer(X)
 
 # -----------------------------
-# HANDLE MULTI-CLASS SAFELY
+# Worker side
 # -----------------------------
-# shap_output.values shape:
-# (n_samples, n_features, n_classes)
-shap_values = shap_output.values
+_explainer = None
+
+
+def _init_worker(model_path):
+    """Each worker builds its TreeExplainer once."""
+    global _explainer
+    _explainer = shap.TreeExplainer(joblib.load(model_path))
+
+
+def _chunk_stats(chunk_id, X, tiers):
+    """
+    Reduces one chunk to running sums; the (rows, features, classes)
+    tensor never leaves the worker.
+    """
+    abs_shap = np.abs(_explainer(X).values)  # (rows, features, classes)
+    per_row = abs_shap.mean(axis=2)          # (rows, features)
+
+    by_tier = {}
+    for tier in np.unique(tiers):
+        mask = tiers == tier
+        by_tier[str(tier)] = [per_row[mask].sum(axis=0).tolist(), int(mask.sum())]
+
+    return chunk_id, {
+        "sum_abs": abs_shap.sum(axis=0).tolist(),
+        "sum_row": per_row.sum(axis=0).tolist(),
+        "sum_row_sq": (per_row ** 2).sum(axis=0).tolist(),
+        "rows": len(X),
+        "by_tier": by_tier,
+    }
 
-# Compute mean |SHAP| across samples & classes
-mean_abs_shap = np.mean(np.abs(shap_values), axis=(0, 2))
 
 # -----------------------------
-# Global Feature Importance
+# Checkpointing
 # -----------------------------
-importance = pd.DataFrame({
-    "feature": X.columns.tolist(),
-    "importance": mean_abs_shap.tolist()
-}).sort_values(by="importance", ascending=False)
+def _run_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode())
+    return digest.hexdigest()[:16]
+
+
+def _file_id(path):
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
 
-importance.to_csv(
-    "data/processed/global_feature_importance.csv",
-    index=False
-)
 
-print("✅ Global SHAP feature importance generated")
-print(importance)
+def _load_checkpoint(key):
+    try:
+        with open(CHECKPOINT_PATH) as fh:
+            state = json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"key": key, "done": {}}
+    if state.get("key") != key:
+        print("Checkpoint belongs to another run, starting fresh.")
+        return {"key": key, "done": {}}
+    print(f"↻ Resuming: {len(state['done'])} chunks already computed")
+    return state
+
+
+def _save_checkpoint(state):
+    tmp_path = CHECKPOINT_PATH + ".tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(state, fh)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
 
 # -----------------------------
-# Local Explanation (One Customer)
+# Driver
 # -----------------------------
-sample_idx = 0
-sample = X.iloc[[sample_idx]]
+def compute(X, tiers, chunk_size, workers, key):
+    """Runs all pending chunks across a process pool, checkpointing each."""
+    state = _load_checkpoint(key)
+    bounds = {
+        str(i): (start, min(start + chunk_size, len(X)))
+        for i, start in enumerate(range(0, len(X), chunk_size))
+    }
+    pending = [cid for cid in bounds if cid not in state["done"]]
+
+    if pending:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(MODEL_PATH,)
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _chunk_stats,
+                    cid,
+                    X.iloc[bounds[cid][0]:bounds[cid][1]],
+                    tiers[bounds[cid][0]:bounds[cid][1]],
+                )
+                for cid in pending
+            ]
+            for future in as_completed(futures):
+                cid, stats = future.result()
+                state["done"][cid] = stats
+                _save_checkpoint(state)
+                print(f"  chunk {cid}: {len(state['done'])}/{len(bounds)} done")
+
+    # Merge in chunk order so the float sums are reproducible
+    done = [state["done"][cid] for cid in bounds]
+    merged = {
+        "sum_abs": np.sum([np.array(d["sum_abs"]) for d in done], axis=0),
+        "sum_row": np.sum([np.array(d["sum_row"]) for d in done], axis=0),
+        "sum_row_sq": np.sum([np.array(d["sum_row_sq"]) for d in done], axis=0),
+        "rows": sum(d["rows"] for d in done),
+        "by_tier": {},
+    }
+    for d in done:
+        for tier, (sums, count) in d["by_tier"].items():
+            acc = merged["by_tier"].setdefault(tier, [np.zeros(len(FEATURES)), 0])
+            acc[0] += np.array(sums)
+            acc[1] += count
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Global SHAP feature importance")
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--by-tier", action="store_true",
+                        help=f"also write per-tier importance to {BY_TIER_PATH}")
+    parser.add_argument("--sample", type=int, default=0,
+                        help="explain only N random rows and report 95%% error bounds")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # -----------------------------
+    # Load data
+    # -----------------------------
+    df = read_frame(DATA_PATH, TIERS)
+    population = len(df)
+    if args.sample and args.sample < population:
+        df = df.sample(n=args.sample, random_state=args.seed)
+    X = df[FEATURES]
+    tiers = df["tier"].astype(str).to_numpy()
+
+    key = _run_key(
+        _file_id(DATA_PATH),
+        _file_id(MODEL_PATH),
+        args.chunk_size,
+        args.sample,
+        args.seed,
+    )
+    stats = compute(X, tiers, args.chunk_size, args.workers, key)
+
+    # -----------------------------
+    # Global Feature Importance
+    # -----------------------------
+    n_classes = stats["sum_abs"].shape[1]
+    mean_abs_shap = stats["sum_abs"].sum(axis=1) / (stats["rows"] * n_classes)
+
+    importance = pd.DataFrame({
+        "feature": FEATURES,
+        "importance": mean_abs_shap.tolist()
+    })
+
+    if args.sample and args.sample < population:
+        # Per-row importances are i.i.d. draws; finite population correction
+        n = stats["rows"]
+        var = (stats["sum_row_sq"] - n * mean_abs_shap ** 2) / max(n - 1, 1)
+        se = np.sqrt(var / n * (1 - n / population))
+        importance["ci_low"] = mean_abs_shap - 1.96 * se
+        importance["ci_high"] = mean_abs_shap + 1.96 * se
+        importance = importance.sort_values(by="importance", ascending=False)
+        importance.to_csv(SAMPLED_PATH, index=False)
+        print(f"✅ Sampled SHAP importance ({n} of {population} rows): {SAMPLED_PATH}")
+    else:
+        importance = importance.sort_values(by="importance", ascending=False)
+        importance.to_csv(OUTPUT_PATH, index=False)
+        print("✅ Global SHAP feature importance generated")
+    print(importance)
 
-sample_shap = explainer(sample)
-sample_values = sample_shap.values  # shape: (1, features, classes)
+    if args.by_tier:
+        rows = [
+            {"tier": tier, "feature": f, "importance": s / count}
+            for tier, (sums, count) in sorted(stats["by_tier"].items())
+            for f, s in zip(FEATURES, sums)
+        ]
+        pd.DataFrame(rows).to_csv(BY_TIER_PATH, index=False)
+        print(f"✅ Per-tier importance written to {BY_TIER_PATH}")
 
-predicted_class = rf.predict(sample)[0]
-class_index = list(rf.classes_).index(predicted_class)
+    # Run finished; the next one starts from scratch
+    if os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
 
-print(f"\n🔍 Local explanation for Customer {df.iloc[sample_idx]['Customer ID']}")
-print(f"Predicted Tier: {predicted_class}\n")
 
-for feature, value in zip(X.columns, sample_values[0, :, class_index]):
-    print(f"{feature}: {value:.4f}")
+if __name__ == "__main__":
+    main()
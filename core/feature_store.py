@@ -0,0 +1,273 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from core.db import lrfms_col, tiers_col
+
+# =========================================================
+# IN-MEMORY FEATURE STORE
+# =========================================================
+# Every customer's L, R, F, M, S, tier and cluster as NumPy columns sorted
+# by customer_id, plus a sorted copy of each feature for rank queries.
+# Loaded once from Mongo, then refreshed from `lrfms` / `tiers` documents
+# whose updated_at moved past the last refresh. A refresh builds new arrays
+# and swaps them in whole, so readers never lock and never see a half
+# applied update.
+#
+# updated_at is stamped by the writer before its write lands, and other
+# workers write concurrently, so each refresh re-reads the LAG_SECONDS
+# before the previous one started (applying a document twice is harmless).
+# Anything later still (a bulk load running longer than that under one
+# stamp) is picked up by a full reload every FULL_RELOAD_SECONDS.
+FEATURES = ["L", "R", "F", "M", "S"]
+TIER_ORDER = ["New", "Bronze", "Silver", "Gold", "Platinum"]
+TIER_CODE = {tier: code for code, tier in enumerate(TIER_ORDER)}
+UNKNOWN_TIER = -1
+UNKNOWN_CLUSTER = -1
+
+# Seconds between incremental refreshes triggered by reads
+REFRESH_SECONDS = float(os.environ.get("FEATURE_STORE_REFRESH_SECONDS", 30))
+# How late a write may land after its updated_at stamp
+LAG_SECONDS = float(os.environ.get("FEATURE_STORE_LAG_SECONDS", 60))
+FULL_RELOAD_SECONDS = float(os.environ.get("FEATURE_STORE_FULL_RELOAD_SECONDS", 3600))
+
+_PROJECTION = {
+    "_id": 0,
+    "customer_id": 1,
+    "updated_at": 1,
+    "cluster": 1,
+    **dict.fromkeys(FEATURES, 1),
+}
+_TIER_PROJECTION = {"_id": 0, "customer_id": 1, "tier": 1, "updated_at": 1}
+
+
+class Snapshot:
+    """Immutable view of the population at one refresh."""
+
+    def __init__(self, ids, values, tiers, clusters, sorted_columns=None):
+        self.ids = ids  # (n,) int64, sorted
+        self.values = values  # (n, 5) float64, rows aligned with ids
+        self.tiers = tiers  # (n,) int8 tier codes
+        self.clusters = clusters  # (n,) int16 GMM cluster
+        # Per-feature sorted column for rank queries
+        self.sorted = sorted_columns or {
+            f: np.sort(values[:, j]) for j, f in enumerate(FEATURES)
+        }
+        self.tier_counts = np.bincount(tiers[tiers >= 0], minlength=len(TIER_ORDER))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, customer_id):
+        i = np.searchsorted(self.ids, customer_id)
+        if i < len(self.ids) and self.ids[i] == customer_id:
+            return i
+        return None
+
+
+class FeatureStore:
+    def __init__(
+        self,
+        refresh_seconds=REFRESH_SECONDS,
+        lag_seconds=LAG_SECONDS,
+        full_reload_seconds=FULL_RELOAD_SECONDS,
+    ):
+        self.refresh_seconds = refresh_seconds
+        self.lag = timedelta(seconds=lag_seconds)
+        self.full_reload_seconds = full_reload_seconds
+        self._snapshot = None
+        self._read_from = None  # next refresh reads updated_at >= this
+        self._refreshed_at = self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------
+    # LOADING
+    # -----------------------------------------------------
+    def snapshot(self):
+        """Current snapshot, loading or refreshing it when due."""
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._full_load()
+        elif time.monotonic() - self._refreshed_at > self.refresh_seconds:
+            # One refresher at a time; everyone else keeps reading
+            if self._lock.acquire(blocking=False):
+                try:
+                    if time.monotonic() - self._loaded_at > self.full_reload_seconds:
+                        self._full_load()
+                    else:
+                        self._refresh()
+                finally:
+                    self._lock.release()
+        return self._snapshot
+
+    def _full_load(self):
+        started = datetime.utcnow()
+        lrfms_col.create_index("updated_at")
+        tiers_col.create_index("updated_at")
+
+        docs = list(lrfms_col.find({}, _PROJECTION))
+        ids = np.array([d["customer_id"] for d in docs], dtype=np.int64)
+        values, clusters = _feature_matrix(docs), _clusters(docs)
+        order = np.argsort(ids, kind="stable")
+        ids, values, clusters = ids[order], values[order], clusters[order]
+
+        tier_docs = list(tiers_col.find({}, _TIER_PROJECTION))
+        tiers = np.full(len(ids), UNKNOWN_TIER, dtype=np.int8)
+        _assign_tiers(ids, tiers, tier_docs)
+
+        self._read_from = started - self.lag
+        self._snapshot = Snapshot(ids, values, tiers, clusters)
+        self._refreshed_at = self._loaded_at = time.monotonic()
+
+    def _refresh(self):
+        """Applies lrfms/tiers documents updated since the last refresh."""
+        started = datetime.utcnow()
+        since = {"updated_at": {"$gte": self._read_from}}
+        changed = list(lrfms_col.find(since, _PROJECTION))
+        tier_docs = list(tiers_col.find(since, _TIER_PROJECTION))
+        self._read_from = started - self.lag
+        self._refreshed_at = time.monotonic()
+        if not changed and not tier_docs:
+            return
+
+        snap = self._snapshot
+        ids, values = snap.ids, snap.values.copy()
+        tiers, clusters = snap.tiers.copy(), snap.clusters.copy()
+        sorted_columns = snap.sorted
+
+        if changed:
+            # Last document per customer wins
+            new_ids = np.array([d["customer_id"] for d in changed], dtype=np.int64)
+            new_ids, last = np.unique(new_ids[::-1], return_index=True)
+            new_values = _feature_matrix(changed)[::-1][last]
+            new_clusters = _clusters(changed)[::-1][last]
+
+            pos = np.searchsorted(ids, new_ids)
+            known = np.zeros(len(new_ids), dtype=bool)
+            if len(ids):
+                known = ids[np.minimum(pos, len(ids) - 1)] == new_ids
+            old_values = values[pos[known]]
+            values[pos[known]] = new_values[known]
+            clusters[pos[known]] = new_clusters[known]
+
+            if (~known).any():
+                insert_at = pos[~known]
+                ids = np.insert(ids, insert_at, new_ids[~known])
+                values = np.insert(values, insert_at, new_values[~known], axis=0)
+                tiers = np.insert(tiers, insert_at, UNKNOWN_TIER)
+                clusters = np.insert(clusters, insert_at, new_clusters[~known])
+
+            # Patch the sorted columns instead of re-sorting the population
+            sorted_columns = {
+                f: _replace_sorted(snap.sorted[f], old_values[:, j], new_values[:, j])
+                for j, f in enumerate(FEATURES)
+            }
+
+        if tier_docs:
+            _assign_tiers(ids, tiers, tier_docs)
+
+        self._snapshot = Snapshot(ids, values, tiers, clusters, sorted_columns)
+
+    # -----------------------------------------------------
+    # QUERIES
+    # -----------------------------------------------------
+    def percentiles(self, customer_id, snap=None):
+        """
+        Share of customers (0-100) with a value at or below this customer's,
+        per feature; None when the customer is not in the store.
+        """
+        snap = snap or self.snapshot()
+        i = snap.row(customer_id)
+        if i is None:
+            return None
+        return {
+            f: 100.0
+            * np.searchsorted(snap.sorted[f], snap.values[i, j], "right")
+            / len(snap)
+            for j, f in enumerate(FEATURES)
+        }
+
+    def histogram(self, feature, bins=20, log=False):
+        """(counts, edges) of one feature over the population."""
+        column = self.snapshot().sorted[feature]
+        if log:
+            column = np.log1p(np.clip(column, 0, None))
+        return np.histogram(column, bins=bins)
+
+    def tier_distribution(self, snap=None):
+        """{tier: (count, share)} over customers with a known tier."""
+        counts = (snap or self.snapshot()).tier_counts
+        total = max(int(counts.sum()), 1)
+        return {
+            tier: (int(counts[code]), counts[code] / total)
+            for code, tier in enumerate(TIER_ORDER)
+        }
+
+    def position(self, customer_id):
+        """Percentiles plus tier share, for the admin snapshot."""
+        snap = self.snapshot()
+        pct = self.percentiles(customer_id, snap)
+        if pct is None:
+            return None
+        return {
+            "population": len(snap),
+            "percentiles": pct,
+            "tiers": self.tier_distribution(snap),
+        }
+
+
+def _feature_matrix(docs):
+    return np.array(
+        [[float(d.get(f) or 0) for f in FEATURES] for d in docs], dtype=np.float64
+    ).reshape(-1, len(FEATURES))
+
+
+def _clusters(docs):
+    return np.array(
+        [UNKNOWN_CLUSTER if d.get("cluster") is None else d["cluster"] for d in docs],
+        dtype=np.int16,
+    )
+
+
+def _replace_sorted(column, removed, added):
+    """
+    `column` (sorted) with one occurrence of each `removed` value taken out
+    and `added` merged in; O(n) memory moves instead of an O(n log n) sort.
+    """
+    removed, added = np.sort(removed), np.sort(added)
+    if len(removed):
+        # The k-th duplicate of a value removes the k-th slot holding it
+        first = np.searchsorted(column, removed, "left")
+        rank = np.arange(len(removed)) - np.searchsorted(removed, removed, "left")
+        column = np.delete(column, first + rank)
+    return np.insert(column, np.searchsorted(column, added), added)
+
+
+def _assign_tiers(ids, tiers, tier_docs):
+    if not len(ids) or not tier_docs:
+        return
+    doc_ids = np.array([d["customer_id"] for d in tier_docs], dtype=np.int64)
+    codes = np.array(
+        [TIER_CODE.get(d.get("tier"), UNKNOWN_TIER) for d in tier_docs], dtype=np.int8
+    )
+    pos = np.minimum(np.searchsorted(ids, doc_ids), len(ids) - 1)
+    hit = ids[pos] == doc_ids
+    tiers[pos[hit]] = codes[hit]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_feature_store():
+    """The process-wide feature store (loaded on first query)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FeatureStore()
+    return _store
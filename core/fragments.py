@@ -0,0 +1,132 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from core.db import versions_col
+
+# =========================================================
+# RENDERED-FRAGMENT CACHE
+# =========================================================
+# Parts of a page that are identical for everyone looking at the same data
+# (the shop's product grid for a category/page, the category nav, the admin
+# customer picker) are rendered once per worker and reused. Keys carry the
+# version of the data they were rendered from, so bumping the version is
+# the invalidation: data/raw/program.py bumps "catalog" after a sync and
+# add_customer bumps "customers". Old entries age out of the LRU.
+#
+# Versions are read from the `versions` collection at most every
+# VERSION_TTL_SECONDS per worker, so other workers pick up a bump within
+# that window.
+MAX_ENTRIES = int(os.environ.get("FRAGMENT_CACHE_SIZE", 512))
+VERSION_TTL_SECONDS = float(os.environ.get("VERSION_TTL_SECONDS", 5))
+
+TEMPLATES_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates"
+)
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered HTML keyed by tuples."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (html, rendered_at monotonic)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, max_age=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (
+                max_age is not None and time.monotonic() - entry[1] > max_age
+            ):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, html):
+        with self._lock:
+            self._entries[key] = (html, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key, render, max_age=None):
+        """(html, hit). `render` runs outside the lock on a miss."""
+        html = self.get(key, max_age)
+        if html is not None:
+            return html, True
+        html = render()
+        self.put(key, html)
+        return html, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+fragments = FragmentCache()
+
+
+# =========================================================
+# DATA VERSIONS
+# =========================================================
+_versions = {}  # name -> (version, updated_at, read_at)
+_versions_lock = threading.Lock()
+
+
+def version(name):
+    """(version, updated_at) of a named dataset; (0, None) if never bumped."""
+    cached = _versions.get(name)
+    if cached and time.monotonic() - cached[2] < VERSION_TTL_SECONDS:
+        return cached[0], cached[1]
+    doc = versions_col.find_one({"_id": name}) or {}
+    value = (doc.get("version", 0), doc.get("updated_at"))
+    with _versions_lock:
+        _versions[name] = (*value, time.monotonic())
+    return value
+
+
+def bump(name):
+    """Marks a dataset changed; cached fragments keyed on it stop matching."""
+    versions_col.update_one(
+        {"_id": name},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
+    with _versions_lock:
+        _versions.pop(name, None)
+
+
+# =========================================================
+# VALIDATORS (ETag / Last-Modified)
+# =========================================================
+_build_id = None
+
+
+def build_id():
+    """Changes with the deployed templates (or APP_BUILD_ID when set)."""
+    global _build_id
+    if _build_id is None:
+        mtimes = [
+            os.path.getmtime(os.path.join(root, name))
+            for root, _, files in os.walk(TEMPLATES_DIR)
+            for name in files
+        ]
+        _build_id = os.environ.get("APP_BUILD_ID") or str(int(max(mtimes, default=0)))
+    return _build_id
+
+
+def etag(*parts):
+    """Validator over everything a response was rendered from."""
+    payload = "\x1f".join(map(str, (build_id(), *parts)))
+    return hashlib.sha1(payload.encode()).hexdigest()[:32]
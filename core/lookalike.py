@@ -0,0 +1,269 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from core.clustering import FEATURES, load_cluster_pipeline
+
+# =========================================================
+# LOOKALIKE SEARCH
+# =========================================================
+# A KD-tree over standardized L, R, F, M, S. The scaling is the
+# StandardScaler fitted by decision_engine (models/gmm_pipeline.pkl), so
+# "distance" means the same thing as it does to the GMM clustering.
+#
+# The tree is built in batch (python -m core.lookalike build) or from the
+# feature store on first use. Customers whose LRFMS changed since then, or
+# who are new, go to a delta buffer that is searched exhaustively and
+# merged with the tree results; their stale tree rows are masked out. Once
+# the delta passes REBUILD_FRACTION of the index the tree is rebuilt.
+INDEX_PATH = "models/lookalike_index.pkl"
+CSV_SOURCE = "data/processed/customer_tiers.csv"
+
+LEAF_SIZE = 40
+REBUILD_FRACTION = 0.05
+# Filters leaving at most this many candidates are answered by brute force
+BRUTE_FORCE_LIMIT = 50000
+
+
+def scaling(values):
+    """(mean, scale) of decision_engine's scaler, else fitted on `values`."""
+    pipeline = load_cluster_pipeline()
+    if pipeline is not None:
+        scaler = pipeline.named_steps["scaler"]
+        return scaler.mean_.astype(np.float64), scaler.scale_.astype(np.float64)
+    mean, std = values.mean(axis=0), values.std(axis=0)
+    return mean, np.where(std > 0, std, 1.0)
+
+
+def build_index(ids, values):
+    """Batch build: the tree plus the rows it was built from."""
+    from sklearn.neighbors import KDTree
+
+    order = np.argsort(ids, kind="stable")
+    ids = np.asarray(ids, dtype=np.int64)[order]
+    values = np.asarray(values, dtype=np.float64)[order]
+    mean, scale = scaling(values)
+    return {
+        "ids": ids,
+        "values": values,
+        "mean": mean,
+        "scale": scale,
+        "tree": KDTree((values - mean) / scale, leaf_size=LEAF_SIZE),
+        "built_at": time.time(),
+    }
+
+
+def save_index(index, path=INDEX_PATH):
+    import joblib
+
+    tmp_path = path + ".tmp"
+    joblib.dump(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_index(path=INDEX_PATH):
+    import joblib
+
+    return joblib.load(path) if os.path.exists(path) else None
+
+
+class LookalikeSearch:
+    """Index + delta buffer over the live feature store snapshot."""
+
+    def __init__(self, store, index=None):
+        self.store = store
+        self._index = index
+        self._delta = None  # (snapshot, state) of the last delta computation
+        self._lock = threading.Lock()
+
+    def _state(self):
+        """Index and its delta against the current snapshot."""
+        snap = self.store.snapshot()
+        delta = self._delta
+        if delta is not None and delta[0] is snap:
+            return snap, delta[1]
+
+        with self._lock:
+            if self._index is None:
+                self._index = build_index(snap.ids, snap.values)
+            state = _diff(self._index, snap)
+            if len(state["delta_rows"]) > REBUILD_FRACTION * max(len(snap), 1):
+                self._index = build_index(snap.ids, snap.values)
+                state = _diff(self._index, snap)
+            self._delta = (snap, state)
+        return snap, state
+
+    def query(self, customer_id, k=50, tier=None, cluster=None):
+        """
+        The k customers nearest to `customer_id`, optionally restricted to
+        one tier and/or cluster: [{customer_id, distance, tier, cluster, L..S}].
+        None when the customer is unknown.
+        """
+        from core.feature_store import TIER_CODE
+
+        snap, state = self._state()
+        index = state["index"]
+        row = snap.row(customer_id)
+        if row is None:
+            return None
+        target = (snap.values[row] - index["mean"]) / index["scale"]
+
+        allowed = np.ones(len(snap), dtype=bool)  # over snapshot rows
+        if tier is not None:
+            allowed &= snap.tiers == TIER_CODE.get(tier, -2)
+        if cluster is not None:
+            allowed &= snap.clusters == int(cluster)
+        allowed[row] = False
+
+        if tier is not None or cluster is not None:
+            candidates = np.flatnonzero(allowed)
+            if len(candidates) <= BRUTE_FORCE_LIMIT:
+                return self._rows(snap, *_nearest(snap, index, target, candidates, k))
+
+        # Tree rows: current, allowed; widen the search until k survive
+        usable = state["tree_ok"] & allowed[state["tree_to_snap"]]
+        n_tree = len(index["ids"])
+        found_rows, found_dist = np.empty(0, np.int64), np.empty(0)
+        fetch = min(n_tree, 4 * k)
+        while fetch:
+            dist, idx = index["tree"].query(target[None, :], k=fetch)
+            keep = usable[idx[0]]
+            found_rows = state["tree_to_snap"][idx[0][keep]]
+            found_dist = dist[0][keep]
+            if len(found_rows) >= k or fetch == n_tree:
+                break
+            fetch = min(n_tree, fetch * 4)
+
+        delta = state["delta_rows"][allowed[state["delta_rows"]]]
+        delta_rows, delta_dist = _nearest(snap, index, target, delta, k)
+
+        rows = np.concatenate([found_rows, delta_rows])
+        dist = np.concatenate([found_dist, delta_dist])
+        order = np.argsort(dist, kind="stable")[:k]
+        return self._rows(snap, rows[order], dist[order])
+
+    @staticmethod
+    def _rows(snap, rows, dist):
+        from core.feature_store import TIER_ORDER
+
+        return [
+            {
+                "customer_id": int(snap.ids[r]),
+                "distance": float(d),
+                "tier": TIER_ORDER[snap.tiers[r]] if snap.tiers[r] >= 0 else None,
+                "cluster": int(snap.clusters[r]) if snap.clusters[r] >= 0 else None,
+                **{f: float(v) for f, v in zip(FEATURES, snap.values[r])},
+            }
+            for r, d in zip(rows, dist)
+        ]
+
+
+def _diff(index, snap):
+    """
+    Which tree rows still match the snapshot, where they sit in it, and
+    which snapshot rows (new or changed) only the delta buffer can answer.
+    """
+    ids = index["ids"]
+    if len(snap) == 0 or len(ids) == 0:
+        return {
+            "index": index,
+            "tree_ok": np.zeros(len(ids), dtype=bool),
+            "tree_to_snap": np.zeros(len(ids), dtype=np.int64),
+            "delta_rows": np.arange(len(snap)),
+        }
+    pos = np.minimum(np.searchsorted(snap.ids, ids), len(snap) - 1)
+    tree_ok = (snap.ids[pos] == ids) & (snap.values[pos] == index["values"]).all(axis=1)
+    covered = np.zeros(len(snap), dtype=bool)
+    covered[pos[tree_ok]] = True
+    return {
+        "index": index,
+        "tree_ok": tree_ok,
+        "tree_to_snap": pos,
+        "delta_rows": np.flatnonzero(~covered),
+    }
+
+
+def _nearest(snap, index, target, rows, k):
+    """Exhaustive k nearest among snapshot `rows`."""
+    if len(rows) == 0:
+        return np.empty(0, np.int64), np.empty(0)
+    scaled = (snap.values[rows] - index["mean"]) / index["scale"]
+    dist = np.sqrt(((scaled - target) ** 2).sum(axis=1))
+    top = np.argsort(dist, kind="stable")[:k]
+    return rows[top], dist[top]
+
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_lookalike_search():
+    """Process-wide search over the feature store; loads INDEX_PATH if built."""
+    global _search
+    if _search is None:
+        with _search_lock:
+            if _search is None:
+                from core.feature_store import get_feature_store
+
+                _search = LookalikeSearch(get_feature_store(), load_index())
+    return _search
+
+
+# =========================================================
+# BATCH BUILD
+# =========================================================
+def _source_frame(source):
+    if source == "csv":
+        from core.schema import TIERS, read_frame
+
+        df = read_frame(CSV_SOURCE, TIERS, columns=["Customer ID", *FEATURES])
+        return df["Customer ID"].to_numpy(), df[FEATURES].to_numpy(np.float64)
+
+    from core.feature_store import FeatureStore
+
+    snap = FeatureStore().snapshot()
+    return snap.ids, snap.values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lookalike customer index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help=f"build and save {INDEX_PATH}")
+    build.add_argument("--source", choices=("mongo", "csv"), default="mongo")
+    query = sub.add_parser("query", help="nearest customers to one customer")
+    query.add_argument("customer_id", type=int)
+    query.add_argument("--k", type=int, default=50)
+    query.add_argument("--tier")
+    query.add_argument("--cluster", type=int)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        ids, values = _source_frame(args.source)
+        save_index(build_index(ids, values))
+        print(
+            f"✅ Lookalike index over {len(ids):,} customers saved to {INDEX_PATH} "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        return
+
+    start = time.perf_counter()
+    results = get_lookalike_search().query(
+        args.customer_id, args.k, args.tier, args.cluster
+    )
+    if results is None:
+        print(f"❌ Customer {args.customer_id} not found")
+        return
+    for r in results:
+        print(
+            f"{r['customer_id']:>10}  d={r['distance']:.3f}  {r['tier'] or '-':<9}"
+            f" cluster={r['cluster']}  " + " ".join(f"{f}={r[f]:g}" for f in FEATURES)
+        )
+    print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
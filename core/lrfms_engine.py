@@ -1,11 +1,23 @@
-import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 
+from core.schema import (
+    LRFMS,
+    TRANSACTIONS,
+    apply_schema,
+    read_frame,
+    report_memory,
+    validate,
+)
+
 # -----------------------------
 # Load cleaned transaction data
 # -----------------------------
-df = pd.read_csv("data/processed/transactions_clean.csv")
-df["InvoiceDate"] = pd.to_datetime(df["InvoiceDate"])
+df = read_frame(
+    "data/processed/transactions_clean.csv",
+    TRANSACTIONS,
+    columns=["Customer ID", "Invoice", "InvoiceDate", "TotalAmount"],
+)
+report_memory("lrfms_engine", transactions=df)
 
 # -----------------------------
 # Reference date for Recency
@@ -21,6 +33,7 @@ lrfm = df.groupby("Customer ID").agg(
     frequency=("Invoice", "nunique"),
     monetary=("TotalAmount", "sum"),
 ).reset_index()
+del df
 
 # -----------------------------
 # Compute L, R, F, M
@@ -46,7 +59,11 @@ lrfm["S"] = (0.6 * lrfm["F_norm"]) + (0.4 * (1 - lrfm["R_norm"]))
 # -----------------------------
 # Final LRFMS dataset
 # -----------------------------
-lrfms = lrfm[["Customer ID", "L", "R", "F", "M", "S"]]
+lrfms = validate(
+    apply_schema(lrfm[["Customer ID", "L", "R", "F", "M", "S"]].copy(), LRFMS),
+    LRFMS,
+    name="customer_lrfms",
+)
 
 # -----------------------------
 # Save output
@@ -54,4 +71,5 @@ lrfms = lrfm[["Customer ID", "L", "R", "F", "M", "S"]]
 lrfms.to_csv("data/processed/customer_lrfms.csv", index=False)
 
 print("✅ Phase 2 completed: LRFMS features generated")
+report_memory("lrfms_engine", lrfms=lrfms)
 print(lrfms.head())
@@ -0,0 +1,98 @@
+import contextlib
+import os
+import resource
+import threading
+import time
+
+# =========================================================
+# PROCESS METRICS (COLD START & MEMORY)
+# =========================================================
+_started = time.monotonic()
+_timings = {}
+_timings_lock = threading.Lock()
+# name -> [count, total seconds, max seconds], e.g. per-endpoint request and
+# template render time
+_observed = {}
+
+
+def reset_clock():
+    """Restarts the uptime clock, e.g. in a freshly forked worker."""
+    global _started
+    _started = time.monotonic()
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Records how long the block took under `name` (seconds)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def record(name, seconds):
+    with _timings_lock:
+        _timings[name] = round(seconds, 4)
+
+
+def observe(name, seconds):
+    """Adds one sample to the running count/total/max under `name`."""
+    with _timings_lock:
+        stats = _observed.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+
+def memory():
+    """
+    Resident memory of this process in MB. On Linux, `pss` splits shared
+    pages between the processes mapping them, so summing it across workers
+    gives their real footprint; `shared` is what they share with the master.
+    """
+    stats = {"peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+    try:
+        with open("/proc/self/smaps_rollup") as fh:
+            rollup = dict(
+                (line.split(":")[0], int(line.split()[1]))
+                for line in fh
+                if line.endswith("kB\n")
+            )
+    except OSError:
+        return stats
+    stats.update(
+        rss=rollup["Rss"] / 1024,
+        pss=rollup["Pss"] / 1024,
+        shared=(rollup["Shared_Clean"] + rollup["Shared_Dirty"]) / 1024,
+        private=(rollup["Private_Clean"] + rollup["Private_Dirty"]) / 1024,
+    )
+    return stats
+
+
+def snapshot():
+    with _timings_lock:
+        timings = dict(_timings)
+        observed = {
+            name: {
+                "count": n,
+                "mean_ms": round(total / n * 1000, 2),
+                "max_ms": round(peak * 1000, 2),
+            }
+            for name, (n, total, peak) in sorted(_observed.items())
+        }
+    return {
+        "pid": os.getpid(),
+        "uptime_s": round(time.monotonic() - _started, 1),
+        "timings_s": timings,
+        "requests": observed,
+        "memory_mb": {k: round(v, 1) for k, v in memory().items()},
+    }
+
+
+def summary(label):
+    """One log line: timings and memory of this process."""
+    snap = snapshot()
+    timings = ", ".join(f"{k} {v:.2f}s" for k, v in snap["timings_s"].items())
+    mem = ", ".join(f"{k} {v:.0f}" for k, v in snap["memory_mb"].items())
+    return f"[{label} {snap['pid']}] {timings or 'no timings'} | MB: {mem}"
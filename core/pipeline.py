@@ -0,0 +1,430 @@
+import argparse
+import ast
+import csv
+import hashlib
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+# =========================================================
+# STAGES
+# =========================================================
+# Every stage declares the files it reads and writes (relative to the
+# workdir). Dependencies are derived from those declarations in order:
+# a stage waits for any earlier stage that writes one of its inputs, reads
+# one of its outputs, or writes the same file. That keeps auto_reassign,
+# which rewrites the tier/intelligence CSVs in place, behind the stages
+# still reading them, while SHAP and risk analysis run side by side.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATE_PATH = "data/processed/.pipeline_state.json"
+REPORT_PATH = "data/processed/pipeline_report.csv"
+LOG_DIR = "data/processed/pipeline_logs"
+
+PROCESSED = "data/processed"
+STAGES = [
+    {
+        "name": "load_and_clean",
+        "cmd": ["load_and_clean.py"],
+        "code": "data/load_and_clean.py",
+        "cwd": "data",
+        "inputs": ["data/raw/online_retail.xlsx"],
+        "outputs": [
+            f"{PROCESSED}/transactions_clean.csv",
+            f"{PROCESSED}/transactions_clean.parquet",
+        ],
+    },
+    {
+        "name": "lrfms_engine",
+        "cmd": ["-m", "core.lrfms_engine"],
+        "code": "core/lrfms_engine.py",
+        "inputs": [
+            f"{PROCESSED}/transactions_clean.csv",
+            f"{PROCESSED}/transactions_clean.parquet",
+        ],
+        "outputs": [f"{PROCESSED}/customer_lrfms.csv"],
+    },
+    {
+        "name": "decision_engine",
+        "cmd": ["-m", "core.decision_engine"],
+        "code": "core/decision_engine.py",
+        "inputs": [f"{PROCESSED}/customer_lrfms.csv"],
+        "outputs": [
+            f"{PROCESSED}/customer_clusters.csv",
+            f"{PROCESSED}/customer_tiers.csv",
+            "models/gmm_pipeline.pkl",
+            "models/rf_model.pkl",
+            "models/rf_holdout.csv",
+        ],
+    },
+    {
+        "name": "drift_reference",
+        "cmd": ["-m", "core.drift", "reference"],
+        "code": "core/drift.py",
+        "inputs": [
+            f"{PROCESSED}/customer_lrfms.csv",
+            "models/rf_model.pkl",
+            "models/rf_holdout.csv",
+        ],
+        "outputs": ["models/drift_reference.json"],
+    },
+    {
+        "name": "behavior_analyzer",
+        "cmd": ["-m", "core.behavior_analyzer"],
+        "code": "core/behavior_analyzer.py",
+        "inputs": [f"{PROCESSED}/customer_tiers.csv"],
+        "outputs": [f"{PROCESSED}/customer_intelligence.csv"],
+    },
+    {
+        "name": "explainability",
+        "cmd": ["-m", "core.explainability"],
+        "code": "core/explainability.py",
+        "inputs": [f"{PROCESSED}/customer_tiers.csv", "models/rf_model.pkl"],
+        "outputs": [f"{PROCESSED}/global_feature_importance.csv"],
+    },
+    {
+        "name": "auto_reassign",
+        "cmd": ["-m", "core.auto_reassign"],
+        "code": "core/auto_reassign.py",
+        "inputs": [
+            f"{PROCESSED}/event_log.csv",
+            f"{PROCESSED}/customer_lrfms.csv",
+            f"{PROCESSED}/customer_tiers.csv",
+            f"{PROCESSED}/customer_intelligence.csv",
+            f"{PROCESSED}/tier_transition_log.csv",
+            "models/gmm_pipeline.pkl",
+            "models/rf_model.pkl",
+        ],
+        "outputs": [
+            f"{PROCESSED}/customer_lrfms.csv",
+            f"{PROCESSED}/customer_tiers.csv",
+            f"{PROCESSED}/customer_intelligence.csv",
+            f"{PROCESSED}/tier_transition_log.csv",
+        ],
+        "env": ["SERVING_MODEL"],
+    },
+]
+
+
+def dependencies(stages):
+    """{stage: set(upstream stages)} from the declared inputs/outputs."""
+    deps = {}
+    for i, stage in enumerate(stages):
+        reads, writes = set(stage["inputs"]), set(stage["outputs"])
+        deps[stage["name"]] = {
+            earlier["name"]
+            for earlier in stages[:i]
+            if set(earlier["outputs"]) & (reads | writes)
+            or set(earlier["inputs"]) & writes
+        }
+    return deps
+
+
+def code_files(path, seen=None):
+    """The stage script plus every core.* module it imports, transitively."""
+    seen = set() if seen is None else seen
+    if path in seen or not os.path.exists(os.path.join(REPO_ROOT, path)):
+        return seen
+    seen.add(path)
+    with open(os.path.join(REPO_ROOT, path)) as fh:
+        tree = ast.parse(fh.read(), filename=path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module:
+            names = [node.module]
+        elif isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        else:
+            continue
+        for name in names:
+            if name.startswith("core."):
+                code_files(name.replace(".", "/") + ".py", seen)
+    return seen
+
+
+# =========================================================
+# CONTENT FINGERPRINTS
+# =========================================================
+class FileHasher:
+    """
+    sha256 of file contents, memoised on (size, mtime) across runs so large
+    CSVs are only re-read when they actually changed on disk.
+    """
+
+    def __init__(self, memo):
+        self.memo = memo
+
+    def __call__(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = [stat.st_size, stat.st_mtime_ns]
+        cached = self.memo.get(path)
+        if cached and cached[:2] == key:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(block)
+        self.memo[path] = key + [digest.hexdigest()]
+        return digest.hexdigest()
+
+
+def fingerprint(stage, workdir, hasher, extra_args):
+    digest = hashlib.sha256()
+    parts = [("cmd", " ".join(stage["cmd"] + extra_args))]
+    parts += [
+        (f"code:{path}", hasher(os.path.join(REPO_ROOT, path)))
+        for path in sorted(code_files(stage["code"]))
+    ]
+    parts += [
+        (f"in:{path}", hasher(os.path.join(workdir, path))) for path in stage["inputs"]
+    ]
+    parts += [(f"env:{name}", os.environ.get(name)) for name in stage.get("env", [])]
+    for name, value in parts:
+        digest.update(f"{name}={value}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def output_hashes(stage, workdir, hasher):
+    return {path: hasher(os.path.join(workdir, path)) for path in stage["outputs"]}
+
+
+def is_fresh(stage, workdir, hasher, state, fp):
+    """Same inputs and code as the last recorded run, outputs untouched."""
+    record = state["stages"].get(stage["name"])
+    if not record or record["fingerprint"] != fp:
+        return False
+    return output_hashes(stage, workdir, hasher) == record["outputs"]
+
+
+def unavailable_inputs(stage, workdir, stages, produced, kept):
+    """
+    Inputs the stage cannot get: absent external files (not written by any
+    stage), or files from an upstream stage that was kept as-is because its
+    own source is absent, when none of that stage's files exist either.
+    """
+    exists = lambda path: os.path.exists(os.path.join(workdir, path))  # noqa: E731
+    missing = [p for p in stage["inputs"] if p not in produced and not exists(p)]
+    for other in stages:
+        if other["name"] in kept:
+            wanted = [p for p in stage["inputs"] if p in other["outputs"]]
+            if wanted and not any(exists(p) for p in wanted):
+                missing += wanted
+    return missing
+
+
+def load_state(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"stages": {}, "files": {}}
+
+
+def save_state(path, state):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(state, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+# =========================================================
+# RUNNER
+# =========================================================
+def launch(stage, workdir, extra_args):
+    log_path = os.path.join(workdir, LOG_DIR, f"{stage['name']}.log")
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(
+            [sys.executable, *stage["cmd"], *extra_args],
+            cwd=os.path.join(workdir, stage.get("cwd", ".")),
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    return proc, log_path
+
+
+def run(stages, workdir=".", jobs=2, force=(), stage_args=None, dry_run=False):
+    """
+    Runs stale stages in dependency order, up to `jobs` at a time.
+
+    A stage is skipped when its fingerprint (code, arguments and input
+    contents) matches the last successful run and its outputs are the ones
+    that run left behind. After the run every completed stage is recorded
+    against the files as they are now, so in-place updates made by later
+    stages (auto_reassign) don't force their upstream to run again.
+    Returns the per-stage report rows.
+    """
+    workdir = os.path.abspath(workdir)
+    stage_args = stage_args or {}
+    state_path = os.path.join(workdir, STATE_PATH)
+    state = load_state(state_path)
+    hasher = FileHasher(state["files"])
+    deps = dependencies(stages)
+    produced = {path for stage in stages for path in stage["outputs"]}
+    os.makedirs(os.path.join(workdir, LOG_DIR), exist_ok=True)
+
+    pending = [stage["name"] for stage in stages]
+    by_name = {stage["name"]: stage for stage in stages}
+    status, report, running = {}, {}, {}
+
+    def settle(name, outcome, **stats):
+        status[name] = outcome
+        report[name] = {"stage": name, "status": outcome, **stats}
+
+    while pending or running:
+        for name in list(pending):
+            if len(running) >= jobs:
+                break
+            upstream = [status.get(d) for d in deps[name]]
+            if any(s in ("failed", "blocked") for s in upstream):
+                pending.remove(name)
+                settle(name, "blocked")
+                continue
+            if not all(s in ("ran", "cached", "kept", "would run") for s in upstream):
+                continue
+
+            pending.remove(name)
+            stage, extra = by_name[name], shlex.split(stage_args.get(name, ""))
+            fp = fingerprint(stage, workdir, hasher, extra)
+            # In a dry run, a stage is stale if an upstream that would run
+            # writes one of its inputs
+            stale_upstream = any(
+                status[d] == "would run"
+                and set(by_name[d]["outputs"]) & set(stage["inputs"])
+                for d in deps[name]
+            )
+            kept = {n for n, s in status.items() if s == "kept"}
+            missing = unavailable_inputs(stage, workdir, stages, produced, kept)
+
+            # A stage whose raw source is absent (e.g. the retail workbook is
+            # not checked out) keeps whatever outputs are already there.
+            if missing and (
+                not produced & set(missing)
+                or any(
+                    os.path.exists(os.path.join(workdir, p)) for p in stage["outputs"]
+                )
+            ):
+                print(f"⚠️  {name}: {', '.join(missing)} not found, keeping outputs")
+                settle(name, "kept")
+            elif missing:
+                print(f"❌ {name}: missing {', '.join(missing)}")
+                settle(name, "failed")
+            elif (
+                name not in force
+                and not stale_upstream
+                and is_fresh(stage, workdir, hasher, state, fp)
+            ):
+                print(f"⏭️  {name}: up to date ({fp})")
+                settle(name, "cached")
+            elif dry_run:
+                print(f"▶️  {name}: would run")
+                settle(name, "would run")
+            else:
+                # Keep the Popen: a dropped one is reaped by the next
+                # Popen() call's cleanup, stealing its exit status from wait4
+                proc, log_path = launch(stage, workdir, extra)
+                running[proc.pid] = (name, time.perf_counter(), log_path, proc)
+                print(f"▶️  {name}: started")
+
+        if not running:
+            break
+
+        pid, wait_status, usage = os.wait4(-1, 0)
+        if pid not in running:
+            continue
+        name, started, log_path, proc = running.pop(pid)
+        proc.returncode = os.waitstatus_to_exitcode(wait_status)  # reaped here
+        stats = {
+            "wall_s": round(time.perf_counter() - started, 2),
+            "cpu_s": round(usage.ru_utime + usage.ru_stime, 2),
+            "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        }
+        if proc.returncode == 0:
+            settle(name, "ran", **stats)
+            print(
+                f"✅ {name}: {stats['wall_s']:.1f}s wall, {stats['cpu_s']:.1f}s cpu, "
+                f"{stats['peak_rss_mb']:.0f} MB peak"
+            )
+        else:
+            settle(name, "failed", **stats)
+            print(f"❌ {name} failed, see {os.path.relpath(log_path, workdir)}")
+
+    if not dry_run:
+        for name, outcome in status.items():
+            if outcome in ("ran", "cached"):
+                stage = by_name[name]
+                extra = shlex.split(stage_args.get(name, ""))
+                state["stages"][name] = {
+                    "fingerprint": fingerprint(stage, workdir, hasher, extra),
+                    "outputs": output_hashes(stage, workdir, hasher),
+                }
+        save_state(state_path, state)
+
+    return [report[s["name"]] for s in stages if s["name"] in report]
+
+
+def write_report(rows, path):
+    fields = ["stage", "status", "wall_s", "cpu_s", "peak_rss_mb"]
+    with open(path, "w", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_report(rows):
+    print(f"\n{'stage':<18}{'status':<11}{'wall s':>9}{'cpu s':>9}{'peak MB':>9}")
+    for row in rows:
+        print(
+            f"{row['stage']:<18}{row['status']:<11}"
+            f"{row.get('wall_s', ''):>9}{row.get('cpu_s', ''):>9}"
+            f"{row.get('peak_rss_mb', ''):>9}"
+        )
+
+
+def main():
+    names = [stage["name"] for stage in STAGES]
+    parser = argparse.ArgumentParser(description="Batch pipeline runner")
+    parser.add_argument("--workdir", default=".", help="root holding data/, models/")
+    parser.add_argument("--jobs", type=int, default=2, help="stages run in parallel")
+    parser.add_argument(
+        "--only", nargs="+", choices=names, help="restrict the run to these stages"
+    )
+    parser.add_argument(
+        "--force",
+        nargs="*",
+        choices=names,
+        help="rerun these stages (all when given without names)",
+    )
+    parser.add_argument(
+        "--args",
+        action="append",
+        default=[],
+        metavar="STAGE=ARGS",
+        help='extra arguments, e.g. --args "explainability=--by-tier"',
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    stage_args = dict(item.split("=", 1) for item in args.args)
+    stages = [s for s in STAGES if not args.only or s["name"] in args.only]
+    force = names if args.force == [] else (args.force or ())
+
+    start = time.perf_counter()
+    rows = run(stages, args.workdir, args.jobs, force, stage_args, args.dry_run)
+    print_report(rows)
+    print(f"Elapsed: {time.perf_counter() - start:.1f}s")
+
+    if not args.dry_run:
+        write_report(rows, os.path.join(args.workdir, REPORT_PATH))
+    if any(row["status"] in ("failed", "blocked") for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+import argparse
+import bisect
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from core.db import products_col
+from core.fragments import version
+
+# =========================================================
+# PRODUCT SEARCH (IN-PROCESS INVERTED INDEX)
+# =========================================================
+# Product names and categories are split into lowercase terms. Each term's
+# postings (product rows and a field weight: name 1.0, category 0.5) are
+# stored as numpy arrays in CSR layout over a sorted vocabulary. A query
+# term matches its exact term, other terms within one edit (insert, delete,
+# substitute or swap, for terms of FUZZY_MIN_LEN+ letters) and, for the
+# last query term only, every term it is a prefix of (search as you type).
+#
+# The results are the products that match the most query terms. They are
+# ranked by relevance (sum of idf x field weight x match quality) scaled by
+# popularity, then paginated. Only the requested page is fetched from
+# Mongo. The index is rebuilt in the background when the "catalog" version
+# changes (core/fragments.py); queries keep using the old index meanwhile.
+# gunicorn builds the first index before forking (ProductSearch.warm). A
+# failed build is not retried for REBUILD_BACKOFF_SECONDS.
+#
+#   python -m core.product_search query "clasic lam"
+#   python -m core.product_search bench --csv bench/data/500k/products.csv
+NAME_WEIGHT, CATEGORY_WEIGHT = 1.0, 0.5
+EXACT, PREFIX, FUZZY = 1.0, 0.8, 0.6
+POPULARITY_WEIGHT = 0.5  # a max-popularity product scores up to 1.5x
+FUZZY_MIN_LEN = 4
+MAX_PREFIX_TERMS = 64  # most frequent completions of the last query term
+MAX_QUERY_TERMS = 8
+PER_PAGE = 10
+REBUILD_BACKOFF_SECONDS = int(os.environ.get("PRODUCT_INDEX_RETRY_SECONDS", 30))
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _TOKEN.findall(str(text or "").lower())
+
+
+def _deletes(term):
+    return {term[:i] + term[i + 1 :] for i in range(len(term))}
+
+
+def _one_edit(a, b):
+    """Whether a and b differ by one insert, delete, substitution or swap."""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1 :]
+    return a[i + 1 :] == b[i + 1 :] or (
+        i + 1 < len(a)
+        and a[i] == b[i + 1]
+        and a[i + 1] == b[i]
+        and a[i + 2 :] == b[i + 2 :]
+    )
+
+
+class ProductIndex:
+    def __init__(self, products):
+        """`products`: iterable of dicts with product_id, product_name,
+        category and popularity."""
+        ids, popularity, categories = [], [], []
+        term_ids, post_terms, post_docs, post_weights = {}, [], [], []
+        for row, p in enumerate(products):
+            ids.append(p["product_id"])
+            popularity.append(float(p.get("popularity") or 0))
+            categories.append(p.get("category") or "")
+            fields = {t: CATEGORY_WEIGHT for t in tokenize(p.get("category"))}
+            fields.update((t, NAME_WEIGHT) for t in tokenize(p.get("product_name")))
+            for term, weight in fields.items():
+                post_terms.append(term_ids.setdefault(term, len(term_ids)))
+                post_docs.append(row)
+                post_weights.append(weight)
+
+        # Vocabulary in sorted order, so a prefix is a contiguous range
+        self.vocab = sorted(term_ids)
+        rank = np.empty(len(term_ids), dtype=np.int64)
+        rank[[term_ids[t] for t in self.vocab]] = np.arange(len(self.vocab))
+        terms = rank[np.asarray(post_terms, dtype=np.int64)]
+        order = np.argsort(terms, kind="stable")
+        self.docs = np.asarray(post_docs, dtype=np.int32)[order]
+        self.weights = np.asarray(post_weights, dtype=np.float32)[order]
+        df = np.bincount(terms, minlength=len(self.vocab))
+        self.offsets = np.concatenate([[0], np.cumsum(df)])
+        self.df = df
+        self.idf = np.log1p(len(ids) / np.maximum(df, 1)).astype(np.float32)
+
+        self.ids = np.asarray(ids, dtype=object)
+        pop = np.asarray(popularity, dtype=np.float32)
+        self.boost = 1 + POPULARITY_WEIGHT * pop / max(float(pop.max(initial=0)), 1e-9)
+        self.category_names, self.category_codes = np.unique(
+            np.asarray(categories, dtype=object).astype(str), return_inverse=True
+        )
+
+        # Single-deletion neighbourhoods for typo lookup
+        self.term_index = {t: i for i, t in enumerate(self.vocab)}
+        self.fuzzy = {}
+        for i, term in enumerate(self.vocab):
+            if len(term) >= FUZZY_MIN_LEN and not term.isdigit():
+                for d in _deletes(term):
+                    self.fuzzy.setdefault(d, []).append(i)
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _matches(self, token, prefix):
+        """{term index: match quality} for one query term."""
+        found = {}
+        if len(token) >= FUZZY_MIN_LEN and not token.isdigit():
+            candidates = set(self.fuzzy.get(token, ()))
+            for d in _deletes(token):
+                if d in self.term_index:
+                    candidates.add(self.term_index[d])
+                candidates.update(self.fuzzy.get(d, ()))
+            for i in candidates:
+                if _one_edit(token, self.vocab[i]):
+                    found[i] = FUZZY
+        if prefix:
+            lo = bisect.bisect_left(self.vocab, token)
+            hi = bisect.bisect_left(self.vocab, token + "\uffff")
+            if hi - lo > MAX_PREFIX_TERMS:
+                top = np.argpartition(-self.df[lo:hi], MAX_PREFIX_TERMS)
+                completions = lo + top[:MAX_PREFIX_TERMS]
+            else:
+                completions = range(lo, hi)
+            for i in completions:
+                found[int(i)] = PREFIX
+        exact = self.term_index.get(token)
+        if exact is not None:
+            found[exact] = EXACT
+        return found
+
+    def search(self, query, category=None, page=1, per_page=PER_PAGE):
+        """(product ids for the page, total matches)."""
+        tokens = tokenize(query)[:MAX_QUERY_TERMS]
+        if not tokens or not len(self):
+            return [], 0
+
+        n = len(self)
+        score = np.zeros(n, dtype=np.float32)
+        coverage = np.zeros(n, dtype=np.int8)
+        for pos, token in enumerate(tokens):
+            matches = self._matches(token, prefix=pos == len(tokens) - 1)
+            if not matches:
+                continue
+            term_score = np.zeros(n, dtype=np.float32)
+            for i, quality in matches.items():
+                lo, hi = self.offsets[i], self.offsets[i + 1]
+                docs = self.docs[lo:hi]
+                value = self.weights[lo:hi] * (quality * self.idf[i])
+                term_score[docs] = np.maximum(term_score[docs], value)
+            score += term_score
+            coverage += term_score > 0
+
+        # Products in the category matching the most query terms (all of
+        # them, when any do)
+        if category and category != "All":
+            code = np.searchsorted(self.category_names, category)
+            if (
+                code == len(self.category_names)
+                or self.category_names[code] != category
+            ):
+                return [], 0
+            coverage[self.category_codes != code] = 0
+        best = coverage.max()
+        if best == 0:
+            return [], 0
+        rows = np.flatnonzero(coverage == best)
+        total = len(rows)
+
+        start = (max(page, 1) - 1) * per_page
+        if start >= total:
+            return [], total
+        key = score[rows] * self.boost[rows]
+        end = min(start + per_page, total)
+        if end < total:
+            # Everything scoring at least the end-th key, ties included, so
+            # the row tie-break below orders pages consistently
+            cutoff = -np.partition(-key, end - 1)[end - 1]
+            keep = key >= cutoff
+            rows, key = rows[keep], key[keep]
+        order = np.lexsort((rows, -key))[start:end]
+        return self.ids[rows[order]].tolist(), total
+
+
+def load_products(csv_path=None):
+    fields = ["product_id", "product_name", "category", "popularity"]
+    if csv_path:
+        import pandas as pd
+
+        return pd.read_csv(csv_path, usecols=fields).to_dict("records")
+    projection = {"_id": 0, **{f: 1 for f in fields}}
+    return products_col.find({}, projection).batch_size(10000)
+
+
+class ProductSearch:
+    """The catalog index, rebuilt when the catalog version moves."""
+
+    def __init__(self):
+        self._state = None  # (index, catalog version it was built from)
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._retry_at = 0.0  # monotonic time before which no build starts
+
+    def _build(self, catalog_version):
+        try:
+            self._state = (ProductIndex(load_products()), catalog_version)
+        except Exception:
+            self._retry_at = time.monotonic() + REBUILD_BACKOFF_SECONDS
+            raise
+        self._retry_at = 0.0
+        return self._state
+
+    def _rebuild(self, catalog_version):
+        try:
+            self._build(catalog_version)
+        except Exception as e:
+            print(f"⚠️ Product index rebuild failed: {e}")
+        finally:
+            self._rebuilding = False
+
+    def _first_build(self, backoff=True):
+        with self._lock:
+            if self._state is None:
+                if backoff and time.monotonic() < self._retry_at:
+                    raise RuntimeError("product index unavailable, build failed")
+                self._build(version("catalog")[0])
+        return self._state
+
+    def warm(self):
+        """
+        Builds the first index ahead of any query (gunicorn when_ready, and
+        post_fork when that failed). False when the build failed.
+        """
+        try:
+            self._first_build(backoff=False)
+        except Exception as e:
+            print(f"⚠️ Product index build failed: {e}")
+            return False
+        return True
+
+    def current(self):
+        """
+        (index, catalog version it was built from). Starts a background
+        rebuild when the catalog has moved on; the old index serves until
+        it is done, so the version may lag version("catalog").
+        """
+        if self._state is None:
+            return self._first_build()
+        catalog_version = version("catalog")[0]
+        state = self._state
+        if catalog_version != state[1] and time.monotonic() >= self._retry_at:
+            with self._lock:
+                if not self._rebuilding and catalog_version != self._state[1]:
+                    self._rebuilding = True
+                    threading.Thread(
+                        target=self._rebuild, args=(catalog_version,), daemon=True
+                    ).start()
+        return state
+
+    def index(self):
+        return self.current()[0]
+
+    def served_version(self):
+        """Catalog version of the index answering queries right now."""
+        return self.current()[1]
+
+    def search(self, query, category=None, page=1, per_page=PER_PAGE):
+        """(product documents for the page in rank order, total matches)."""
+        ids, total = self.index().search(query, category, page, per_page)
+        if not ids:
+            return [], total
+        found = {
+            p["product_id"]: p for p in products_col.find({"product_id": {"$in": ids}})
+        }
+        return [found[i] for i in ids if i in found], total
+
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_product_search():
+    global _search
+    if _search is None:
+        with _search_lock:
+            if _search is None:
+                _search = ProductSearch()
+    return _search
+
+
+# =========================================================
+# CLI (QUERY / LATENCY BENCHMARK)
+# =========================================================
+def _sample_queries(index, n, rng):
+    """Words, prefixes, one-typo words and two-word queries from the catalog."""
+    words = [t for t in index.vocab if len(t) >= FUZZY_MIN_LEN and not t.isdigit()]
+    queries = []
+    for _ in range(n):
+        word = words[rng.integers(len(words))]
+        kind = rng.integers(4)
+        if kind == 1:
+            word = word[: max(2, len(word) // 2)]
+        elif kind == 2:
+            i = rng.integers(len(word))
+            word = word[:i] + word[i + 1 :]
+        elif kind == 3:
+            word = f"{words[rng.integers(len(words))]} {word[:3]}"
+        queries.append(word)
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Product search index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    query_cmd = sub.add_parser("query", help="search the catalog")
+    query_cmd.add_argument("text")
+    query_cmd.add_argument("--category")
+    query_cmd.add_argument("--page", type=int, default=1)
+    bench_cmd = sub.add_parser("bench", help="query latency over sampled queries")
+    bench_cmd.add_argument("--queries", type=int, default=2000)
+    for cmd in (query_cmd, bench_cmd):
+        cmd.add_argument("--csv", help="products CSV instead of Mongo")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = ProductIndex(load_products(args.csv))
+    print(
+        f"✅ Indexed {len(index):,} products ({len(index.vocab):,} terms) in "
+        f"{time.perf_counter() - start:.1f}s"
+    )
+
+    if args.command == "query":
+        start = time.perf_counter()
+        ids, total = index.search(args.text, args.category, args.page)
+        elapsed = (time.perf_counter() - start) * 1000
+        for product_id in ids:
+            print(product_id)
+        print(f"{total:,} matches, page {args.page} in {elapsed:.2f} ms")
+        return
+
+    queries = _sample_queries(index, args.queries, np.random.default_rng(0))
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        index.search(q)
+        timings.append((time.perf_counter() - start) * 1000)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    print(
+        f"✅ {len(queries):,} queries: p50 {p50:.2f} ms, p95 {p95:.2f} ms, "
+        f"p99 {p99:.2f} ms, max {max(timings):.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
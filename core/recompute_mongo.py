@@ -1,71 +1,71 @@
-import os
+import random
 from datetime import datetime
 
-import joblib
-import pandas as pd
-from dotenv import load_dotenv
-from pymongo import MongoClient
-
-load_dotenv()
-
-# =========================================================
-# MONGO CONNECTION
-# =========================================================
-client = MongoClient(os.environ["MONGO_URI"])
-db = client["segment_compass"]
-
-events_col = db["events"]
-lrfms_col = db["lrfms"]
-tiers_col = db["tiers"]
-customers_col = db["customers"]
-transition_col = db["transitions"]
+from core.clustering import assign_cluster
+from core import drift
+from core.customer_context import invalidate
+from core.db import customers_col, lrfms_col, tiers_col, transition_col
+from core import event_buckets
+from core.event_buckets import purchase_summary
+from core.risk_engine import population_max_r, score
+from core.tier_flows import record_transition
+from core.tier_model import load_tier_model
+from core.tier_policy import LIVE
 
 # =========================================================
 # MODEL + CONSTANTS
 # =========================================================
 FEATURES = ["L", "R", "F", "M", "S"]
 
-TIER_ORDER = ["New", "Bronze", "Silver", "Gold", "Platinum"]
-TIER_RANK = {tier: idx for idx, tier in enumerate(TIER_ORDER)}
-
-rf = joblib.load("models/rf_model.pkl")
+# Trigger, confidence and guard rules (core/tier_policy.py)
+POLICY = LIVE
 
 
 # =========================================================
 # RECOMPUTE CUSTOMER (AUTHORITATIVE)
 # =========================================================
-def recompute_customer(customer_id: int):
+def recompute_customer(customer_id: int, context=None):
     """
     Recomputes:
     - LRFMS metrics (ALWAYS)
+    - Risk flag & stability score (ALWAYS)
+    - GMM cluster (ALWAYS, when the cluster pipeline is available)
     - Tier transitions (GUARDED)
+
+    `context` (core.customer_context.CustomerContext) supplies the stored
+    LRFMS and tier instead of fetching them, and receives the updates. It
+    must be freshly loaded (load_context(customer_id, ttl=0)), not taken
+    from the cross-request cache.
     """
 
     # -----------------------------------------------------
-    # FETCH PURCHASE EVENTS
+    # PURCHASE AGGREGATES (RAW EVENTS OR MONTH BUCKETS)
     # -----------------------------------------------------
-    purchases = list(
-        events_col.find(
-            {"customer_id": customer_id, "event_type": "purchase"}, {"_id": 0}
-        ).sort("event_time", 1)
-    )
+    purchases = purchase_summary(customer_id)
+    if (
+        event_buckets.STORAGE == "buckets"
+        and random.random() < event_buckets.VERIFY_RATE
+        and event_buckets.verify(customer_id)
+    ):
+        purchases = purchase_summary(customer_id)  # buckets were repaired
 
     if not purchases:
         return  # no events, nothing to compute
 
-    # -----------------------------------------------------
-    # AGGREGATES
-    # -----------------------------------------------------
-    event_count = len(purchases)
-    monetary_sum = float(sum(e["price"] for e in purchases))
+    event_count = purchases["count"]
+    monetary_sum = purchases["monetary"]
 
-    last_purchase_time = purchases[-1]["event_time"]
+    last_purchase_time = purchases["last_time"]
     recency_days = max(0, (datetime.utcnow() - last_purchase_time).days)
 
     # -----------------------------------------------------
     # FETCH EXISTING LRFMS (OR INIT)
     # -----------------------------------------------------
-    lrfms = lrfms_col.find_one({"customer_id": customer_id}) or {
+    if context is not None:
+        stored_lrfms = context.lrfms
+    else:
+        stored_lrfms = lrfms_col.find_one({"customer_id": customer_id})
+    lrfms = stored_lrfms or {
         "L": 0,
         "S": 0.2,
     }
@@ -83,62 +83,75 @@ def recompute_customer(customer_id: int):
         "updated_at": datetime.utcnow(),
     }
 
+    # Risk, stability and cluster follow live behaviour
+    customer_fields = score(updated_lrfms, population_max_r(lrfms_col))
+    cluster = assign_cluster(updated_lrfms)
+    if cluster is not None:
+        updated_lrfms["cluster"] = cluster
+        customer_fields["cluster"] = cluster
+    customers_col.update_one(
+        {"customer_id": customer_id}, {"$set": customer_fields}
+    )
+
     lrfms_col.update_one(
         {"customer_id": customer_id},
         {"$set": updated_lrfms},
         upsert=True,
     )
+    invalidate(customer_id)
+    if context is not None:
+        context.lrfms = {**(context.lrfms or {}), **updated_lrfms}
+        if context.customer is not None:
+            context.customer.update(customer_fields)
 
     # -----------------------------------------------------
     # 🔐 TIER TRIGGER CONDITIONS (ONLY FOR TIER)
     # -----------------------------------------------------
-    if not (event_count == 1 or event_count % 5 == 0 or monetary_sum >= 10000):
+    # One drift sketch update per recompute: features, plus the confidence
+    # when the model is consulted
+    features = {f: updated_lrfms[f] for f in FEATURES}
+    if not POLICY.triggers(event_count, monetary_sum):
+        drift.observe(features=features)
         return  # metrics updated, tier unchanged
 
     # -----------------------------------------------------
     # CURRENT TIER
     # -----------------------------------------------------
-    tier_doc = tiers_col.find_one({"customer_id": customer_id})
+    if context is not None:
+        tier_doc = context.tier_doc
+    else:
+        tier_doc = tiers_col.find_one({"customer_id": customer_id})
     old_tier = tier_doc["tier"] if tier_doc else "New"
 
     # -----------------------------------------------------
-    # COLD START HANDLING
+    # PREDICTION (COLD START SKIPS THE MODEL)
     # -----------------------------------------------------
-    if old_tier == "New":
-        new_tier = "Bronze"
-        confidence = 1.0
-    else:
+    predicted, confidence = None, 1.0
+    if POLICY.uses_model(old_tier):
+        import pandas as pd
+
+        rf = load_tier_model()
         X = pd.DataFrame([[updated_lrfms[f] for f in FEATURES]], columns=FEATURES)
-        new_tier = rf.predict(X)[0]
+        predicted = rf.predict(X)[0]
         confidence = float(rf.predict_proba(X).max())
-
-        if confidence < 0.7:
-            return  # model unsure → no tier change
+    drift.observe(
+        features=features, confidence=confidence if predicted is not None else None
+    )
 
     # -----------------------------------------------------
-    # TIER GUARDS
+    # TIER GUARDS (CONFIDENCE, ONE-TIER JUMP, DOWNGRADE LOCK)
     # -----------------------------------------------------
-    old_rank = TIER_RANK[old_tier]
-    new_rank = TIER_RANK[new_tier]
-
-    # Max one-tier jump
-    if new_rank - old_rank > 1:
-        new_tier = TIER_ORDER[old_rank + 1]
-        new_rank = old_rank + 1
-
-    # Downgrade protection (30 days)
-    if new_rank < old_rank:
-        last_transition = transition_col.find_one(
-            {"customer_id": customer_id},
-            sort=[("transition_time", -1)],
-        )
-        if last_transition:
-            days_since = (datetime.utcnow() - last_transition["transition_time"]).days
-            if days_since < 30:
-                return
-        new_tier = TIER_ORDER[old_rank - 1]
+    def last_lock():
+        query = {"customer_id": customer_id}
+        if POLICY.lock_tiers is not None:
+            query["new_tier"] = {"$in": list(POLICY.lock_tiers)}
+        last = transition_col.find_one(query, sort=[("transition_time", -1)])
+        return last["transition_time"] if last else None
 
-    if new_tier == old_tier:
+    new_tier = POLICY.decide(
+        old_tier, predicted, confidence, updated_lrfms["R"], last_lock
+    )
+    if new_tier is None:
         return
 
     # -----------------------------------------------------
@@ -146,7 +159,7 @@ def recompute_customer(customer_id: int):
     # -----------------------------------------------------
     tiers_col.update_one(
         {"customer_id": customer_id},
-        {"$set": {"tier": new_tier}},
+        {"$set": {"tier": new_tier, "updated_at": datetime.utcnow()}},
         upsert=True,
     )
 
@@ -155,16 +168,6 @@ def recompute_customer(customer_id: int):
         {
             "$set": {
                 "tier": new_tier,
-                "risk_flag": (
-                    "Low Risk"
-                    if new_tier in ["Gold", "Platinum"]
-                    else "Medium Risk" if new_tier == "Silver" else "High Risk"
-                ),
-                "stability_score": (
-                    0.8
-                    if new_tier in ["Gold", "Platinum"]
-                    else 0.5 if new_tier == "Silver" else 0.3
-                ),
                 "updated_at": datetime.utcnow(),
             }
         },
@@ -172,8 +175,9 @@ def recompute_customer(customer_id: int):
     )
 
     # -----------------------------------------------------
-    # RECORD TRANSITION
+    # RECORD TRANSITION (+ DAILY FLOW / TIER COUNT ROLLUPS)
     # -----------------------------------------------------
+    transition_time = datetime.utcnow()
     transition_col.insert_one(
         {
             "customer_id": customer_id,
@@ -182,6 +186,15 @@ def recompute_customer(customer_id: int):
             "confidence": confidence,
             "event_count": event_count,
             "monetary_sum": monetary_sum,
-            "transition_time": datetime.utcnow(),
+            "transition_time": transition_time,
         }
     )
+    record_transition(
+        old_tier, new_tier, transition_time, had_tier=tier_doc is not None
+    )
+    invalidate(customer_id)
+    if context is not None:
+        tier_fields = {"tier": new_tier, "updated_at": transition_time}
+        context.tier_doc = {**(tier_doc or {"customer_id": customer_id}), **tier_fields}
+        if context.customer is not None:
+            context.customer.update(tier_fields)
@@ -0,0 +1,343 @@
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from core.tier_policy import LIVE, TIER_ORDER, TIER_RANK, parse
+
+# =========================================================
+# POLICY REPLAY OVER EVENT HISTORY
+# =========================================================
+# Streams every purchase in time order, across all customers, and runs one
+# or more TierPolicy variants (core/tier_policy.py) over it side by side.
+# Each policy keeps its own tiers and downgrade locks. Purchase totals and
+# model scores do not depend on the policy, so they are computed once.
+#
+# Events are handled a time slice (day, week or month) at a time. Every
+# purchase that triggers any policy in a slice is scored in one
+# predict_proba batch, then the policies apply their guards in event order.
+# As in recompute_customer, the features at a purchase are L and S from the
+# stored LRFMS, R = 0, F = purchases so far and M = spend so far. The
+# downgrade guard (downgrade_min_recency) instead sees the days since the
+# customer's previous purchase, i.e. how long they were inactive before
+# this one. Everyone starts as "New", so a run is deterministic. The slice
+# size only changes batching and how often the tier distribution is
+# sampled, never the transitions.
+#
+#   python -m core.replay --policy live --policy live,min_confidence=0.8
+#   python -m core.replay --source mongo --slice week --policy live --policy batch
+EVENT_LOG_PATH = "data/processed/event_log.csv"
+LRFMS_PATH = "data/processed/customer_lrfms.csv"
+OUT_DIR = "data/processed/replay"
+
+FEATURES = ["L", "R", "F", "M", "S"]
+SLICES = {"day": "D", "week": "W", "month": "M"}
+BATCH_SIZE = 50000
+DEFAULT_L, DEFAULT_S = 0, 0.2
+
+
+# =========================================================
+# EVENT SOURCES (PURCHASE FRAMES IN TIME ORDER)
+# =========================================================
+COLUMNS = ["customer_id", "event_time", "price"]
+
+
+def csv_events(path=EVENT_LOG_PATH, batch_size=BATCH_SIZE):
+    from core.schema import EVENTS, read_frame
+
+    events = read_frame(path, EVENTS, columns=COLUMNS + ["event_id", "event_type"])
+    events = events[events["event_type"] == "purchase"]
+    events = events[~(events["event_id"].notna() & events.duplicated("event_id"))]
+    events = events[COLUMNS]
+    events = events.sort_values("event_time", kind="stable")
+    for start in range(0, len(events), batch_size):
+        yield events.iloc[start : start + batch_size]
+
+
+def mongo_events(batch_size=BATCH_SIZE):
+    """The event archive (core.event_buckets), then the raw events after it."""
+    from datetime import timedelta
+
+    from core.db import events_col
+    from core.event_buckets import bucket_start, iter_archive
+
+    def frames(docs):
+        while True:
+            rows = [
+                (d["customer_id"], d["event_time"], float(d["price"]))
+                for d in itertools.islice(docs, batch_size)
+            ]
+            if not rows:
+                return
+            yield pd.DataFrame(rows, columns=COLUMNS)
+
+    archived_until = None
+    archived = (e for e in iter_archive() if e.get("event_type") == "purchase")
+    for frame in frames(archived):
+        archived_until = frame["event_time"].max()
+        yield frame
+
+    query = {"event_type": "purchase"}
+    if archived_until is not None:
+        # Days in the archive are complete; a crash between writing a day
+        # and deleting it must not replay its raw copies twice
+        query["event_time"] = {
+            "$gte": bucket_start(archived_until, "day") + timedelta(days=1)
+        }
+    cursor = (
+        events_col.find(query, {"_id": 0, **{c: 1 for c in COLUMNS}})
+        .sort([("event_time", 1), ("_id", 1)])
+        .batch_size(batch_size)
+    )
+    yield from frames(iter(cursor))
+
+
+def csv_lrfms(path=LRFMS_PATH):
+    from core.schema import LRFMS, read_frame
+
+    df = read_frame(path, LRFMS, columns=["Customer ID", "L", "S"])
+    return dict(
+        zip(df["Customer ID"].tolist(), zip(df["L"].tolist(), df["S"].tolist()))
+    )
+
+
+def mongo_lrfms():
+    from core.db import lrfms_col
+
+    return {
+        d["customer_id"]: (d.get("L", DEFAULT_L), d.get("S", DEFAULT_S))
+        for d in lrfms_col.find({}, {"_id": 0, "customer_id": 1, "L": 1, "S": 1})
+    }
+
+
+# =========================================================
+# REPLAY
+# =========================================================
+class Replay:
+    def __init__(self, policies, model, stored_lrfms):
+        self.policies = policies
+        self.model = model
+        self.stored = stored_lrfms  # customer_id -> (L, S)
+        self.totals = {}  # customer_id -> [purchases, spend, last purchase]
+        self.tiers = [{} for _ in policies]  # customer_id -> tier ("New" if absent)
+        self.locks = [{} for _ in policies]  # customer_id -> last lock time
+        self.counts = [np.zeros(len(TIER_ORDER), np.int64) for _ in policies]
+        self.transitions = []
+        self.distribution = []
+        self.events = self.scored = self.slices = 0
+
+    def _score(self, X):
+        """(predicted tier, confidence) for each row, in BATCH_SIZE chunks."""
+        predicted, confidence = [], []
+        for start in range(0, len(X), BATCH_SIZE):
+            frame = pd.DataFrame(X[start : start + BATCH_SIZE], columns=FEATURES)
+            proba = self.model.predict_proba(frame)
+            predicted.extend(self.model.classes_[proba.argmax(axis=1)].tolist())
+            confidence.extend(proba.max(axis=1).tolist())
+        return predicted, confidence
+
+    def step(self, slice_start, events):
+        """Runs one slice of purchases (time-ordered) through every policy."""
+        totals, policies = self.totals, self.policies
+        # (customer_id, when, purchases, spend, days inactive, [policy indexes])
+        triggered = []
+        for customer_id, when, price in zip(
+            events["customer_id"].tolist(),
+            events["event_time"].tolist(),
+            events["price"].tolist(),
+        ):
+            total = totals.get(customer_id)
+            if total is None:
+                total = totals[customer_id] = [0, 0.0, when]
+                for counts in self.counts:
+                    counts[0] += 1  # joins as "New"
+            inactive = (when - total[2]).days
+            total[0] += 1
+            total[1] += price
+            total[2] = when
+            hits = [i for i, p in enumerate(policies) if p.triggers(total[0], total[1])]
+            if hits:
+                triggered.append(
+                    (customer_id, when, total[0], total[1], inactive, hits)
+                )
+
+        if triggered:
+            X = np.empty((len(triggered), len(FEATURES)), dtype=np.float64)
+            for row, (cid, _, n, spend, _, _) in enumerate(triggered):
+                L, S = self.stored.get(cid, (DEFAULT_L, DEFAULT_S))
+                X[row] = (L, 0, n, spend, S)
+            predicted, confidence = self._score(X)
+            self.scored += len(X)
+
+            for row, (cid, when, n, spend, inactive, hits) in enumerate(triggered):
+                for i in hits:
+                    self._decide(
+                        i,
+                        cid,
+                        when,
+                        n,
+                        spend,
+                        inactive,
+                        predicted[row],
+                        confidence[row],
+                    )
+
+        self.events += len(events)
+        self.slices += 1
+        for policy, counts in zip(policies, self.counts):
+            self.distribution.append(
+                {
+                    "policy": policy.name,
+                    "slice": slice_start,
+                    **dict(zip(TIER_ORDER, counts.tolist())),
+                }
+            )
+
+    def _decide(
+        self, i, customer_id, when, purchases, spend, inactive, predicted, confidence
+    ):
+        policy, tiers, locks = self.policies[i], self.tiers[i], self.locks[i]
+        old_tier = tiers.get(customer_id, "New")
+        if not policy.uses_model(old_tier):
+            predicted, confidence = None, 1.0
+        new_tier = policy.decide(
+            old_tier,
+            predicted,
+            confidence,
+            recency=inactive,
+            last_lock=lambda: locks.get(customer_id),
+            now=when,
+        )
+        if new_tier is None:
+            return
+        tiers[customer_id] = new_tier
+        self.counts[i][TIER_RANK[old_tier]] -= 1
+        self.counts[i][TIER_RANK[new_tier]] += 1
+        if policy.starts_lock(new_tier):
+            locks[customer_id] = when
+        self.transitions.append(
+            {
+                "policy": policy.name,
+                "customer_id": customer_id,
+                "old_tier": old_tier,
+                "new_tier": new_tier,
+                "confidence": confidence,
+                "event_count": purchases,
+                "monetary_sum": spend,
+                "transition_time": when,
+            }
+        )
+
+    def summary(self):
+        rows = []
+        for policy, counts in zip(self.policies, self.counts):
+            moves = [t for t in self.transitions if t["policy"] == policy.name]
+            up = sum(TIER_RANK[t["new_tier"]] > TIER_RANK[t["old_tier"]] for t in moves)
+            rows.append(
+                {
+                    "policy": policy.name,
+                    "transitions": len(moves),
+                    "upgrades": up,
+                    "downgrades": len(moves) - up,
+                    **dict(zip(TIER_ORDER, counts.tolist())),
+                }
+            )
+        return pd.DataFrame(rows)
+
+
+def run(policies, frames, model, stored_lrfms, slice_unit="day"):
+    """Replays `frames` (purchase DataFrames in time order) slice by slice."""
+    replay = Replay(policies, model, stored_lrfms)
+    freq = SLICES[slice_unit]
+    pending = None
+    for frame in itertools.chain(frames, [None]):
+        if frame is not None:
+            frame = frame.assign(
+                slice=frame["event_time"].dt.to_period(freq).dt.start_time
+            )
+            frame = frame if pending is None else pd.concat([pending, frame])
+            frame = frame.sort_values("event_time", kind="stable")
+            # The last slice may continue in the next frame
+            done = frame["slice"] < frame["slice"].iloc[-1]
+            pending = frame[~done]
+            frame = frame[done]
+        else:
+            frame, pending = pending, None
+        if frame is None or frame.empty:
+            continue
+        for slice_start, events in frame.groupby("slice", sort=True):
+            replay.step(slice_start, events)
+    return replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay tier policies over history")
+    parser.add_argument(
+        "--policy",
+        action="append",
+        help='preset[,key=value...], e.g. "live,min_confidence=0.8" (repeatable)',
+    )
+    parser.add_argument("--source", choices=("csv", "mongo"), default="csv")
+    parser.add_argument("--events", default=EVENT_LOG_PATH, help="csv source")
+    parser.add_argument("--lrfms", default=LRFMS_PATH, help="csv source")
+    parser.add_argument("--slice", choices=list(SLICES), default="day")
+    parser.add_argument("--model", help="model variant (core.compact_model)")
+    parser.add_argument("--out", default=OUT_DIR)
+    args = parser.parse_args()
+
+    policies = [parse(spec) for spec in args.policy] if args.policy else [LIVE]
+    if len({p.name for p in policies}) != len(policies):
+        parser.error("each --policy must be different")
+
+    if args.model:
+        import joblib
+
+        from core.tier_model import variant_path
+
+        model = joblib.load(variant_path(args.model))
+    else:
+        from core.tier_model import load_tier_model
+
+        model = load_tier_model()
+
+    start = time.perf_counter()
+    if args.source == "mongo":
+        frames, stored = mongo_events(), mongo_lrfms()
+    else:
+        frames, stored = csv_events(args.events), csv_lrfms(args.lrfms)
+    replay = run(policies, frames, model, stored, args.slice)
+    elapsed = time.perf_counter() - start
+
+    os.makedirs(args.out, exist_ok=True)
+    summary = replay.summary()
+    pd.DataFrame(
+        replay.transitions,
+        columns=[
+            "policy",
+            "customer_id",
+            "old_tier",
+            "new_tier",
+            "confidence",
+            "event_count",
+            "monetary_sum",
+            "transition_time",
+        ],
+    ).to_csv(os.path.join(args.out, "transitions.csv"), index=False)
+    pd.DataFrame(replay.distribution).to_csv(
+        os.path.join(args.out, "distribution.csv"), index=False
+    )
+    summary.to_csv(os.path.join(args.out, "summary.csv"), index=False)
+
+    print(
+        f"✅ Replayed {replay.events:,} purchases over {replay.slices:,} "
+        f"{args.slice} slices ({replay.scored:,} scored) for {len(policies)} "
+        f"policies in {elapsed:.1f}s → {args.out}"
+    )
+    print(summary.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+from pymongo import UpdateOne
+
+# =========================================================
+# RULES
+# =========================================================
+# High risk when the customer has been inactive for a quarter or is
+# unsatisfied; stability discounts satisfaction by relative recency.
+RISK_RECENCY_DAYS = 90
+RISK_MIN_SATISFACTION = 0.3
+
+HIGH_RISK = "High Risk"
+LOW_RISK = "Low Risk"
+
+MAX_R_TTL_SECONDS = 300
+BATCH_SIZE = 10000
+
+
+def risk_flags(R, S):
+    """Vectorized risk flag for arrays of recency and satisfaction."""
+    R, S = np.asarray(R, dtype=float), np.asarray(S, dtype=float)
+    risky = (R > RISK_RECENCY_DAYS) | (S < RISK_MIN_SATISFACTION)
+    return np.where(risky, HIGH_RISK, LOW_RISK)
+
+
+def stability_scores(R, S, max_r):
+    """(1 - R / max R) * S; a population without recency spread scores S."""
+    R, S = np.asarray(R, dtype=float), np.asarray(S, dtype=float)
+    relative = np.divide(R, max_r, out=np.zeros_like(R), where=max_r > 0)
+    return (1 - relative) * S
+
+
+def score(lrfms, max_r):
+    """risk_flag/stability_score fields for one LRFMS document."""
+    R, S = float(lrfms.get("R") or 0), float(lrfms.get("S") or 0)
+    max_r = max(max_r, R)
+    return {
+        "risk_flag": str(risk_flags([R], [S])[0]),
+        "stability_score": float(stability_scores([R], [S], max_r)[0]),
+    }
+
+
+# =========================================================
+# POPULATION MAX RECENCY (MONGO)
+# =========================================================
+_max_r = {"value": None, "at": 0.0}
+_max_r_lock = threading.Lock()
+
+
+def _aggregate_max_r(lrfms_col):
+    result = list(
+        lrfms_col.aggregate([{"$group": {"_id": None, "max_r": {"$max": "$R"}}}])
+    )
+    return float(result[0]["max_r"] or 0) if result else 0.0
+
+
+def population_max_r(lrfms_col, ttl=MAX_R_TTL_SECONDS):
+    """Population max R from one aggregation, reused for `ttl` seconds."""
+    with _max_r_lock:
+        if _max_r["value"] is None or time.monotonic() - _max_r["at"] > ttl:
+            _max_r["value"] = _aggregate_max_r(lrfms_col)
+            _max_r["at"] = time.monotonic()
+        return _max_r["value"]
+
+
+# =========================================================
+# BATCH MODE (MONGO)
+# =========================================================
+def _flush(customers_col, docs, max_r):
+    R = np.array([d.get("R") or 0 for d in docs], dtype=float)
+    S = np.array([d.get("S") or 0 for d in docs], dtype=float)
+    flags = risk_flags(R, S)
+    stability = stability_scores(R, S, max_r)
+
+    ops = [
+        UpdateOne(
+            {"customer_id": d["customer_id"]},
+            {"$set": {"risk_flag": str(flag), "stability_score": float(st)}},
+        )
+        for d, flag, st in zip(docs, flags, stability)
+    ]
+    customers_col.bulk_write(ops, ordered=False)
+
+
+def sweep_bulk(lrfms_col, customers_col, batch_size=BATCH_SIZE):
+    """Streams `lrfms`, scores each batch with NumPy, writes with bulk_write."""
+    max_r = _aggregate_max_r(lrfms_col)
+    cursor = lrfms_col.find(
+        {}, {"_id": 0, "customer_id": 1, "R": 1, "S": 1}
+    ).batch_size(batch_size)
+
+    scanned = 0
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            _flush(customers_col, batch, max_r)
+            scanned += len(batch)
+            batch = []
+    if batch:
+        _flush(customers_col, batch, max_r)
+        scanned += len(batch)
+    return scanned, max_r
+
+
+def sweep_merge(lrfms_col, customers_col):
+    """
+    Same rules evaluated server-side and written with $merge; no documents
+    travel through Python. Requires a unique index on customers.customer_id.
+    """
+    max_r = _aggregate_max_r(lrfms_col)
+    customers_col.create_index("customer_id", unique=True)
+
+    relative = {"$cond": [{"$gt": [max_r, 0]}, {"$divide": ["$R", max_r]}, 0]}
+    lrfms_col.aggregate([
+        {"$project": {
+            "_id": 0,
+            "customer_id": 1,
+            "risk_flag": {"$cond": [
+                {"$or": [
+                    {"$gt": ["$R", RISK_RECENCY_DAYS]},
+                    {"$lt": ["$S", RISK_MIN_SATISFACTION]},
+                ]},
+                HIGH_RISK,
+                LOW_RISK,
+            ]},
+            "stability_score": {"$multiply": [{"$subtract": [1, relative]}, "$S"]},
+        }},
+        {"$merge": {
+            "into": customers_col.name,
+            "on": "customer_id",
+            "whenMatched": "merge",
+            "whenNotMatched": "discard",
+        }},
+    ])
+    return max_r
+
+
+if __name__ == "__main__":
+    from core.db import customers_col, lrfms_col
+
+    parser = argparse.ArgumentParser(description="Risk & stability sweep")
+    parser.add_argument("--mode", choices=("bulk", "merge"), default="bulk")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.mode == "merge":
+        max_r = sweep_merge(lrfms_col, customers_col)
+        print(f"✅ Risk & stability merged server-side (max R={max_r:.0f})")
+    else:
+        scanned, max_r = sweep_bulk(lrfms_col, customers_col, args.batch_size)
+        print(f"✅ Risk & stability updated: {scanned} customers (max R={max_r:.0f})")
+    print(f"Elapsed: {time.perf_counter() - start:.1f}s")
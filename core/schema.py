@@ -0,0 +1,143 @@
+import os
+import resource
+
+import pandas as pd
+
+# =========================================================
+# SHARED DTYPES FOR THE BATCH PIPELINE
+# =========================================================
+TIER_ORDER = ["New", "Bronze", "Silver", "Gold", "Platinum"]
+RISK_LEVELS = ["Low Risk", "Medium Risk", "High Risk"]
+
+TIER_DTYPE = pd.CategoricalDtype(TIER_ORDER)
+RISK_DTYPE = pd.CategoricalDtype(RISK_LEVELS)
+
+# Model inputs (M, S) and money stay float64 so persisted values and
+# predictions don't shift; counts, ids and labels are narrowed.
+TRANSACTIONS = {
+    "Customer ID": "int32",
+    "Invoice": "category",
+    "InvoiceDate": "datetime64[ns]",
+    "Quantity": "int32",
+    "Price": "float64",
+    "TotalAmount": "float64",
+}
+
+LRFMS = {
+    "Customer ID": "int32",
+    "L": "int32",
+    "R": "int32",
+    "F": "int32",
+    "M": "float64",
+    "S": "float64",
+}
+
+CLUSTERS = {**LRFMS, "cluster": "int8"}
+
+TIERS = {**CLUSTERS, "score": "float64", "tier": TIER_DTYPE}
+
+INTELLIGENCE = {**TIERS, "risk_flag": RISK_DTYPE, "stability_score": "float32"}
+
+EVENTS = {
+    "event_id": "string",
+    "customer_id": "int32",
+    "event_type": "category",
+    "product_id": "category",
+    "event_time": "datetime64[ns]",
+    "price": "float64",
+    "quantity": "int32",
+    "tier_at_event": TIER_DTYPE,
+}
+
+TRANSITIONS = {
+    "customer_id": "int32",
+    "old_tier": TIER_DTYPE,
+    "new_tier": TIER_DTYPE,
+    "trigger_reason": "string",
+    "transition_time": "datetime64[ns]",
+}
+
+
+def _target_dtype(expected, series):
+    """Integer columns holding NaN fall back to the nullable pandas dtype."""
+    if isinstance(expected, str) and expected.startswith("int") and series.hasnans:
+        return expected.capitalize()
+    return expected
+
+
+def apply_schema(df, schema):
+    """Casts every schema column present in `df` to its compact dtype."""
+    for col, expected in schema.items():
+        if col not in df.columns:
+            continue
+        if expected == "datetime64[ns]":
+            df[col] = pd.to_datetime(df[col])
+        else:
+            df[col] = df[col].astype(_target_dtype(expected, df[col]))
+    return df
+
+
+def validate(df, schema, name="frame"):
+    """Raises ValueError when columns are missing or carry the wrong dtype."""
+    problems = []
+    for col, expected in schema.items():
+        if col not in df.columns:
+            problems.append(f"missing column {col!r}")
+            continue
+        actual = df[col].dtype
+        allowed = {str(pd.api.types.pandas_dtype(expected))}
+        if isinstance(expected, str) and expected.startswith("int"):
+            allowed.add(expected.capitalize())
+        if isinstance(expected, pd.CategoricalDtype):
+            ok = actual == expected
+        else:
+            ok = str(actual) in allowed
+        if not ok:
+            problems.append(f"{col!r} is {actual}, expected {expected}")
+    if problems:
+        raise ValueError(f"{name} schema mismatch: " + "; ".join(problems))
+    return df
+
+
+def read_frame(path, schema, columns=None):
+    """
+    Loads a processed frame with compact dtypes and validates it.
+
+    Prefers a Parquet sibling of `path` when one exists and is not older
+    than the CSV.
+    """
+    wanted = {c: schema[c] for c in (columns or schema)}
+    parquet_path = os.path.splitext(path)[0] + ".parquet"
+
+    if os.path.exists(parquet_path) and (
+        not os.path.exists(path)
+        or os.path.getmtime(parquet_path) >= os.path.getmtime(path)
+    ):
+        df = pd.read_parquet(parquet_path, columns=list(wanted))
+    else:
+        text_cols = {
+            c: "category"
+            for c, t in wanted.items()
+            if t == "category" or isinstance(t, pd.CategoricalDtype)
+        }
+        usecols = list(wanted) if columns else None
+        df = pd.read_csv(path, usecols=usecols, dtype=text_cols)
+
+    apply_schema(df, schema)
+    return validate(df, wanted, name=os.path.basename(path))
+
+
+# =========================================================
+# MEMORY REPORTING
+# =========================================================
+def peak_rss_mb():
+    """Peak resident set size of this process (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report_memory(stage, **frames):
+    """Prints deep memory usage of each frame plus the process peak RSS."""
+    for name, frame in frames.items():
+        mb = frame.memory_usage(deep=True).sum() / 1024**2
+        print(f"[{stage}] {name}: {len(frame):,} rows, {mb:.1f} MB")
+    print(f"[{stage}] peak RSS: {peak_rss_mb():.1f} MB")
@@ -0,0 +1,256 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from core.db import tier_counts_col, tiers_col, transition_col, transition_daily_col
+
+# =========================================================
+# TIER TRANSITION ROLLUPS
+# =========================================================
+# `transition_daily` holds one document per (day, old_tier, new_tier) with
+# the number of moves that day; `tier_counts` holds a single document with
+# the current number of customers per tier. recompute_customer $inc's both
+# when it writes a transition, so flow questions ("Silver→Gold per week",
+# "net downgrades this month") read a few hundred small documents instead
+# of scanning `transitions`.
+#
+# Rebuild from history (transitions collection, or the batch
+# tier_transition_log.csv) with:
+#
+#   python -m core.tier_flows backfill [--source mongo|csv]
+#
+# The backfill replaces the rollups; run it while no recomputes are writing
+# or their increments may be lost.
+TIER_ORDER = ["New", "Bronze", "Silver", "Gold", "Platinum"]
+TIER_RANK = {tier: idx for idx, tier in enumerate(TIER_ORDER)}
+
+TRANSITION_LOG_PATH = "data/processed/tier_transition_log.csv"
+COUNTS_ID = "current"
+
+
+def day_bucket(when):
+    return datetime(when.year, when.month, when.day)
+
+
+def _cell_id(day, old_tier, new_tier):
+    return f"{day:%Y-%m-%d}|{old_tier}|{new_tier}"
+
+
+# =========================================================
+# INCREMENTAL MAINTENANCE (WRITE PATH)
+# =========================================================
+def record_transition(old_tier, new_tier, when, had_tier=True):
+    """
+    Counts one old_tier → new_tier move on `when`'s day and moves the
+    customer between tier counts. `had_tier=False` when the customer had
+    no tiers document yet, so old_tier was never counted.
+    """
+    day = day_bucket(when)
+    transition_daily_col.update_one(
+        {"_id": _cell_id(day, old_tier, new_tier)},
+        {
+            "$inc": {"count": 1},
+            "$setOnInsert": {"day": day, "old_tier": old_tier, "new_tier": new_tier},
+        },
+        upsert=True,
+    )
+    move_customer(old_tier if had_tier else None, new_tier, when)
+
+
+def move_customer(old_tier, new_tier, when=None):
+    """Tier counts after one customer left `old_tier` (None: new) for `new_tier`."""
+    inc = {f"counts.{new_tier}": 1}
+    if old_tier is not None:
+        inc[f"counts.{old_tier}"] = -1
+    tier_counts_col.update_one(
+        {"_id": COUNTS_ID},
+        {"$inc": inc, "$set": {"updated_at": when or datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+# =========================================================
+# QUERIES
+# =========================================================
+def _cells(start=None, end=None):
+    query = {}
+    if start or end:
+        query["day"] = {}
+        if start:
+            query["day"]["$gte"] = day_bucket(start)
+        if end:
+            query["day"]["$lt"] = day_bucket(end)
+    return transition_daily_col.find(query, {"_id": 0})
+
+
+def flow_matrix(start=None, end=None):
+    """
+    Moves between tiers with start <= day < end (either may be None):
+    {"tiers", "matrix" (rows: from, columns: to), "upgrades", "downgrades",
+    "net" (upgrades - downgrades)}.
+    """
+    matrix = [[0] * len(TIER_ORDER) for _ in TIER_ORDER]
+    upgrades = downgrades = 0
+    for cell in _cells(start, end):
+        old, new = TIER_RANK.get(cell["old_tier"]), TIER_RANK.get(cell["new_tier"])
+        if old is None or new is None:
+            continue
+        matrix[old][new] += cell["count"]
+        if new > old:
+            upgrades += cell["count"]
+        elif new < old:
+            downgrades += cell["count"]
+    return {
+        "tiers": TIER_ORDER,
+        "matrix": matrix,
+        "upgrades": upgrades,
+        "downgrades": downgrades,
+        "net": upgrades - downgrades,
+    }
+
+
+def weekly(start=None, end=None, old_tier=None, new_tier=None):
+    """
+    [(week starting Monday, upgrades, downgrades)] in date order, optionally
+    for one old_tier and/or new_tier only.
+    """
+    weeks = {}
+    for cell in _cells(start, end):
+        if old_tier and cell["old_tier"] != old_tier:
+            continue
+        if new_tier and cell["new_tier"] != new_tier:
+            continue
+        old, new = TIER_RANK.get(cell["old_tier"]), TIER_RANK.get(cell["new_tier"])
+        if old is None or new is None or old == new:
+            continue
+        week = cell["day"] - timedelta(days=cell["day"].weekday())
+        ups, downs = weeks.get(week, (0, 0))
+        if new > old:
+            ups += cell["count"]
+        else:
+            downs += cell["count"]
+        weeks[week] = (ups, downs)
+    return [(week, *weeks[week]) for week in sorted(weeks)]
+
+
+def tier_population():
+    """{tier: customers currently in it}, from the maintained counts."""
+    doc = tier_counts_col.find_one({"_id": COUNTS_ID}) or {}
+    counts = doc.get("counts", {})
+    return {tier: int(counts.get(tier, 0)) for tier in TIER_ORDER}
+
+
+# =========================================================
+# BACKFILL
+# =========================================================
+def _history_mongo():
+    """{(day, old, new): count} grouped server-side from `transitions`."""
+    pipeline = [
+        {"$match": {"transition_time": {"$type": "date"}}},
+        {
+            "$group": {
+                "_id": {
+                    "day": {
+                        "$dateToString": {
+                            "format": "%Y-%m-%d",
+                            "date": "$transition_time",
+                        }
+                    },
+                    "old_tier": "$old_tier",
+                    "new_tier": "$new_tier",
+                },
+                "count": {"$sum": 1},
+            }
+        },
+    ]
+    return {
+        (
+            datetime.strptime(row["_id"]["day"], "%Y-%m-%d"),
+            row["_id"]["old_tier"],
+            row["_id"]["new_tier"],
+        ): row["count"]
+        for row in transition_col.aggregate(pipeline, allowDiskUse=True)
+    }
+
+
+def _history_csv(path=TRANSITION_LOG_PATH):
+    from core.schema import TRANSITIONS, read_frame
+
+    df = read_frame(
+        path, TRANSITIONS, columns=["old_tier", "new_tier", "transition_time"]
+    )
+    df["day"] = df["transition_time"].dt.normalize()
+    grouped = df.groupby(["day", "old_tier", "new_tier"], observed=True).size()
+    return {
+        (day.to_pydatetime(), str(old), str(new)): int(count)
+        for (day, old, new), count in grouped.items()
+        if count
+    }
+
+
+def backfill(source="mongo"):
+    """Rebuilds both rollups; returns (cells written, transitions counted)."""
+    from pymongo import ReplaceOne
+
+    history = _history_csv() if source == "csv" else _history_mongo()
+
+    transition_daily_col.create_index("day")
+    cell_ids = [_cell_id(day, old, new) for day, old, new in history]
+    ops = [
+        ReplaceOne(
+            {"_id": cell_id},
+            {"day": day, "old_tier": old, "new_tier": new, "count": count},
+            upsert=True,
+        )
+        for cell_id, ((day, old, new), count) in zip(cell_ids, history.items())
+    ]
+    for start in range(0, len(ops), 1000):
+        transition_daily_col.bulk_write(ops[start : start + 1000], ordered=False)
+    transition_daily_col.delete_many({"_id": {"$nin": cell_ids}})
+
+    counts = {
+        row["_id"]: row["count"]
+        for row in tiers_col.aggregate(
+            [{"$group": {"_id": "$tier", "count": {"$sum": 1}}}]
+        )
+        if row["_id"] in TIER_RANK
+    }
+    tier_counts_col.replace_one(
+        {"_id": COUNTS_ID},
+        {"counts": counts, "updated_at": datetime.utcnow()},
+        upsert=True,
+    )
+    return len(ops), sum(history.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tier transition rollups")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fill = sub.add_parser("backfill", help="rebuild the rollups from history")
+    fill.add_argument("--source", choices=("mongo", "csv"), default="mongo")
+    show = sub.add_parser("flows", help="print the flow matrix")
+    show.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        start = time.perf_counter()
+        cells, moves = backfill(args.source)
+        print(
+            f"✅ {moves:,} transitions rolled up into {cells:,} day cells "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        return
+
+    flows = flow_matrix(start=datetime.utcnow() - timedelta(days=args.days))
+    print("from \\ to".ljust(10) + "".join(t.rjust(10) for t in TIER_ORDER))
+    for tier, row in zip(TIER_ORDER, flows["matrix"]):
+        print(tier.ljust(10) + "".join(str(n).rjust(10) for n in row))
+    print(
+        f"upgrades {flows['upgrades']:,}  downgrades {flows['downgrades']:,}  "
+        f"net {flows['net']:+,}"
+    )
+    print("population", tier_population())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from core import metrics
+
+# =========================================================
+# SERVING MODEL SELECTION
+# =========================================================
+FEATURES = ["L", "R", "F", "M", "S"]
+
+RF_MODEL_PATH = "models/rf_model.pkl"
+VARIANTS_DIR = "models/variants"
+
+# SERVING_MODEL=<variant name> (see core.compact_model) swaps the model used
+# by the app and recompute path; unset or "rf_model" keeps the original.
+SERVING_MODEL_ENV = "SERVING_MODEL"
+
+# MODEL_MMAP=r loads the model's numpy arrays memory-mapped from the
+# (uncompressed) joblib file, so forked workers share those pages through
+# the page cache. Tree ensembles copy their node arrays on unpickle, so for
+# forests the sharing comes from loading once pre-fork (gunicorn preload);
+# array-backed models such as the lookup table are mapped directly.
+MODEL_MMAP_ENV = "MODEL_MMAP"
+
+# How often (seconds) the serving model file is re-stat'ed; a new mtime or
+# size (a retrained or replaced model) is loaded on the next use, so the
+# app, recompute and the SHAP explainer all move to it together.
+CHECK_SECONDS = float(os.environ.get("MODEL_CHECK_SECONDS", 5))
+
+
+def variant_path(name):
+    if name in (None, "", "rf_model"):
+        return RF_MODEL_PATH
+    return os.path.join(VARIANTS_DIR, f"{name}.pkl")
+
+
+def serving_model_path():
+    return variant_path(os.environ.get(SERVING_MODEL_ENV))
+
+
+def file_version(path):
+    """Model file identity: name, mtime and size."""
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}@{stat.st_mtime_ns}:{stat.st_size}"
+
+
+_served = None  # {"model", "version", "checked"}
+_model_lock = threading.Lock()
+
+
+def _changed(state):
+    now = time.monotonic()
+    if now - state["checked"] < CHECK_SECONDS:
+        return False
+    state["checked"] = now
+    try:
+        return file_version(serving_model_path()) != state["version"]
+    except OSError:
+        return False  # mid-replace; keep serving the loaded model
+
+
+def served_model():
+    """
+    (model, version) for the selected serving model. Loaded once per
+    process, and again when the file changes (checked every CHECK_SECONDS).
+    """
+    global _served
+    state = _served
+    if state is None or _changed(state):
+        with _model_lock:
+            if _served is state:
+                import joblib
+
+                path = serving_model_path()
+                version = file_version(path)  # before loading: newer file reloads
+                with metrics.timed("model_load"):
+                    model = joblib.load(
+                        path, mmap_mode=os.environ.get(MODEL_MMAP_ENV) or None
+                    )
+                _served = {
+                    "model": model,
+                    "version": version,
+                    "checked": time.monotonic(),
+                }
+    return _served["model"], _served["version"]
+
+
+def load_tier_model():
+    """The selected serving model (see served_model)."""
+    return served_model()[0]
+
+
+# =========================================================
+# DISTILLED LOOKUP MODEL
+# =========================================================
+class QuantizedLookupClassifier:
+    """
+    Distils a classifier into a dense probability table over quantile
+    bins of each feature.
+
+    Cells seen in training hold the teacher's mean probability for their
+    rows; unseen cells hold the teacher's prediction at the cell centre.
+    Prediction is one searchsorted per feature plus a table lookup.
+    """
+
+    def __init__(self, n_bins=10):
+        self.n_bins = n_bins
+
+    def fit(self, X, teacher):
+        X = np.asarray(X, dtype=np.float64)
+        quantiles = np.linspace(0, 1, self.n_bins + 1)[1:-1]
+
+        self.classes_ = np.asarray(teacher.classes_)
+        self.feature_names_in_ = getattr(teacher, "feature_names_in_", None)
+        self.edges_ = [
+            np.unique(np.quantile(X[:, j], quantiles)) for j in range(X.shape[1])
+        ]
+        self.shape_ = tuple(len(e) + 1 for e in self.edges_)
+
+        # Teacher at every cell centre
+        centres = []
+        for j, edges in enumerate(self.edges_):
+            points = np.concatenate([[X[:, j].min()], edges, [X[:, j].max()]])
+            centres.append((points[:-1] + points[1:]) / 2)
+        grid = np.stack(np.meshgrid(*centres, indexing="ij"), axis=-1)
+        table = self._teacher_proba(teacher, grid.reshape(-1, X.shape[1]))
+
+        # Observed cells: mean teacher probability of their rows
+        cells = self._cells(X)
+        sums = np.zeros_like(table)
+        np.add.at(sums, cells, self._teacher_proba(teacher, X))
+        counts = np.bincount(cells, minlength=len(table))
+        seen = counts > 0
+        table[seen] = sums[seen] / counts[seen, None]
+
+        self.table_ = table.astype(np.float32)
+        return self
+
+    def _teacher_proba(self, teacher, X):
+        if self.feature_names_in_ is not None:
+            import pandas as pd
+
+            X = pd.DataFrame(X, columns=self.feature_names_in_)
+        return teacher.predict_proba(X)
+
+    def _cells(self, X):
+        idx = np.zeros(len(X), dtype=np.int64)
+        for j, edges in enumerate(self.edges_):
+            idx = idx * self.shape_[j] + np.searchsorted(edges, X[:, j], side="right")
+        return idx
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(self.edges_))
+        return self.table_[self._cells(X)]
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
@@ -0,0 +1,153 @@
+from datetime import datetime
+
+# =========================================================
+# TIER GUARD POLICY
+# =========================================================
+# The rules that turn a model prediction into a tier change. One object is
+# shared by the live path (recompute_mongo), the batch path (auto_reassign)
+# and the replay engine (core/replay.py), so a variant can be replayed over
+# history before it is deployed.
+#
+#   trigger     first purchase, every Nth purchase, or spend >= threshold
+#   confidence  predictions below min_confidence change nothing
+#   cold start  "New" customers go to cold_start_tier
+#   jumps       at most max_step_up tiers up / max_step_down tiers down
+#   downgrade   blocked for downgrade_lock_days after a lock-starting
+#               transition (any transition, or one into lock_tiers), and
+#               while recency <= downgrade_min_recency when set
+TIER_ORDER = ["New", "Bronze", "Silver", "Gold", "Platinum"]
+TIER_RANK = {tier: idx for idx, tier in enumerate(TIER_ORDER)}
+
+# name -> (type, default)
+PARAMS = {
+    "trigger_first": (bool, True),
+    "trigger_every": (int, 5),
+    "trigger_spend": (float, 10000.0),
+    "min_confidence": (float, 0.7),
+    "cold_start_tier": (str, "Bronze"),
+    "cold_start_uses_model": (bool, False),
+    "max_step_up": (int, 1),
+    "max_step_down": (int, 1),
+    "downgrade_lock_days": (int, 30),
+    "lock_tiers": (tuple, None),
+    "downgrade_min_recency": (int, None),
+}
+
+
+class TierPolicy:
+    def __init__(self, name="live", **params):
+        unknown = set(params) - set(PARAMS)
+        if unknown:
+            raise ValueError(f"unknown policy parameter(s): {', '.join(unknown)}")
+        self.name = name
+        for key, (_, default) in PARAMS.items():
+            setattr(self, key, params.get(key, default))
+
+    def params(self):
+        return {key: getattr(self, key) for key in PARAMS}
+
+    def replace(self, name, **changes):
+        return TierPolicy(name, **{**self.params(), **changes})
+
+    def __repr__(self):
+        changed = {k: v for k, v in self.params().items() if v != PARAMS[k][1]}
+        return f"TierPolicy({self.name!r}, {changed})"
+
+    # -----------------------------------------------------
+    # RULES
+    # -----------------------------------------------------
+    def triggers(self, event_count, monetary_sum):
+        """Whether this purchase re-evaluates the tier."""
+        return (
+            (self.trigger_first and event_count == 1)
+            or (self.trigger_every > 0 and event_count % self.trigger_every == 0)
+            or monetary_sum >= self.trigger_spend
+        )
+
+    def uses_model(self, old_tier):
+        return old_tier != "New" or self.cold_start_uses_model
+
+    def starts_lock(self, new_tier):
+        """Whether a transition into `new_tier` starts the downgrade lock."""
+        return self.lock_tiers is None or new_tier in self.lock_tiers
+
+    def decide(
+        self, old_tier, predicted, confidence, recency=0, last_lock=None, now=None
+    ):
+        """
+        The tier to move to, or None to leave the customer where they are.
+        `predicted`/`confidence` may be None when uses_model(old_tier) is
+        False. `last_lock` is called only for downgrades and returns the
+        time of the customer's last lock-starting transition (or None).
+        """
+        if self.uses_model(old_tier) and confidence < self.min_confidence:
+            return None
+        if old_tier == "New":
+            return self.cold_start_tier
+
+        old_rank = TIER_RANK[old_tier]
+        new_rank = TIER_RANK.get(predicted, old_rank)
+        new_rank = min(new_rank, old_rank + self.max_step_up)
+
+        if new_rank < old_rank:
+            if (
+                self.downgrade_min_recency is not None
+                and recency <= self.downgrade_min_recency
+            ):
+                return None
+            locked_at = last_lock() if last_lock else None
+            now = now or datetime.utcnow()
+            if (
+                locked_at is not None
+                and (now - locked_at).days < self.downgrade_lock_days
+            ):
+                return None
+            new_rank = max(new_rank, old_rank - self.max_step_down)
+
+        new_tier = TIER_ORDER[new_rank]
+        return None if new_tier == old_tier else new_tier
+
+
+# recompute_mongo: cold start skips the model; any transition locks
+# downgrades for 30 days.
+LIVE = TierPolicy("live")
+
+# auto_reassign: cold start still needs a confident prediction; downgrades
+# need more than 60 days of inactivity and more than 30 days since the last
+# upgrade into Silver or above.
+BATCH = TierPolicy(
+    "batch",
+    cold_start_uses_model=True,
+    lock_tiers=("Silver", "Gold", "Platinum"),
+    downgrade_lock_days=31,
+    downgrade_min_recency=60,
+)
+
+PRESETS = {"live": LIVE, "batch": BATCH}
+
+
+def _cast(kind, text):
+    if kind is bool:
+        return text.lower() in ("1", "true", "yes", "on")
+    if kind is tuple:
+        return tuple(t for t in text.split("|") if t) or None
+    if text.lower() == "none":
+        return None
+    return kind(text)
+
+
+def parse(spec):
+    """
+    A policy from "preset[,key=value...]", e.g. "live,min_confidence=0.8"
+    or "batch,lock_tiers=Gold|Platinum". The spec is the policy's name.
+    """
+    base, *pairs = [part.strip() for part in spec.split(",")]
+    if base not in PRESETS:
+        raise ValueError(f"unknown policy preset {base!r} (use {', '.join(PRESETS)})")
+    changes = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not sep or key not in PARAMS:
+            raise ValueError(f"bad policy setting {pair!r}")
+        changes[key] = _cast(PARAMS[key][0], value)
+    return PRESETS[base].replace(spec, **changes)
@@ -1,37 +1,112 @@
+import glob
+import hashlib
+import os
+
 import pandas as pd
 
 # -----------------------------
-# Load Excel dataset
+# Paths
 # -----------------------------
-df = pd.read_excel(
-    "raw/online_retail.xlsx",
-    engine="openpyxl"
-)
+RAW_PATH = "raw/online_retail.xlsx"
+CACHE_DIR = "processed/cache"
+OUTPUT_CSV = "processed/transactions_clean.csv"
+OUTPUT_PARQUET = "processed/transactions_clean.parquet"
+
+# Only the columns the pipeline actually uses are pulled from the workbook.
+RAW_COLUMNS = ["Invoice", "Quantity", "InvoiceDate", "Price", "Customer ID"]
+
+# Bump when RAW_COLUMNS or the cached dtypes change so old caches are ignored.
+CACHE_VERSION = 1
+
+
+def fingerprint(path, chunk_size=1 << 20):
+    """Content hash of the source workbook (plus cache layout version)."""
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def compact(df):
+    """Cast raw columns to compact dtypes before any cleaning happens."""
+    return pd.DataFrame(
+        {
+            "Invoice": df["Invoice"].astype(str).astype("category"),
+            "Quantity": pd.to_numeric(df["Quantity"], downcast="integer"),
+            "InvoiceDate": pd.to_datetime(df["InvoiceDate"]),
+            "Price": df["Price"].astype("float64"),
+            "Customer ID": df["Customer ID"].astype("Int32"),
+        }
+    )
+
+
+def load_raw(path):
+    """
+    Returns the raw workbook as a compact DataFrame.
+
+    The Excel file is parsed only once per content fingerprint; afterwards
+    the Parquet copy under CACHE_DIR is read instead.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(CACHE_DIR, f"{stem}-{fingerprint(path)}.parquet")
+
+    if os.path.exists(cache_path):
+        print(f"⚡ Using cached workbook: {cache_path}")
+        return pd.read_parquet(cache_path)
+
+    print("Converting workbook to Parquet (runs once per source version)...")
+    df = compact(
+        pd.read_excel(
+            path,
+            engine="openpyxl",
+            usecols=RAW_COLUMNS,
+            dtype={"Invoice": str},
+        )
+    )
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+
+    # Drop caches of previous versions of the same workbook
+    for stale in glob.glob(os.path.join(CACHE_DIR, f"{stem}-*.parquet")):
+        if stale != cache_path:
+            os.remove(stale)
+
+    return df
+
+
+# -----------------------------
+# Load dataset (cached)
+# -----------------------------
+df = load_raw(RAW_PATH)
 
 print("Initial shape:", df.shape)
 
 # -----------------------------
 # Drop rows without CustomerID
 # -----------------------------
-df = df.dropna(subset=["Customer ID"])
+df = df[df["Customer ID"].notna()]
 
 # -----------------------------
 # Remove cancelled transactions
 # -----------------------------
-df = df[~df["Invoice"].astype(str).str.startswith("C")]
+# Test the prefix once per distinct invoice instead of once per row
+cancelled = df["Invoice"].cat.categories.str.startswith("C")
+df = df[~cancelled[df["Invoice"].cat.codes]]
 
 # -----------------------------
-# Convert data types
+# Remove invalid values
 # -----------------------------
-df["InvoiceDate"] = pd.to_datetime(df["InvoiceDate"])
-df["Customer ID"] = df["Customer ID"].astype(int)
-df["Quantity"] = df["Quantity"].astype(int)
-df["Price"] = df["Price"].astype(float)
+df = df[(df["Quantity"] > 0) & (df["Price"] > 0)]
 
 # -----------------------------
-# Remove invalid values
+# Convert data types
 # -----------------------------
-df = df[(df["Quantity"] > 0) & (df["Price"] > 0)]
+df = df.astype({"Customer ID": "int32", "Quantity": "int32"})
+df["Invoice"] = df["Invoice"].cat.remove_unused_categories()
 
 # -----------------------------
 # Compute Monetary value
@@ -55,10 +130,8 @@ df = df[
 # -----------------------------
 # Save cleaned dataset
 # -----------------------------
-df.to_csv(
-    "processed/transactions_clean.csv",
-    index=False
-)
+df.to_csv(OUTPUT_CSV, index=False)
+df.to_parquet(OUTPUT_PARQUET, index=False)
 
 print("✅ Phase 1 completed successfully.")
 print("Final shape:", df.shape)
@@ -1,6 +1,10 @@
+import argparse
+import hashlib
+import json
 import os
+from datetime import datetime
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import DeleteOne, MongoClient, ReplaceOne
 from dotenv import load_dotenv
 
 # =========================================================
@@ -15,6 +19,13 @@ MONGO_URI = os.environ["MONGO_URI"]
 DB_NAME = "segment_compass"
 COLLECTION_NAME = "products"
 EXCEL_PATH = "products.xlsx"
+HASH_FIELD = "row_hash"
+
+parser = argparse.ArgumentParser(description="Load products.xlsx into Mongo")
+parser.add_argument("--replace", action="store_true",
+                    help="delete every product and insert the catalog again")
+parser.add_argument("--batch-size", type=int, default=1000)
+args = parser.parse_args()
 
 # =========================================================
 # CONNECT TO MONGO
@@ -61,17 +72,112 @@ df["popularity"] = pd.to_numeric(df["popularity"], errors="coerce").fillna(0.0)
 # remove broken rows
 df = df.dropna(subset=["price"])
 
+# one row per product (last occurrence wins)
+df = df.drop_duplicates(subset=["product_id"], keep="last")
+
 records = df.to_dict(orient="records")
 
+
 # =========================================================
-# OPTIONAL: CLEAR EXISTING PRODUCTS
+# SYNC HELPERS
 # =========================================================
-print("Deleting existing products...")
-products_col.delete_many({})
+def bump_catalog_version():
+    """Invalidates the app's cached shop fragments (core/fragments.py)."""
+    db["versions"].update_one(
+        {"_id": "catalog"},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+def row_hash(record):
+    """Stable content hash of one product row."""
+    payload = json.dumps(record, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def write_batches(ops):
+    for start in range(0, len(ops), args.batch_size):
+        products_col.bulk_write(ops[start:start + args.batch_size], ordered=False)
+
 
 # =========================================================
-# INSERT
+# FULL REPLACE (LEGACY MODE)
+# =========================================================
+if args.replace:
+    print("Deleting existing products...")
+    products_col.delete_many({})
+    for record in records:
+        record[HASH_FIELD] = row_hash(record)
+    result = products_col.insert_many(records)
+    bump_catalog_version()
+    print(f"Inserted {len(result.inserted_ids)} products successfully.")
+    exit()
+
 # =========================================================
-result = products_col.insert_many(records)
+# INCREMENTAL SYNC (DEFAULT)
+# =========================================================
+def drop_duplicate_products():
+    """
+    Keeps the newest document (highest _id) per product_id. Catalogs loaded
+    by the old insert_many-only script can repeat ids, which would make the
+    unique index below fail.
+    """
+    extra, collided = [], []
+    pipeline = [
+        {"$group": {"_id": "$product_id", "ids": {"$push": "$_id"},
+                    "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ]
+    for row in products_col.aggregate(pipeline, allowDiskUse=True):
+        collided.append(row["_id"])
+        extra.extend(sorted(row["ids"], reverse=True)[1:])
+    for start in range(0, len(extra), args.batch_size):
+        products_col.delete_many({"_id": {"$in": extra[start:start + args.batch_size]}})
+    return collided, len(extra)
+
+
+collided, removed = drop_duplicate_products()
+if removed:
+    shown = ", ".join(map(str, collided[:10])) + (" ..." if len(collided) > 10 else "")
+    print(f"⚠️ Removed {removed} duplicate product docs ({shown}), kept the newest")
+
+products_col.create_index("product_id", unique=True)
+
+stored = {
+    doc["product_id"]: doc.get(HASH_FIELD)
+    for doc in products_col.find({}, {"_id": 0, "product_id": 1, HASH_FIELD: 1})
+}
+
+ops = []
+inserted = updated = unchanged = 0
+for record in records:
+    pid = record["product_id"]
+    digest = row_hash(record)
+    if pid not in stored:
+        inserted += 1
+    elif stored.pop(pid) == digest:
+        unchanged += 1
+        continue
+    else:
+        updated += 1
+    ops.append(
+        ReplaceOne(
+            {"product_id": pid},
+            {**record, HASH_FIELD: digest},
+            upsert=True,
+        )
+    )
+
+# Whatever is left in `stored` is no longer in the catalog
+ops.extend(DeleteOne({"product_id": pid}) for pid in stored)
+deleted = len(stored)
+
+write_batches(ops)
+if ops:
+    bump_catalog_version()
 
-print(f"Inserted {len(result.inserted_ids)} products successfully.")
+print(
+    f"✅ Catalog synced: {inserted} inserted, {updated} updated, "
+    f"{deleted} deleted, {unchanged} unchanged"
+)
@@ -0,0 +1,62 @@
+import os
+import time
+
+# =========================================================
+# PREFORK SERVING
+# =========================================================
+# gunicorn -c gunicorn.conf.py app:app
+#
+# The app (and with it the tier model) is imported once in the master and
+# shared copy-on-write by the forked workers. Mongo clients are created per
+# worker on first use (core.db); pool sizes come from MONGO_MAX_POOL_SIZE
+# and friends. The product search index is built in the master too, so no
+# shop search waits for it; a worker whose master build failed rebuilds in
+# the background. Each worker logs its cold start and memory once it is
+# ready.
+_master_start = time.monotonic()
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+preload_app = True
+
+# Build the SHAP explainer before forking as well (PRELOAD_EXPLAINER=1);
+# the explainer is then built once instead of once per worker.
+PRELOAD_EXPLAINER = os.environ.get("PRELOAD_EXPLAINER") == "1"
+
+
+def when_ready(server):
+    from core import metrics
+    from core.product_search import get_product_search
+    from core.tier_model import load_tier_model
+
+    load_tier_model()
+    with metrics.timed("product_index_build"):
+        get_product_search().warm()
+    if PRELOAD_EXPLAINER:
+        from core.explain_service import get_explainer
+
+        with metrics.timed("explainer_build"):
+            get_explainer()
+    metrics.record("master_ready", time.monotonic() - _master_start)
+    server.log.info(metrics.summary("master"))
+
+
+def post_fork(server, worker):
+    import threading
+
+    from core import metrics
+    from core.product_search import get_product_search
+
+    worker.forked_at = time.monotonic()
+    metrics.reset_clock()
+    # No-op unless the master's build failed
+    threading.Thread(target=get_product_search().warm, daemon=True).start()
+
+
+def post_worker_init(worker):
+    from core import metrics
+
+    metrics.record("worker_boot", time.monotonic() - worker.forked_at)
+    worker.log.info(metrics.summary("worker"))
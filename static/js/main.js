@@ -5,3 +5,17 @@ document.addEventListener("DOMContentLoaded", function () {
     alerts.forEach((el) => (el.style.display = "none"));
   }, 4000);
 });
+
+// Tag each add-to-cart click with a fresh id. A retried or resubmitted
+// request reuses it, so the server records the purchase only once.
+document.addEventListener("click", function (e) {
+  let link = e.target.closest('a.btn-atc[href^="/add_to_cart/"]');
+  if (!link) return;
+  let eid = window.crypto && crypto.randomUUID
+    ? crypto.randomUUID()
+    : Date.now().toString(36) + Math.random().toString(36).slice(2);
+  let url = new URL(link.href, window.location.origin);
+  url.searchParams.set("eid", eid);
+  e.preventDefault();
+  window.location.assign(url.toString());
+});